@@ -0,0 +1,182 @@
+""" Saves the tape in the background a few seconds after it changes.
+
+    The state of the model is captured in the GUI thread but only as a list of references to note objects
+    and ids of their neighbours, which is cheap. Converting the notes to JSON and writing the file is done
+    in a worker thread so editing does not stall while the tape is being saved. """
+
+import time
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, QCoreApplication, QEvent, pyqtSignal
+
+from .note_model_helpers import snapshot_notes, dump_snapshot
+from .note_file_writer   import serialize_notes, write_atomically
+from .index_store        import content_key
+
+class SaveTask(QRunnable):
+    def __init__(self, autosaver, generation, file_name, snapshot, journal_position):
+        super().__init__()
+
+        self._autosaver        = autosaver
+        self._generation       = generation
+        self._file_name        = file_name
+        self._snapshot         = snapshot
+        self._journal_position = journal_position
+
+    def run(self):
+        start_time = time.perf_counter()
+
+        try:
+            content = serialize_notes(dump_snapshot(self._snapshot))
+            write_atomically(self._file_name, content)
+        except OSError as error:
+            result = (False, str(error))
+        else:
+            result = (True, content_key(content))
+
+        try:
+            self._autosaver.task_finished.emit(self._generation, self._file_name, result, self._journal_position, time.perf_counter() - start_time)
+        except RuntimeError:
+            # The autosaver has been destroyed while we were working
+            pass
+
+class Autosaver(QObject):
+    # Milliseconds between the first change and the save. Changes made in the meantime are saved together.
+    DELAY = 3000
+
+    # NOTE: Emitted from the worker thread. Qt delivers it to the thread the autosaver lives in.
+    task_finished = pyqtSignal(int, str, object, object, float)
+
+    # Emitted with the file name, the content key of the new content and the time the save took (in seconds)
+    saved = pyqtSignal(str, str, float)
+
+    # Emitted with the file name and a description of the error
+    save_failed = pyqtSignal(str, str)
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+
+        # NOTE: Saves of the same file must not overlap
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(1)
+        self._generation  = 0
+
+        self._model     = None
+        self._file_name = None
+        self._journal   = None
+
+        self._enabled      = True
+        self._saving       = False
+        self._pending      = False
+        self._last_latency = None
+
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(self.DELAY)
+
+        self._save_timer.timeout.connect(self.save_now)
+        self.task_finished.connect(self._task_finished_handler)
+
+    def set_target(self, model, file_name, journal = None):
+        """ Makes the autosaver save changes made to the model in the specified file. If the file has a journal,
+            it's restarted after each save so that it contains only changes that are not in the file yet.
+            None disables autosaving. Saves of the previous target still in progress are not reported. """
+
+        if self._model != None:
+            self._model.rowsInserted.disconnect(self._model_changed_handler)
+            self._model.rowsRemoved.disconnect(self._model_changed_handler)
+            self._model.dataChanged.disconnect(self._model_changed_handler)
+
+        self._save_timer.stop()
+        self._generation += 1
+        self._saving      = False
+        self._pending     = False
+
+        self._model     = model
+        self._file_name = file_name
+        self._journal   = journal
+
+        if model != None:
+            model.rowsInserted.connect(self._model_changed_handler)
+            model.rowsRemoved.connect(self._model_changed_handler)
+            model.dataChanged.connect(self._model_changed_handler)
+
+    def file_name(self):
+        return self._file_name
+
+    def set_enabled(self, enabled):
+        """ Disabling the autosaver stops it from saving changes on its own. save_now() still works. """
+
+        self._enabled = enabled
+        if not enabled:
+            self._save_timer.stop()
+
+    def enabled(self):
+        return self._enabled
+
+    def schedule(self):
+        """ Makes the autosaver save the model after DELAY milliseconds unless a save is already scheduled """
+
+        # NOTE: Restarting the timer on every change would postpone saving for as long as the user keeps typing
+        if self._enabled and self._model != None and not self._save_timer.isActive():
+            self._save_timer.start()
+
+    def save_now(self):
+        """ Takes a snapshot of the model and starts writing it. If a save is already in progress,
+            another one is started as soon as it finishes. """
+
+        self._save_timer.stop()
+        if self._model == None:
+            return
+
+        if self._saving:
+            self._pending = True
+            return
+
+        snapshot         = snapshot_notes(self._model)
+        journal_position = self._journal.entry_count() if self._journal != None else None
+
+        self._saving = True
+        self._thread_pool.start(SaveTask(self, self._generation, self._file_name, snapshot, journal_position))
+
+    def is_saving(self):
+        return self._saving
+
+    def is_scheduled(self):
+        return self._save_timer.isActive() or self._pending
+
+    def last_latency(self):
+        """ Returns the time (in seconds) it took to complete the most recent save or None if nothing has been saved yet """
+
+        return self._last_latency
+
+    def wait_for_done(self):
+        """ Blocks until the save in progress finishes and handles its result """
+
+        self._thread_pool.waitForDone()
+
+        # NOTE: The result is delivered through a queued call to a slot proxy rather than to the autosaver itself
+        QCoreApplication.sendPostedEvents(None, QEvent.MetaCall)
+
+    def _model_changed_handler(self, *args):
+        self.schedule()
+
+    def _task_finished_handler(self, generation, file_name, result, journal_position, seconds):
+        if generation != self._generation:
+            return
+
+        self._saving       = False
+        self._last_latency = seconds
+
+        (success, value) = result
+        if success:
+            # NOTE: Changes made after the snapshot was taken are not in the file yet and stay in the journal
+            if self._journal != None:
+                self._journal.restart(value, journal_position)
+
+            self.saved.emit(file_name, value, seconds)
+        else:
+            self.save_failed.emit(file_name, value)
+
+        if self._pending:
+            self._pending = False
+            self.save_now()
@@ -0,0 +1,61 @@
+""" Computes index terms of notes in a background thread """
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from .note_index import NoteIndex
+
+class IndexTask(QRunnable):
+    # Number of notes processed between checks for cancellation. Terms of each chunk are delivered separately.
+    CHUNK_SIZE = 1000
+
+    def __init__(self, indexer, generation, notes):
+        super().__init__()
+
+        self._indexer    = indexer
+        self._generation = generation
+        self._notes      = notes
+
+    def run(self):
+        for chunk_start in range(0, len(self._notes), self.CHUNK_SIZE):
+            if self._indexer.is_stale(self._generation):
+                return
+
+            chunk   = self._notes[chunk_start : chunk_start + self.CHUNK_SIZE]
+            results = [(note, NoteIndex.note_terms(note)) for note in chunk]
+
+            try:
+                self._indexer.chunk_ready.emit(self._generation, results)
+            except RuntimeError:
+                # The indexer has been destroyed while we were working
+                return
+
+class BackgroundIndexer(QObject):
+    # NOTE: Emitted from worker threads. Qt delivers it to the thread the indexer lives in.
+    chunk_ready = pyqtSignal(int, object)
+
+    # Emitted with a list of (note, terms) pairs for each chunk of notes from the most recent start() call
+    terms_ready = pyqtSignal(object)
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+
+        self._thread_pool = QThreadPool.globalInstance()
+        self._generation  = 0
+
+        self.chunk_ready.connect(self._chunk_ready_handler)
+
+    def start(self, notes):
+        """ Starts computing terms of the notes. Results of any previous run are discarded. """
+
+        self.cancel()
+        self._thread_pool.start(IndexTask(self, self._generation, list(notes)))
+
+    def is_stale(self, generation):
+        return generation != self._generation
+
+    def cancel(self):
+        self._generation += 1
+
+    def _chunk_ready_handler(self, generation, results):
+        if not self.is_stale(generation):
+            self.terms_ready.emit(results)
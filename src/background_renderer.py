@@ -0,0 +1,83 @@
+""" Renders notes into images in a background thread so that they're ready before they're scrolled into view """
+
+from PyQt5.QtGui  import QImage, QPainter
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QRect, QPoint, pyqtSignal
+
+from .note_renderer import NoteRenderer
+
+class RenderTask(QRunnable):
+    def __init__(self, background_renderer, generation, renderer, requests):
+        super().__init__()
+
+        self._background_renderer = background_renderer
+        self._generation          = generation
+        self._renderer            = renderer
+        self._requests            = requests
+
+    def run(self):
+        for (note, size, variant, prepared) in self._requests:
+            if self._background_renderer.is_stale(self._generation):
+                return
+
+            # NOTE: QPixmap can only be used in the GUI thread. Painting on a QImage is safe in any thread.
+            image   = QImage(size, QImage.Format_ARGB32_Premultiplied)
+            painter = QPainter(image)
+            self._renderer.paint_prepared(painter, prepared, QRect(QPoint(0, 0), size))
+            painter.end()
+
+            try:
+                self._background_renderer.image_ready.emit(self._generation, note, size, variant, image)
+            except RuntimeError:
+                # The renderer has been destroyed while we were working
+                return
+
+class BackgroundRenderer(QObject):
+    # NOTE: Emitted from the worker thread. Qt delivers it to the thread the renderer lives in.
+    image_ready = pyqtSignal(int, object, object, object, object)
+
+    # Emitted with the note, size, variant and QImage for each note from the most recent start() call
+    rendered = pyqtSignal(object, object, object, object)
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+
+        # NOTE: Fonts and font metrics must not be used by two threads at the same time. The worker gets
+        # its own NoteRenderer and there's never more than one worker.
+        self._renderer    = NoteRenderer()
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(1)
+        self._generation  = 0
+
+        self.image_ready.connect(self._image_ready_handler)
+
+    def start(self, requests):
+        """ Starts rendering notes from a list of (note, size, variant) tuples. The variant is not used for
+            rendering, only passed back along with the image. Results of any previous run that have not been
+            delivered yet are discarded. Must be called in the GUI thread. """
+
+        self.cancel()
+
+        # NOTE: The parts of painting that use the style are done here. The worker only paints on an image.
+        prepared_requests = [
+            (note, size, variant, self._renderer.prepare(note, QRect(QPoint(0, 0), size)))
+            for (note, size, variant) in requests
+        ]
+
+        if len(prepared_requests) > 0:
+            self._thread_pool.start(RenderTask(self, self._generation, self._renderer, prepared_requests))
+
+    def is_stale(self, generation):
+        return generation != self._generation
+
+    def cancel(self):
+        """ Discards the results of the current run, including those already sent but not delivered yet.
+            Must be called whenever the notes being rendered would look different if rendered again. """
+
+        self._generation += 1
+
+    def wait_for_done(self):
+        self._thread_pool.waitForDone()
+
+    def _image_ready_handler(self, generation, note, size, variant, image):
+        if not self.is_stale(generation):
+            self.rendered.emit(note, size, variant, image)
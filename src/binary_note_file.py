@@ -0,0 +1,294 @@
+""" Stores the tape in a compact binary file that can be opened without reading it as a whole.
+
+    The file consists of:
+
+    - a header (see HEADER),
+    - a table of fixed-width note records (see RECORD), in the order produced by note_links(),
+    - a tag dictionary: the position of each distinct tag in the string heap (see TAG),
+    - a list of tag ids; each note refers to a contiguous range of it (see TAG_ID),
+    - a string heap containing UTF-8 encoded bodies and tags.
+
+    Opening the file maps it into memory and decodes only the record table and the tag dictionary.
+    The body of a note is decoded whenever it's needed, e.g. when the note is displayed or searched,
+    and is not kept afterwards. """
+
+import codecs
+import hashlib
+import mmap
+import os
+import struct
+
+from .note        import Note
+from .index_store import EPOCH, MICROSECOND, timestamp_key
+
+FORMAT_VERSION = 1
+FILE_SUFFIX    = '.tape'
+MAGIC          = b'NTAP'
+
+# Magic bytes, format version, content key (SHA-1 of everything after the header), number of notes,
+# number of distinct tags and number of tag ids
+HEADER = struct.Struct('<4sI20sQQQ')
+
+# Id, parent id, previous sibling id, creation and modification time (in microseconds since EPOCH),
+# offset and length of the body in the heap, index of the first tag id of the note and the number of tags
+RECORD = struct.Struct('<qqqqqQQII')
+
+# Offset and length of the tag in the heap
+TAG    = struct.Struct('<QI')
+TAG_ID = struct.Struct('<I')
+
+# Stored in place of parent_id or prev_sibling_id equal to None
+NO_ID = -1
+
+class InvalidFormat(Exception):            pass
+class UnsupportedFormatVersion(Exception): pass
+
+def is_binary_note_file(file_name):
+    return file_name.endswith(FILE_SUFFIX)
+
+def encode_snapshot(snapshot):
+    """ Converts a snapshot from snapshot_notes() into the content of a binary note file """
+
+    heap_chunks = []
+    heap_size   = 0
+
+    def add_to_heap(data):
+        nonlocal heap_size
+
+        offset     = heap_size
+        heap_size += len(data)
+        heap_chunks.append(data)
+
+        return (offset, len(data))
+
+    records     = []
+    tag_entries = []
+    tag_ids     = {}
+    note_tags   = []
+    for (note, parent_id, prev_sibling_id) in snapshot:
+        assert note.id != None
+
+        # NOTE: There's no need to decode a body that has not been touched since it was read from a binary file
+        if isinstance(note, MappedNote) and not note.is_materialized():
+            encoded_body = note.encoded_body()
+        else:
+            encoded_body = note.body.encode('utf-8')
+
+        (body_offset, body_length) = add_to_heap(encoded_body)
+
+        first_tag = len(note_tags)
+        for tag in note.tags:
+            if not tag in tag_ids:
+                tag_ids[tag] = len(tag_entries)
+                tag_entries.append(TAG.pack(*add_to_heap(tag.encode('utf-8'))))
+
+            note_tags.append(TAG_ID.pack(tag_ids[tag]))
+
+        records.append(RECORD.pack(
+            note.id,
+            parent_id       if parent_id       != None else NO_ID,
+            prev_sibling_id if prev_sibling_id != None else NO_ID,
+            timestamp_key(note.created_at),
+            timestamp_key(note.modified_at),
+            body_offset,
+            body_length,
+            first_tag,
+            len(note.tags)
+        ))
+
+    payload = b''.join(records + tag_entries + note_tags + heap_chunks)
+    header  = HEADER.pack(MAGIC, FORMAT_VERSION, hashlib.sha1(payload).digest(), len(records), len(tag_entries), len(note_tags))
+
+    return header + payload
+
+def encode_notes(raw_notes):
+    """ Converts dicts in the format produced by dump_notes() into the content of a binary note file.
+        BinaryNoteFile.raw_notes() returns identical dicts. """
+
+    return encode_snapshot(
+        (Note.from_dict(note_dict), note_dict['parent_id'], note_dict['prev_sibling_id'])
+        for note_dict in raw_notes
+    )
+
+def header_key(content):
+    """ Returns the key BinaryNoteFile.key() would return for a file with the specified content """
+
+    return HEADER.unpack_from(content)[2].hex()
+
+def decode_timestamp(microseconds):
+    """ Reverses index_store.timestamp_key() """
+
+    return EPOCH + microseconds * MICROSECOND
+
+class MappedNote(Note):
+    """ A note whose body stays in the mapped file. It's decoded on each access rather than kept in memory
+        so that searching or indexing the whole tape once does not leave a decoded copy of it behind. """
+
+    def __init__(self, note_file, body_offset, body_length, tags, created_at, modified_at, id):
+        # NOTE: Note.__init__() is not called because it checks the type of the body, which would decode it
+        self.tags        = tags
+        self.created_at  = created_at
+        self.modified_at = modified_at
+        self.id          = id
+
+        self._note_file   = note_file
+        self._body_offset = body_offset
+        self._body_length = body_length
+        self._body        = None
+
+    @property
+    def body(self):
+        if self._body != None:
+            return self._body
+
+        # NOTE: BinaryNoteFile has checked that the heap is valid UTF-8 so this can't fail
+        return self.encoded_body().decode('utf-8')
+
+    @body.setter
+    def body(self, body):
+        assert type(body) == str
+        self._body = body
+
+    def is_materialized(self):
+        """ Returns True if the body is kept in memory rather than decoded from the file """
+
+        return self._body != None
+
+    def encoded_body(self):
+        return self._note_file.heap_bytes(self._body_offset, self._body_length)
+
+    def body_length(self):
+        """ Returns the length of the encoded body. It's the number of characters in the body, unless it
+            contains non-ASCII characters, and can be obtained without decoding it. """
+
+        if self._body != None:
+            return len(self._body)
+
+        return self._body_length
+
+class BinaryNoteFile:
+    # Size of the pieces of the heap decoded at a time when checking that it's valid UTF-8
+    ENCODING_CHECK_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, file_name):
+        """ Maps the file into memory and reads its header. Raises InvalidFormat if the file is not a binary
+            note file or is damaged and UnsupportedFormatVersion if it has been written by an incompatible
+            version of the application. """
+
+        with open(file_name, 'rb') as note_file:
+            file_size = os.fstat(note_file.fileno()).st_size
+            if file_size < HEADER.size:
+                raise InvalidFormat("The file is too short to be a binary note file")
+
+            # NOTE: The mapping stays valid after the file is closed. It's released once all notes read from it are gone.
+            self._map = mmap.mmap(note_file.fileno(), 0, access = mmap.ACCESS_READ)
+
+        (magic, version, key, self._note_count, tag_count, tag_id_count) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise InvalidFormat("The file is not a binary note file")
+        if version != FORMAT_VERSION:
+            raise UnsupportedFormatVersion("Expected format version {}, got {}".format(FORMAT_VERSION, version))
+
+        self._key            = key.hex()
+        self._records_offset = HEADER.size
+        self._tags_offset    = self._records_offset + self._note_count * RECORD.size
+        self._tag_ids_offset = self._tags_offset    + tag_count        * TAG.size
+        self._heap_offset    = self._tag_ids_offset + tag_id_count     * TAG_ID.size
+        self._heap_size      = file_size - self._heap_offset
+        self._tag_id_count   = tag_id_count
+
+        if self._heap_size < 0:
+            raise InvalidFormat("The file has been cut off")
+
+        self._check_heap_encoding()
+
+        # NOTE: There are few distinct tags so they're all decoded up front and shared between notes
+        self._tags = [
+            self._heap_string(offset, length)
+            for (offset, length) in TAG.iter_unpack(self._map[self._tags_offset:self._tag_ids_offset])
+        ]
+
+    def __len__(self):
+        return self._note_count
+
+    def key(self):
+        """ Returns a string that identifies the content of the file. It's computed when the file is written
+            so, unlike index_store.content_key(), it does not require reading the whole file. """
+
+        return self._key
+
+    def heap_bytes(self, offset, length):
+        if offset + length > self._heap_size:
+            raise InvalidFormat("String at offset {} extends past the end of the file".format(offset))
+
+        return self._map[self._heap_offset + offset:self._heap_offset + offset + length]
+
+    def note_links(self):
+        """ Yields (note, parent_id, prev_sibling_id) tuples in the same order they were passed to encode_snapshot().
+            Bodies of the notes are not decoded until they're accessed. """
+
+        # NOTE: Slicing a memoryview does not copy the table
+        for record in RECORD.iter_unpack(memoryview(self._map)[self._records_offset:self._tags_offset]):
+            (note_id, parent_id, prev_sibling_id, created_at, modified_at, body_offset, body_length, first_tag, tag_count) = record
+
+            if body_offset + body_length > self._heap_size or first_tag + tag_count > self._tag_id_count:
+                raise InvalidFormat("Record of note {} points past the end of the file".format(note_id))
+
+            # NOTE: Bodies are decoded long after the file has been opened. If the body starts or ends in the
+            # middle of a character, decoding it would fail even though the heap as a whole is valid UTF-8.
+            if not self._is_character_boundary(body_offset) or not self._is_character_boundary(body_offset + body_length):
+                raise InvalidFormat("Body of note {} is not valid UTF-8".format(note_id))
+
+            tag_ids = struct.unpack_from('<{}I'.format(tag_count), self._map, self._tag_ids_offset + first_tag * TAG_ID.size)
+            try:
+                note = MappedNote(
+                    self,
+                    body_offset,
+                    body_length,
+                    tags        = [self._tags[tag_id] for tag_id in tag_ids],
+                    created_at  = decode_timestamp(created_at),
+                    modified_at = decode_timestamp(modified_at),
+                    id          = note_id
+                )
+            except (IndexError, OverflowError):
+                raise InvalidFormat("Record of note {} is damaged".format(note_id))
+
+            yield (
+                note,
+                parent_id       if parent_id       != NO_ID else None,
+                prev_sibling_id if prev_sibling_id != NO_ID else None
+            )
+
+    def raw_notes(self):
+        """ Yields all notes as dicts in the format produced by dump_notes() """
+
+        for (note, parent_id, prev_sibling_id) in self.note_links():
+            note_dict = note.to_dict()
+            note_dict['parent_id']       = parent_id
+            note_dict['prev_sibling_id'] = prev_sibling_id
+
+            yield note_dict
+
+    def _check_heap_encoding(self):
+        """ Raises InvalidFormat if the heap is not valid UTF-8. It's decoded in chunks and the result is
+            thrown away so this does not keep the content of the file in memory. """
+
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        try:
+            for chunk_start in range(self._heap_offset, self._heap_offset + self._heap_size, self.ENCODING_CHECK_CHUNK_SIZE):
+                decoder.decode(self._map[chunk_start:min(chunk_start + self.ENCODING_CHECK_CHUNK_SIZE, self._heap_offset + self._heap_size)])
+
+            decoder.decode(b'', final = True)
+        except UnicodeDecodeError:
+            raise InvalidFormat("The string heap is not valid UTF-8")
+
+    def _is_character_boundary(self, offset):
+        # NOTE: Continuation bytes of multi-byte UTF-8 sequences all have the form 10xxxxxx
+        return offset == self._heap_size or self._map[self._heap_offset + offset] & 0xC0 != 0x80
+
+    def _heap_string(self, offset, length):
+        data = self.heap_bytes(offset, length)
+        if not self._is_character_boundary(offset) or not self._is_character_boundary(offset + length):
+            raise InvalidFormat("String at offset {} is not valid UTF-8".format(offset))
+
+        return data.decode('utf-8')
@@ -0,0 +1,67 @@
+""" A cache of shortened note bodies. Very long notes are shown in the tape in this form until expanded. """
+
+class BodyPreviewCache:
+    MAX_LINES      = 30
+    MAX_CHARACTERS = 3000
+
+    # Appended to a shortened body so that the user knows that something is missing and how to get it back
+    EXPAND_LINE_FORMAT = "[... {} more {}. Click here to show the whole note.]"
+
+    # Appended to the body of an expanded note so that it can be collapsed again
+    COLLAPSE_LINE = "[Click here to show only the beginning of the note.]"
+
+    def __init__(self):
+        self._previews = {}
+
+    @classmethod
+    def preview(cls, body):
+        """ Returns the beginning of the body followed by a line telling how much has been left out or
+            None if the body is short enough to be shown whole. Looks only at the beginning of the body
+            unless it really needs to be shortened. """
+
+        if len(body) <= cls.MAX_CHARACTERS and body.count('\n', 0, cls.MAX_CHARACTERS) < cls.MAX_LINES:
+            return None
+
+        end        = cls.MAX_CHARACTERS
+        line_count = 0
+        position   = body.find('\n', 0, cls.MAX_CHARACTERS)
+        while position != -1:
+            line_count += 1
+            if line_count == cls.MAX_LINES:
+                end = position
+                break
+
+            position = body.find('\n', position + 1, cls.MAX_CHARACTERS)
+
+        hidden_line_count = body.count('\n', end)
+        if hidden_line_count > 0:
+            expand_line = cls.EXPAND_LINE_FORMAT.format(hidden_line_count, "line" if hidden_line_count == 1 else "lines")
+        else:
+            expand_line = cls.EXPAND_LINE_FORMAT.format(len(body) - end, "characters")
+
+        return body[:end] + '\n' + expand_line
+
+    def get(self, note):
+        """ Returns the preview of the body of the note or None if it's not needed. The preview is computed
+            only if this particular version of the note has not been seen before. Notes without ids are not cached. """
+
+        entry = self._previews.get(note.id) if note.id != None else None
+
+        # NOTE: Notes are replaced rather than modified when edited so a different object means a different version.
+        if entry != None and entry[0] is note:
+            return entry[1]
+
+        preview = self.preview(note.body)
+        if note.id != None:
+            self._previews[note.id] = (note, preview)
+
+        return preview
+
+    def invalidate(self, note_id):
+        self._previews.pop(note_id, None)
+
+    def clear(self):
+        self._previews.clear()
+
+    def __len__(self):
+        return len(self._previews)
@@ -0,0 +1,142 @@
+""" Finds notes matching the search filter in a background thread so that the UI remains responsive """
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+class FilterTask(QRunnable):
+    # Number of notes checked between checks for cancellation
+    CHUNK_SIZE = 1000
+
+    def __init__(self, engine, generation, fixed_string, snapshot):
+        super().__init__()
+
+        self._engine       = engine
+        self._generation   = generation
+        self._fixed_string = fixed_string
+        self._snapshot     = snapshot
+
+    def run(self):
+        (query, candidate_ids, note_index, search_text_cache, index_revision) = self._snapshot
+
+        if self._engine.is_stale(self._generation):
+            return
+
+        try:
+            accepted_ids = self._find_matching_ids(query, candidate_ids, note_index, search_text_cache)
+            if accepted_ids == None:
+                return
+        except (RuntimeError, KeyError, IndexError):
+            # NOTE: The index has been modified in the GUI thread while we were reading it. Sets and dicts raise
+            # RuntimeError if they change size during iteration. The missing result makes the engine retry the query.
+            accepted_ids = None
+
+        try:
+            self._engine.task_finished.emit(self._generation, self._fixed_string, accepted_ids, search_text_cache, index_revision)
+        except RuntimeError:
+            # The engine has been destroyed while we were working. Nobody is interested in the result.
+            pass
+
+    def _find_matching_ids(self, query, candidate_ids, note_index, search_text_cache):
+        """ Returns ids of notes matching the query or None if the task has been cancelled.
+            Search texts that are not in the cache yet are computed and put in it. """
+
+        if query.is_empty():
+            return set(note_index.ids())
+
+        if candidate_ids == None:
+            candidate_ids = query.candidate_ids(note_index)
+
+        needs_search_text = query.needs_search_text()
+
+        accepted_ids = set()
+        for (i, id) in enumerate(list(candidate_ids)):
+            if i % self.CHUNK_SIZE == 0 and self._engine.is_stale(self._generation):
+                return None
+
+            note = note_index.note(id)
+            if query.matches(note, search_text_cache.get(note) if needs_search_text else None):
+                accepted_ids.add(id)
+
+        return accepted_ids
+
+class FilterEngine(QObject):
+    # NOTE: Emitted from worker threads. Qt delivers it to the thread the engine lives in.
+    task_finished = pyqtSignal(int, str, object, object, int)
+
+    # Emitted after a filter computed in the background has been applied to the proxy
+    filter_applied = pyqtSignal(str)
+
+    DEBOUNCE_INTERVAL    = 150
+    MIN_BACKGROUND_NOTES = 5000
+
+    def __init__(self, proxy_model, parent = None):
+        super().__init__(parent)
+
+        self._proxy_model    = proxy_model
+        self._thread_pool    = QThreadPool.globalInstance()
+        self._generation     = 0
+        self._pending_string = None
+
+        # Only the most recent query is ever executed. Each new one invalidates all the previous ones.
+        self._debounce_timer = QTimer(self)
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.setInterval(self.DEBOUNCE_INTERVAL)
+
+        self.min_background_notes = self.MIN_BACKGROUND_NOTES
+
+        self._debounce_timer.timeout.connect(self._start_task)
+        self.task_finished.connect(self._task_finished_handler)
+
+    def runs_in_background(self):
+        """ Filtering small tapes is fast enough to be done immediately in the UI thread """
+
+        return len(self._proxy_model.note_index()) >= self.min_background_notes
+
+    def set_filter(self, fixed_string):
+        """ Applies the filter to the proxy. On large tapes this happens asynchronously, after the user
+            stops typing for a moment. Any query that has not been applied yet is cancelled. """
+
+        if self.runs_in_background():
+            self._generation     += 1
+            self._pending_string  = fixed_string
+            self._debounce_timer.start()
+        else:
+            self.cancel()
+            self._proxy_model.setFilterFixedString(fixed_string)
+
+    def is_pending(self):
+        return self._pending_string != None
+
+    def is_stale(self, generation):
+        return generation != self._generation
+
+    def cancel(self):
+        self._generation     += 1
+        self._pending_string  = None
+        self._debounce_timer.stop()
+
+    def flush(self):
+        """ If there's a query that has not been applied yet, cancels it and applies it immediately in the UI thread """
+
+        if self.is_pending():
+            fixed_string = self._pending_string
+
+            self.cancel()
+            self._proxy_model.setFilterFixedString(fixed_string)
+
+    def _start_task(self):
+        if self._pending_string == None:
+            return
+
+        snapshot = self._proxy_model.filter_snapshot(self._pending_string)
+        self._thread_pool.start(FilterTask(self, self._generation, self._pending_string, snapshot))
+
+    def _task_finished_handler(self, generation, fixed_string, accepted_ids, search_text_cache, index_revision):
+        if self.is_stale(generation):
+            return
+
+        if accepted_ids != None and self._proxy_model.apply_filter_result(fixed_string, accepted_ids, index_revision, search_text_cache):
+            self._pending_string = None
+            self.filter_applied.emit(fixed_string)
+        else:
+            # Notes have changed while the task was running. Try again with a fresh snapshot.
+            self._start_task()
@@ -0,0 +1,163 @@
+""" Typo-tolerant search that ranks notes by relevance and returns only the best matches.
+
+    Unlike TapeFilterProxyModel it does not decide which notes are visible in the tape. It's meant
+    for quickly jumping to a particular note so only a handful of the best results is ever kept. """
+
+import heapq
+import string
+from datetime import datetime, timedelta
+
+from .note_index        import NoteIndex
+from .search_text_cache import SearchTextCache
+
+class FuzzySearch:
+    # Weights of different kinds of matches between a query word and a word from the note
+    EXACT_MATCH_WEIGHT  = 1.0
+    PREFIX_MATCH_WEIGHT = 0.75
+    TYPO_MATCH_WEIGHT   = 0.5
+
+    # Shorter words would match too many unrelated notes. They must match exactly.
+    MIN_PREFIX_LENGTH     = 3
+    MIN_TYPO_LENGTH       = 3
+    MAX_PREFIX_EXPANSIONS = 50
+
+    # Recently modified notes get a bonus that halves with every RECENCY_HALF_LIFE
+    RECENCY_WEIGHT    = 0.25
+    RECENCY_HALF_LIFE = timedelta(days = 30)
+
+    # Bonuses that require looking at the note itself. Computed only for the most promising candidates.
+    TAG_WEIGHT      = 0.25
+    POSITION_WEIGHT = 0.25
+    POSITION_SCALE  = 100
+
+    TYPO_ALPHABET = string.ascii_lowercase + string.digits
+
+    def __init__(self, note_index, search_text_getter = SearchTextCache.search_text):
+        self._note_index         = note_index
+        self._search_text_getter = search_text_getter
+
+    @classmethod
+    def edits(cls, word):
+        """ Returns all strings that differ from the word by a single deletion, transposition, replacement or insertion """
+
+        alphabet = set(cls.TYPO_ALPHABET) | set(word)
+        splits   = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+
+        deletes      = [left + right[1:]                       for (left, right) in splits if right != '']
+        transposes   = [left + right[1] + right[0] + right[2:] for (left, right) in splits if len(right) > 1]
+        replacements = [left + letter + right[1:]              for (left, right) in splits if right != '' for letter in alphabet]
+        inserts      = [left + letter + right                  for (left, right) in splits for letter in alphabet]
+
+        return set(deletes + transposes + replacements + inserts) - {word}
+
+    def expand_word(self, query_word):
+        """ Returns a dict that maps indexed words similar to the casefolded query word to match weights """
+
+        expansions = {}
+
+        if len(query_word) >= self.MIN_TYPO_LENGTH:
+            for word in self.edits(query_word):
+                if self._note_index.has_word(word):
+                    expansions[word] = self.TYPO_MATCH_WEIGHT
+
+        if len(query_word) >= self.MIN_PREFIX_LENGTH:
+            for word in self._note_index.words_with_prefix(query_word, self.MAX_PREFIX_EXPANSIONS):
+                expansions[word] = self.PREFIX_MATCH_WEIGHT
+
+        if self._note_index.has_word(query_word):
+            expansions[query_word] = self.EXACT_MATCH_WEIGHT
+
+        return expansions
+
+    def search(self, query, limit, now = None):
+        """ Returns up to limit best matches for the query as a list of (score, note) pairs, best first.
+
+            A note matches if each word from the query matches, exactly or approximately, a word from the note.
+            The score depends on the quality of word matches, recency, tags and position of the match in the body. """
+
+        if now == None:
+            now = datetime.utcnow()
+
+        query_words = sorted(NoteIndex.split_words(query))
+        if len(query_words) == 0 or limit <= 0:
+            return []
+
+        expansions   = [self.expand_word(query_word) for query_word in query_words]
+        word_weights = [self._note_weights(word_expansions) for word_expansions in expansions]
+
+        # NOTE: Every query word must match so it's enough to iterate over notes matching the rarest one
+        word_weights.sort(key = len)
+
+        candidates = []
+        for (id, weight) in word_weights[0].items():
+            total_weight = weight
+            for other_weights in word_weights[1:]:
+                if not id in other_weights:
+                    break
+                total_weight += other_weights[id]
+            else:
+                note       = self._note_index.note(id)
+                base_score = total_weight / len(query_words) + self._recency_bonus(note, now)
+
+                candidates.append((-base_score, id))
+
+        # NOTE: The bonuses are expensive to compute so we look at candidates in the order of decreasing
+        # base score and stop when even the maximum bonus can't get a candidate into the results.
+        heapq.heapify(candidates)
+
+        max_bonus = self.TAG_WEIGHT + self.POSITION_WEIGHT
+        results   = []
+        while len(candidates) > 0:
+            (negated_base_score, id) = heapq.heappop(candidates)
+            if len(results) == limit and -negated_base_score + max_bonus <= results[0][0]:
+                break
+
+            note  = self._note_index.note(id)
+            score = -negated_base_score + self._tag_bonus(note, expansions) + self._position_bonus(note, expansions)
+
+            # NOTE: Negated id makes older notes win ties
+            if len(results) < limit:
+                heapq.heappush(results, (score, -id))
+            elif (score, -id) > results[0]:
+                heapq.heapreplace(results, (score, -id))
+
+        return [(score, self._note_index.note(-negated_id)) for (score, negated_id) in sorted(results, reverse = True)]
+
+    def _note_weights(self, word_expansions):
+        note_weights = {}
+        for (word, weight) in word_expansions.items():
+            for id in self._note_index.word_ids(word):
+                if note_weights.get(id, 0.0) < weight:
+                    note_weights[id] = weight
+
+        return note_weights
+
+    def _recency_bonus(self, note, now):
+        age = max(now - note.modified_at, timedelta(0))
+        return self.RECENCY_WEIGHT * 0.5 ** (age / self.RECENCY_HALF_LIFE)
+
+    def _tag_bonus(self, note, expansions):
+        """ Bonus proportional to the number of query words that match words in tags """
+
+        tag_words = NoteIndex.split_words(' '.join(note.tags))
+        num_hits  = sum(1 for word_expansions in expansions if not tag_words.isdisjoint(word_expansions))
+
+        return self.TAG_WEIGHT * num_hits / len(expansions)
+
+    def _position_bonus(self, note, expansions):
+        """ Bonus for matches close to the beginning of the body. 0 if the query words occur only in tags. """
+
+        search_text = self._search_text_getter(note)
+        body        = search_text[search_text.rfind(SearchTextCache.SEPARATOR) + 1:]
+
+        positions = [
+            body.find(word)
+            for word_expansions in expansions
+            for word in word_expansions
+        ]
+        positions = [position for position in positions if position != -1]
+
+        if len(positions) == 0:
+            return 0.0
+
+        return self.POSITION_WEIGHT / (1 + min(positions) / self.POSITION_SCALE)
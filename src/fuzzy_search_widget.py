@@ -0,0 +1,100 @@
+""" A panel that shows the best fuzzy matches for a query as a flat list and lets the user jump to any of them in the tape """
+
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLineEdit, QListWidget, QListWidgetItem
+from PyQt5.QtCore    import Qt, QTimer
+
+from .fuzzy_search import FuzzySearch
+
+class FuzzySearchWidget(QWidget):
+    RESULT_LIMIT   = 50
+    PREVIEW_LENGTH = 80
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+
+        self._main_layout = QVBoxLayout(self)
+        self._search_box  = QLineEdit(self)
+        self._result_list = QListWidget(self)
+
+        self._search_box.setPlaceholderText("Jump to note...")
+
+        self._main_layout.addWidget(self._search_box)
+        self._main_layout.addWidget(self._result_list)
+
+        self._tape_widget = None
+
+        # NOTE: Results are refreshed when notes are edited. The index changes once per model operation so,
+        # like in TagFacetWidget, refreshes are postponed until control returns to the event loop.
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(0)
+
+        self._refresh_timer.timeout.connect(self.update_results)
+        self._search_box.textChanged.connect(self.update_results)
+        self._search_box.returnPressed.connect(self._return_pressed_handler)
+        self._result_list.itemActivated.connect(self._item_activated_handler)
+
+    def set_tape_widget(self, tape_widget):
+        if self._tape_widget != None:
+            self._tape_widget.proxy_model().index_changed.disconnect(self._refresh_timer.start)
+
+        self._tape_widget = tape_widget
+        if self._tape_widget != None:
+            self._tape_widget.proxy_model().index_changed.connect(self._refresh_timer.start)
+
+        self.update_results()
+
+    def tape_widget(self):
+        return self._tape_widget
+
+    def set_query(self, query):
+        # NOTE: This triggers textChanged() signal which updates the results
+        self._search_box.setText(query)
+
+    def query(self):
+        return self._search_box.text()
+
+    def result_ids(self):
+        return [self._result_list.item(row).data(Qt.UserRole) for row in range(self._result_list.count())]
+
+    def update_results(self):
+        self._refresh_timer.stop()
+        self._result_list.clear()
+
+        if self._tape_widget == None:
+            return
+
+        proxy_model  = self._tape_widget.proxy_model()
+        fuzzy_search = FuzzySearch(proxy_model.note_index(), proxy_model.search_text_cache().get)
+
+        for (score, note) in fuzzy_search.search(self._search_box.text(), self.RESULT_LIMIT):
+            item = QListWidgetItem(self.note_summary(note))
+            item.setData(Qt.UserRole, note.id)
+            self._result_list.addItem(item)
+
+    @classmethod
+    def note_summary(cls, note):
+        """ Returns a single line of text that identifies the note on the result list """
+
+        first_line = note.body.strip().split('\n', 1)[0]
+        if len(first_line) > cls.PREVIEW_LENGTH:
+            first_line = first_line[:cls.PREVIEW_LENGTH] + '...'
+
+        if len(note.tags) > 0:
+            return "{} [{}]".format(first_line, ', '.join(note.tags))
+        else:
+            return first_line
+
+    def activate_result(self, row):
+        """ Focuses the tape on the note from the specified row of the result list """
+
+        if self._tape_widget == None or not 0 <= row < self._result_list.count():
+            return False
+
+        return self._tape_widget.focus_note(self._result_list.item(row).data(Qt.UserRole))
+
+    def _item_activated_handler(self, item):
+        self.activate_result(self._result_list.row(item))
+
+    def _return_pressed_handler(self):
+        self.activate_result(max(self._result_list.currentRow(), 0))
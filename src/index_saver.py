@@ -0,0 +1,121 @@
+""" Writes the search index to its sidecar file (see index_store) in a worker thread.
+
+    Serializing the postings of a large tape takes seconds. The index is read directly by the worker rather
+    than copied in the GUI thread first. If the GUI thread changes it in the meantime, the save is abandoned
+    and the sidecar gets written by the next save instead. """
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, QCoreApplication, QEvent, pyqtSignal
+
+from .index_store import IndexChanged, save_index
+
+class IndexSaveTask(QRunnable):
+    def __init__(self, saver, generation, file_name, key, signature, note_index, revision):
+        super().__init__()
+
+        self._saver      = saver
+        self._generation = generation
+        self._file_name  = file_name
+        self._key        = key
+        self._signature  = signature
+        self._note_index = note_index
+        self._revision   = revision
+
+    def run(self):
+        if self._saver.is_stale(self._generation):
+            return
+
+        try:
+            save_index(self._file_name, self._key, self._signature, self._note_index, self._revision)
+        except (IndexChanged, OSError):
+            # NOTE: The index is only an optimization. If we can't save it, it will just be rebuilt next time.
+            saved = False
+        else:
+            saved = True
+
+        try:
+            self._saver.task_finished.emit(self._generation, self._file_name, saved)
+        except RuntimeError:
+            # The saver has been destroyed while we were working
+            pass
+
+class IndexSaver(QObject):
+    # Milliseconds between schedule() and the save. Only the most recent request made in the meantime is saved.
+    DELAY = 30000
+
+    # NOTE: Emitted from the worker thread. Qt delivers it to the thread the saver lives in.
+    task_finished = pyqtSignal(int, str, bool)
+
+    # Emitted with the file name after its sidecar has been written
+    saved = pyqtSignal(str)
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+
+        # NOTE: Saves of the same sidecar must not overlap
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(1)
+        self._generation  = 0
+
+        # Arguments of the save() call to be made once the timer fires
+        self._scheduled_save = None
+
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(self.DELAY)
+
+        self._save_timer.timeout.connect(self.save_now)
+        self.task_finished.connect(self._task_finished_handler)
+
+    def save(self, file_name, key, signature, note_index):
+        """ Starts writing the index to the sidecar of the note file. signature must be the value of
+            index_store.source_signature() for the note file. Saves requested earlier and not started yet are dropped. """
+
+        self.cancel()
+
+        # NOTE: The revision must be taken in the thread that modifies the index, while it's not being modified
+        self._thread_pool.start(IndexSaveTask(self, self._generation, file_name, key, signature, note_index, note_index.revision()))
+
+    def schedule(self, file_name, key, signature, note_index):
+        """ Like save() but the save starts after DELAY milliseconds. Meant for saves requested after every
+            change, e.g. after each autosave, so that the index is not serialized over and over again. """
+
+        self._scheduled_save = (file_name, key, signature, note_index)
+
+        # NOTE: Restarting the timer on every request would postpone saving for as long as the user keeps editing
+        if not self._save_timer.isActive():
+            self._save_timer.start()
+
+    def is_scheduled(self):
+        return self._save_timer.isActive()
+
+    def save_now(self):
+        """ Starts the scheduled save right away. Does nothing if no save is scheduled. """
+
+        self._save_timer.stop()
+
+        (scheduled_save, self._scheduled_save) = (self._scheduled_save, None)
+        if scheduled_save != None:
+            self.save(*scheduled_save)
+
+    def cancel(self):
+        """ Drops saves that have not started yet, including the scheduled one. A save already in progress
+            is finished but not reported. """
+
+        self._save_timer.stop()
+        self._scheduled_save = None
+        self._generation    += 1
+
+    def is_stale(self, generation):
+        return generation != self._generation
+
+    def wait_for_done(self):
+        """ Blocks until the save in progress finishes and handles its result """
+
+        self._thread_pool.waitForDone()
+
+        # NOTE: The result is delivered through a queued call to a slot proxy rather than to the saver itself
+        QCoreApplication.sendPostedEvents(None, QEvent.MetaCall)
+
+    def _task_finished_handler(self, generation, file_name, saved):
+        if not self.is_stale(generation) and saved:
+            self.saved.emit(file_name)
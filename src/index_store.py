@@ -0,0 +1,240 @@
+""" Saves the search index in a sidecar file next to the note file so that it does not have to be rebuilt
+    from scratch every time the file is opened.
+
+    The sidecar contains postings of the NoteIndex and modification times of the notes they were built from.
+    Notes modified since the sidecar was written are recognized by their modification times and only they
+    need to be indexed again.
+
+    The sidecar is a binary file (all numbers are little-endian) that consists of:
+
+    - a header (see HEADER),
+    - a table of the notes the postings were built from (see NOTE),
+    - tables of words, trigrams and tags (see TERM),
+    - ids of notes containing the terms (see ID); each term refers to a contiguous range of them,
+    - a string heap containing the content key and all the terms, UTF-8 encoded.
+
+    It sits next to a file that may come from anywhere so every size and offset is checked before use and
+    a sidecar that does not pass the checks is ignored. """
+
+import hashlib
+import os
+import struct
+import sys
+from array    import array
+from datetime import datetime, timedelta
+
+from .note_file_writer import write_atomically
+
+FORMAT_VERSION = 2
+SIDECAR_SUFFIX = '.index'
+MAGIC          = b'NIDX'
+
+# Magic bytes, format version, size and modification time (in nanoseconds) of the note file, length of the
+# content key, number of notes, number of words, trigrams and tags and the number of ids in all postings
+HEADER = struct.Struct('<4sIQqIQQQQQ')
+
+# Id and modification time (in microseconds since EPOCH)
+NOTE = struct.Struct('<qq')
+
+# Offset and length of the term in the heap, index of the first id of its posting and the number of ids
+TERM = struct.Struct('<QIQQ')
+
+ID = struct.Struct('<q')
+
+EPOCH       = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds = 1)
+
+class IndexChanged(Exception): pass
+
+def sidecar_path(file_name):
+    return file_name + SIDECAR_SUFFIX
+
+def content_key(content):
+    """ Returns a string that identifies the content of a note file. If the key of the file matches the key
+        stored in the sidecar, the sidecar is up to date and does not need to be written again. """
+
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def timestamp_key(timestamp):
+    """ Converts a timestamp into an integer that can be stored in the sidecar and compared quickly """
+
+    return (timestamp - EPOCH) // MICROSECOND
+
+class StoredIndex:
+    """ Postings loaded from a sidecar file """
+
+    def __init__(self, key, modification_times, word_ids, trigram_ids, tag_ids):
+        self.key = key
+
+        self._modification_times = modification_times
+        self._word_ids           = word_ids
+        self._trigram_ids        = trigram_ids
+        self._tag_ids            = tag_ids
+
+    def __len__(self):
+        return len(self._modification_times)
+
+    def is_up_to_date(self, note):
+        return self._modification_times.get(note.id) == timestamp_key(note.modified_at)
+
+    def postings(self, up_to_date_ids):
+        """ Returns postings suitable for NoteIndex.load_postings() with all ids other than up_to_date_ids removed.
+
+            The postings are handed over to the caller and the StoredIndex should not be used afterwards. """
+
+        outdated_ids = set(self._modification_times.keys()) - set(up_to_date_ids)
+
+        if len(outdated_ids) > 0:
+            for postings in [self._word_ids, self._trigram_ids, self._tag_ids]:
+                for (term, ids) in list(postings.items()):
+                    ids -= outdated_ids
+                    if len(ids) == 0:
+                        del postings[term]
+
+        return (self._word_ids, self._trigram_ids, self._tag_ids)
+
+def source_signature(file_name):
+    """ Returns the size and modification time of the note file. A sidecar is used only if they have not
+        changed since it was saved. Should be taken right after the note file has been written. """
+
+    file_stat = os.stat(file_name)
+    return (file_stat.st_size, file_stat.st_mtime_ns)
+
+def encode_index(key, signature, note_index):
+    """ Converts the postings from the index into the content of a sidecar """
+
+    (word_ids, trigram_ids, tag_ids) = note_index.postings()
+
+    heap_chunks = [key.encode('utf-8')]
+    heap_size   = len(heap_chunks[0])
+    ids         = array('q')
+
+    def encode_postings(postings):
+        nonlocal heap_size
+
+        entries = []
+        for (term, term_ids) in postings.items():
+            encoded_term = term.encode('utf-8')
+            entries.append(TERM.pack(heap_size, len(encoded_term), len(ids), len(term_ids)))
+
+            heap_chunks.append(encoded_term)
+            heap_size += len(encoded_term)
+            ids.extend(term_ids)
+
+        return entries
+
+    notes = [NOTE.pack(id, timestamp_key(note_index.note(id).modified_at)) for id in note_index.ids()]
+    terms = encode_postings(word_ids) + encode_postings(trigram_ids) + encode_postings(tag_ids)
+
+    if sys.byteorder != 'little':
+        ids.byteswap()
+
+    (source_size, source_modified_at) = signature
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        source_size,
+        source_modified_at,
+        len(heap_chunks[0]),
+        len(notes),
+        len(word_ids),
+        len(trigram_ids),
+        len(tag_ids),
+        len(ids)
+    )
+
+    return b''.join([header] + notes + terms + [ids.tobytes()] + heap_chunks)
+
+def decode_index(content, signature, note_count = None):
+    """ Converts the content of a sidecar back into a StoredIndex. Returns None if the content is damaged
+        or has been written by an incompatible version of the application, if signature (see source_signature())
+        does not match the one the sidecar has been saved with or if note_count is specified and the postings
+        have been built from a different number of notes. """
+
+    if len(content) < HEADER.size:
+        return None
+
+    (magic, version, source_size, source_modified_at, key_length, stored_note_count, word_count, trigram_count, tag_count, id_count) = HEADER.unpack_from(content)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+
+    if (source_size, source_modified_at) != tuple(signature) or note_count != None and stored_note_count != note_count:
+        return None
+
+    notes_offset = HEADER.size
+    terms_offset = notes_offset + stored_note_count                       * NOTE.size
+    ids_offset   = terms_offset + (word_count + trigram_count + tag_count) * TERM.size
+    heap_offset  = ids_offset   + id_count                                * ID.size
+    heap_size    = len(content) - heap_offset
+
+    if heap_size < key_length:
+        return None
+
+    modification_times = dict(NOTE.iter_unpack(content[notes_offset:terms_offset]))
+    if len(modification_times) != stored_note_count:
+        return None
+
+    ids = array('q')
+    ids.frombytes(content[ids_offset:heap_offset])
+    if sys.byteorder != 'little':
+        ids.byteswap()
+
+    # NOTE: NoteIndex.load_postings() trusts that the postings describe exactly the notes it gets
+    if not set(ids) <= modification_times.keys():
+        return None
+
+    def decode_postings(first_term, term_count):
+        postings = {}
+        for (offset, length, first_id, count) in TERM.iter_unpack(content[terms_offset + first_term * TERM.size:terms_offset + (first_term + term_count) * TERM.size]):
+            if offset + length > heap_size or first_id + count > id_count:
+                raise ValueError("Term points past the end of the sidecar")
+
+            postings[content[heap_offset + offset:heap_offset + offset + length].decode('utf-8')] = set(ids[first_id:first_id + count])
+
+        return postings
+
+    try:
+        key         = content[heap_offset:heap_offset + key_length].decode('utf-8')
+        word_ids    = decode_postings(0,                          word_count)
+        trigram_ids = decode_postings(word_count,                 trigram_count)
+        tag_ids     = decode_postings(word_count + trigram_count, tag_count)
+    except ValueError:
+        # NOTE: UnicodeDecodeError is a ValueError too
+        return None
+
+    return StoredIndex(key, modification_times, word_ids, trigram_ids, tag_ids)
+
+def save_index(file_name, key, signature, note_index, revision = None):
+    """ Writes postings from the index into the sidecar of the note file. The index must contain all the notes from
+        the file. signature is the value source_signature() returned for the file when it had just been written.
+
+        The index may be modified in another thread while it's being saved as long as revision is the value
+        NoteIndex.revision() returned before the save started. In that case IndexChanged is raised if the index
+        has changed in the meantime and the sidecar is not written.
+
+        The file is replaced atomically so a failed write does not damage the previous version. """
+
+    try:
+        content = encode_index(key, signature, note_index)
+    except RuntimeError:
+        # NOTE: Raised when a dict or set changes size while we're iterating over it
+        raise IndexChanged("The index has changed while being saved")
+
+    if revision != None and note_index.revision() != revision:
+        raise IndexChanged("The index has changed while being saved")
+
+    write_atomically(sidecar_path(file_name), content)
+
+def load_index(file_name, note_count = None):
+    """ Reads the sidecar of the note file. Returns None if it does not exist, is damaged, has been written by
+        an incompatible version of the application or does not match the current version of the note file.
+        If note_count is specified, the sidecar must have been built from exactly that many notes. """
+
+    try:
+        signature = source_signature(file_name)
+        with open(sidecar_path(file_name), 'rb') as sidecar_file:
+            content = sidecar_file.read()
+    except OSError:
+        return None
+
+    return decode_index(content, signature, note_count)
@@ -1,25 +1,104 @@
 """ The main UI component of the application. Controls the whole window """
 
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QFileDialog, QMessageBox, QSplitter
-from PyQt5.QtGui     import QStandardItem, QStandardItemModel
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QFileDialog, QMessageBox, QSplitter, QDockWidget, QProgressDialog
+from PyQt5.QtGui     import QStandardItem, QStandardItemModel, QKeySequence
+from PyQt5.QtCore    import Qt
+
+import os
+import sqlite3
 
 import simplejson
 
 from .tape_widget            import TapeWidget
+from .fuzzy_search_widget    import FuzzySearchWidget
+from .tag_facet_widget       import TagFacetWidget
 from .note                   import Note
 from .opera.hotlist.importer import import_opera_notes
-from .note_model_helpers     import dump_notes, load_notes
+from .note_model_helpers     import dump_notes, load_notes, snapshot_notes, load_note_links
+from .index_store            import content_key, load_index, source_signature
+from .index_saver            import IndexSaver
+from .note_file_reader       import NoteFileReader
+from .sqlite_store           import SqliteNoteStore, UnsupportedFormatVersion, is_store_file
+from .note_journal           import NoteJournal, InvalidJournal, replay_journal, journal_path
+from .note_file_writer       import serialize_notes, write_atomically
+from .autosaver              import Autosaver
+from .binary_note_file       import BinaryNoteFile, InvalidFormat, encode_snapshot, header_key, is_binary_note_file
+from .binary_note_file       import UnsupportedFormatVersion as UnsupportedBinaryFormatVersion
+from .render_profiler        import RenderProfiler
+from .render_profiler_widget import RenderProfilerWidget
 
 class MainWindow(QMainWindow):
+    # Resolution of progress dialogs
+    PROGRESS_STEPS = 1000
+
+    # Milliseconds status bar messages stay visible
+    STATUS_MESSAGE_TIMEOUT = 5000
+
+    OPEN_FILE_FILTER = "Note files (*.json *.sqlite *.tape);;JSON files (*.json);;SQLite databases (*.sqlite);;Binary tapes (*.tape)"
+    SAVE_FILE_FILTER = "JSON files (*.json);;SQLite databases (*.sqlite);;Binary tapes (*.tape)"
+
     def __init__(self):
         super().__init__()
 
-        self.tape_widget = TapeWidget(self)
+        # The file the tape was last opened from or saved to. If it's an SQLite database, note_store is kept open
+        # so that it can write only the notes that have changed since then. If it's a JSON file, the changes
+        # are recorded in its journal. A binary tape is always written as a whole.
+        self.file_name  = None
+        self.note_store = None
+        self.journal    = None
+
+        # Writes the tape to its JSON file in a worker thread a few seconds after it changes
+        self.autosaver = Autosaver(self)
+        self.autosaver.saved.connect(self._autosaver_saved_handler)
+        self.autosaver.save_failed.connect(self._autosaver_save_failed_handler)
+
+        # Writes the search index to its sidecar file in a worker thread
+        self.index_saver = IndexSaver(self)
+
+        # A proxy model that's still indexing the tape and the slot that saves the index once it's done.
+        # There's never more than one. A newer request replaces the older one.
+        self._pending_index_save = None
+
+        self.tape_widget         = TapeWidget(self)
+        self.fuzzy_search_widget = FuzzySearchWidget(self)
+        self.fuzzy_search_widget.set_tape_widget(self.tape_widget)
+
+        self.fuzzy_search_dock = QDockWidget("Quick search", self)
+        self.fuzzy_search_dock.setObjectName('fuzzy_search_dock')
+        self.fuzzy_search_dock.setWidget(self.fuzzy_search_widget)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.fuzzy_search_dock)
+
+        self.tag_facet_widget = TagFacetWidget(self)
+        self.tag_facet_widget.set_tape_widget(self.tape_widget)
+
+        self.tag_facet_dock = QDockWidget("Tags", self)
+        self.tag_facet_dock.setObjectName('tag_facet_dock')
+        self.tag_facet_dock.setWidget(self.tag_facet_widget)
+        self.addDockWidget(Qt.LeftDockWidgetArea, self.tag_facet_dock)
+
+        # NOTE: Profiling adds some overhead to painting so it's available only on request
+        self.render_profiler      = None
+        self.render_profiler_dock = None
+        if RenderProfiler.enabled_by_environment():
+            self.render_profiler = RenderProfiler(self)
+            self.tape_widget.set_render_profiler(self.render_profiler)
+
+            self.render_profiler_widget = RenderProfilerWidget(self)
+            self.render_profiler_widget.set_profiler(self.render_profiler)
+
+            self.render_profiler_dock = QDockWidget("Render profile", self)
+            self.render_profiler_dock.setObjectName('render_profiler_dock')
+            self.render_profiler_dock.setWidget(self.render_profiler_widget)
+            self.addDockWidget(Qt.RightDockWidgetArea, self.render_profiler_dock)
 
         file_menu      = self.menuBar().addMenu("File")
         new_action     = file_menu.addAction("&New")
         open_action    = file_menu.addAction("&Open...")
-        save_as_action = file_menu.addAction("&Save as...")
+        save_action    = file_menu.addAction("&Save")
+        save_as_action = file_menu.addAction("Save &as...")
+        self.autosave_action = file_menu.addAction("Auto&save")
+        self.autosave_action.setCheckable(True)
+        self.autosave_action.setChecked(True)
         file_menu.addSeparator()
         import_menu    = file_menu.addMenu("&Import")
         file_menu.addSeparator()
@@ -27,10 +106,26 @@ class MainWindow(QMainWindow):
 
         import_opera_notes_action = import_menu.addAction("&Opera Notes...")
 
+        view_menu = self.menuBar().addMenu("View")
+        self.compact_action = view_menu.addAction("&Compact mode")
+        self.compact_action.setCheckable(True)
+        self.show_ancestors_action = view_menu.addAction("Show &ancestors of matching notes")
+        self.show_ancestors_action.setCheckable(True)
+        view_menu.addSeparator()
+        view_menu.addAction(self.fuzzy_search_dock.toggleViewAction())
+        view_menu.addAction(self.tag_facet_dock.toggleViewAction())
+        if self.render_profiler_dock != None:
+            view_menu.addAction(self.render_profiler_dock.toggleViewAction())
+
         new_action.triggered.connect(self.new_handler)
         open_action.triggered.connect(self.open_handler)
+        save_action.setShortcut(QKeySequence.Save)
+        save_action.triggered.connect(self.save_handler)
         save_as_action.triggered.connect(self.save_as_handler)
+        self.autosave_action.toggled.connect(self.autosaver.set_enabled)
         exit_action.triggered.connect(self.close)
+        self.compact_action.toggled.connect(lambda checked: self.tape_widget.set_compact(checked))
+        self.show_ancestors_action.toggled.connect(lambda checked: self.tape_widget.set_show_ancestors_of_matches(checked))
 
         import_opera_notes_action.triggered.connect(self.import_opera_notes_handler)
 
@@ -40,13 +135,27 @@ class MainWindow(QMainWindow):
     def new_handler(self):
         new_model = load_notes([])
         self._replace_tape_widget(new_model)
+        self._set_file(None)
+
+    def save_handler(self):
+        if self.journal != None:
+            # NOTE: All the changes are already in the journal. They just need to be written to the disk.
+            self.journal.flush()
+
+            # The note file is rewritten in the background. Changes are safe in the journal until it's done.
+            if self.journal.needs_compaction():
+                self.autosaver.save_now()
+        elif self.file_name != None:
+            self.save_note_file_as(self.file_name)
+        else:
+            self.save_as_handler()
 
     def save_as_handler(self):
         file_name = QFileDialog.getSaveFileName(
             self,
             "Save as...",
             None,
-            "JSON files (*.json)"
+            self.SAVE_FILE_FILTER
         )
 
         if file_name[0] != '':
@@ -57,7 +166,7 @@ class MainWindow(QMainWindow):
             self,
             "Open...",
             None,
-            "JSON files (*.json)"
+            self.OPEN_FILE_FILTER
         )
 
         if file_name[0] != '':
@@ -76,39 +185,223 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "Success", "Successfully imported {} notes".format(num_notes))
 
     def save_note_file_as(self, file_name):
-        raw_notes = dump_notes(self.tape_widget.model())
+        if is_store_file(file_name):
+            self.save_note_store_as(file_name)
+            return
 
-        with open(file_name, 'w') as json_file:
-            if __debug__:
-                json_file.write(simplejson.dumps(raw_notes, indent = 4, sort_keys = True))
-            else:
-                json_file.write(simplejson.dumps(raw_notes))
+        if is_binary_note_file(file_name):
+            self.save_binary_note_file_as(file_name)
+            return
+
+        # NOTE: A background save still in progress must not overwrite the file after we do
+        self.autosaver.wait_for_done()
+
+        content = serialize_notes(dump_notes(self.tape_widget.model()))
+        write_atomically(file_name, content)
+
+        key = content_key(content)
+        self._set_file(file_name, journal = NoteJournal(file_name, key, self))
+        self._save_index_when_ready(file_name, key)
+
+    def save_binary_note_file_as(self, file_name):
+        content = encode_snapshot(snapshot_notes(self.tape_widget.model()))
+        write_atomically(file_name, content)
+
+        self._set_file(file_name)
+        self._save_index_when_ready(file_name, header_key(content))
+
+    def open_binary_note_file(self, file_name):
+        """ Opens a binary tape. Only the record table is read. Bodies of the notes stay in the mapped file
+            until they're displayed or searched. """
+
+        try:
+            note_file = BinaryNoteFile(file_name)
+            new_model = load_note_links(note_file.note_links())
+        except (InvalidFormat, UnsupportedBinaryFormatVersion):
+            QMessageBox.warning(self, "File error", "Failed to read the binary tape. The file has different format or is damaged.")
+            return
+
+        # NOTE: A binary tape has no journal so the index must have been built from exactly the notes in the file
+        stored_index = load_index(file_name, len(note_file))
+        self._replace_tape_widget(new_model, stored_index)
+        self._set_file(file_name)
+
+        if stored_index == None or stored_index.key != note_file.key():
+            self._save_index_when_ready(file_name, note_file.key())
+
+    def save_note_store_as(self, file_name):
+        """ Saves the tape in an SQLite database. If the tape has been opened from or saved to this database
+            before, only notes that have changed since then are written. """
+
+        if self.note_store == None or self.file_name != file_name:
+            # NOTE: The user has already agreed to overwrite the file. Notes already in it are not ours.
+            self._set_file(file_name, SqliteNoteStore.create(file_name, self.tape_widget.model()))
+        else:
+            self.note_store.save(self.tape_widget.model())
+
+    def open_note_store(self, file_name):
+        try:
+            note_store = SqliteNoteStore(file_name)
+            new_model  = note_store.load()
+        except (sqlite3.DatabaseError, UnsupportedFormatVersion):
+            QMessageBox.warning(self, "File error", "Failed to read the database. The file has different format or is damaged.")
+            return
 
-    def open_note_file(self, file_name):
-        with open(file_name, 'r') as json_file:
-            try:
-                raw_notes = simplejson.loads(json_file.read())
-            except simplejson.scanner.JSONDecodeError:
-                QMessageBox.warning(self, "File error", "Failed to decode JSON data. The file has different format or is damaged.")
-                return
-
-        new_model = load_notes(raw_notes)
         self._replace_tape_widget(new_model)
+        self._set_file(file_name, note_store)
+
+    def open_note_file(self, file_name):
+        if is_store_file(file_name):
+            self.open_note_store(file_name)
+            return
+
+        if is_binary_note_file(file_name):
+            self.open_binary_note_file(file_name)
+            return
+
+        # NOTE: The file may be the one that's already open. Its journal must be complete before being replayed.
+        self.autosaver.wait_for_done()
+        if self.journal != None:
+            self.journal.flush()
+
+        # NOTE: The file is decoded while being read and notes are converted as soon as they're decoded.
+        # Reading the whole file and decoding it all at once would keep three copies of the tape in memory.
+        file_size = os.path.getsize(file_name)
+
+        progress_dialog = QProgressDialog("Opening {}...".format(os.path.basename(file_name)), None, 0, self.PROGRESS_STEPS, self)
+        progress_dialog.setWindowModality(Qt.WindowModal)
+
+        def progress_handler(bytes_read):
+            # NOTE: Modal progress dialog processes events in setValue() which keeps the window responsive
+            progress_dialog.setValue(min(self.PROGRESS_STEPS - 1, bytes_read * self.PROGRESS_STEPS // max(file_size, 1)))
+
+        try:
+            with open(file_name, 'r') as json_file:
+                reader = NoteFileReader(json_file, progress_handler)
+                try:
+                    new_model = load_notes(reader.raw_notes())
+                except simplejson.scanner.JSONDecodeError:
+                    QMessageBox.warning(self, "File error", "Failed to decode JSON data. The file has different format or is damaged.")
+                    return
+        finally:
+            progress_dialog.reset()
+
+        # Changes made since the file was last saved in full
+        key = reader.content_key()
+        try:
+            replay_journal(new_model, file_name, key)
+        except InvalidJournal:
+            QMessageBox.warning(self, "File error", "Failed to apply changes recorded in {}. The journal does not match the file or is damaged.".format(os.path.basename(journal_path(file_name))))
+            return
+
+        stored_index = load_index(file_name)
+        self._replace_tape_widget(new_model, stored_index)
+        self._set_file(file_name, journal = NoteJournal(file_name, key, self))
+
+        if stored_index == None or stored_index.key != key:
+            self._save_index_when_ready(file_name, key)
 
     def import_opera_notes(self, file_name):
         with open(file_name, 'r') as note_file:
             new_model = import_opera_notes(note_file)
 
         self._replace_tape_widget(new_model)
+        self._set_file(None)
 
         # TODO: It would be more efficient to get the number of notes directly from import_opera_notes()
         return len(list(self.tape_widget.notes()))
 
-    def _replace_tape_widget(self, new_model):
+    def closeEvent(self, event):
+        self.autosaver.wait_for_done()
+        if self.journal != None:
+            self.journal.flush()
+
+        # NOTE: A sidecar that does not match the file would be ignored and the whole tape indexed again on next open
+        self.index_saver.save_now()
+        self.index_saver.wait_for_done()
+
+        super().closeEvent(event)
+
+    def _set_file(self, file_name, note_store = None, journal = None):
+        # NOTE: An index still waiting to be saved belongs to the old file
+        self._cancel_pending_index_save()
+
+        if self.note_store != None and self.note_store is not note_store:
+            self.note_store.close()
+
+        if self.journal != None and self.journal is not journal:
+            self.journal.close()
+
+        self.file_name  = file_name
+        self.note_store = note_store
+        self.journal    = journal
+
+        if journal != None:
+            journal.set_model(self.tape_widget.model())
+            self.autosaver.set_target(self.tape_widget.model(), file_name, journal)
+        else:
+            # NOTE: SQLite databases are updated in place and only on request
+            self.autosaver.set_target(None, None)
+
+    def _autosaver_saved_handler(self, file_name, key, seconds):
+        # NOTE: The content key has changed. A sidecar saved under the old key would be rebuilt on next open.
+        # Serializing the index takes much longer than saving the notes so it's not done after every autosave.
+        self._save_index_when_ready(file_name, key, delayed = True)
+        self.statusBar().showMessage("Saved {} in {:.0f} ms".format(os.path.basename(file_name), seconds * 1000), self.STATUS_MESSAGE_TIMEOUT)
+
+    def _autosaver_save_failed_handler(self, file_name, message):
+        self.statusBar().showMessage("Failed to save {}: {}".format(os.path.basename(file_name), message))
+
+    def _replace_tape_widget(self, new_model, stored_index = None):
         new_tape_widget = TapeWidget()
-        new_tape_widget.set_model(new_model)
+        new_tape_widget.set_model(new_model, stored_index)
+        new_tape_widget.set_render_profiler(self.render_profiler)
+        new_tape_widget.set_compact(self.compact_action.isChecked())
+        new_tape_widget.set_show_ancestors_of_matches(self.show_ancestors_action.isChecked())
 
+        self._cancel_pending_index_save()
         self.tape_widget.setParent(None)
 
         self.tape_widget = new_tape_widget
         self.setCentralWidget(new_tape_widget)
+        self.fuzzy_search_widget.set_tape_widget(new_tape_widget)
+        self.tag_facet_widget.set_tape_widget(new_tape_widget)
+
+    def _save_index_when_ready(self, file_name, key, delayed = False):
+        """ Saves the search index of the current tape next to the note file once all its notes are indexed.
+            Must be called right after the note file has been written. If delayed is True, the save is
+            scheduled rather than started right away (see IndexSaver.schedule()). """
+
+        self._cancel_pending_index_save()
+
+        try:
+            signature = source_signature(file_name)
+        except OSError:
+            # NOTE: The index is only an optimization. If we can't save it, it will just be rebuilt next time.
+            return
+
+        proxy_model = self.tape_widget.proxy_model()
+        if proxy_model.is_indexing():
+            def indexing_finished_handler():
+                self._cancel_pending_index_save()
+                self._save_index(file_name, key, signature, proxy_model.note_index(), delayed)
+
+            proxy_model.background_indexing_finished.connect(indexing_finished_handler)
+            self._pending_index_save = (proxy_model, indexing_finished_handler)
+        else:
+            self._save_index(file_name, key, signature, proxy_model.note_index(), delayed)
+
+    def _cancel_pending_index_save(self):
+        self.index_saver.cancel()
+
+        if self._pending_index_save != None:
+            (proxy_model, indexing_finished_handler) = self._pending_index_save
+            proxy_model.background_indexing_finished.disconnect(indexing_finished_handler)
+
+            self._pending_index_save = None
+
+    def _save_index(self, file_name, key, signature, note_index, delayed = False):
+        if delayed:
+            self.index_saver.schedule(file_name, key, signature, note_index)
+        else:
+            self.index_saver.save(file_name, key, signature, note_index)
@@ -64,6 +64,20 @@ def subtree_items(root):
 
             item = parent.child(item.row() + 1)
 
+def subtree_indexes(model, parent, first, last):
+    """ Yields indexes of rows from first to last (inclusive) under the specified parent along with
+        indexes of all their descendants. The order is the same as in subtree_items().
+
+        Unlike subtree_items() this function works with any model, not only QStandardItemModel.
+        It's meant to be used in handlers of signals like rowsInserted() that report ranges of rows. """
+
+    for row in range(first, last + 1):
+        index = model.index(row, 0, parent)
+        yield index
+
+        if model.rowCount(index) > 0:
+            yield from subtree_indexes(model, index, 0, model.rowCount(index) - 1)
+
 def all_items(model):
     return islice(subtree_items(model.invisibleRootItem()), 1, None)
 
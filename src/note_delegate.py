@@ -1,23 +1,258 @@
 """ A Qt delegate for models dealing with Note objects """
 
-from PyQt5.QtWidgets import QItemDelegate, QStyle
-from PyQt5.QtGui     import QPixmap, QPen, QPalette
-from PyQt5.QtCore    import Qt, QSize, QPoint, QRect
+from PyQt5.QtWidgets import QItemDelegate, QStyle, QWidget
+from PyQt5.QtGui     import QPixmap, QPainter, QPen, QPalette, QFontMetrics
+from PyQt5.QtCore    import Qt, QSize, QPoint, QRect, QTimer, QEvent, QModelIndex, QPersistentModelIndex
 
+import time
 from datetime import datetime
 
-from .note_edit   import NoteEdit
-from .note_widget import NoteWidget
-from .note        import Note
+from .note_edit           import NoteEdit
+from .note_widget         import NoteWidget
+from .note                import Note
+from .pixmap_cache        import PixmapCache
+from .note_renderer       import NoteRenderer
+from .background_renderer import BackgroundRenderer
+from .body_preview_cache  import BodyPreviewCache
+from .binary_note_file    import MappedNote
 
 class NoteDelegate(QItemDelegate):
+    # Number of characters per line assumed when estimating how many lines the body will wrap into.
+    # NoteWidget asks for enough width to fit roughly this many characters of the body.
+    ESTIMATED_LINE_LENGTH = 80
+
+    # Maximum number of closed editors kept for reuse. Views rarely have more than one editor open at a time.
+    MAX_POOLED_EDITORS = 4
+
     def __init__(self, parent = None):
         super().__init__(parent)
 
-        # A widget painted in display mode. This is NOT the editor widget.
+        # A widget used to compute size hints. This is NOT the editor widget.
         self._display_widget = NoteWidget()
 
+        # Paints notes in display mode. Gives the same result as rendering NoteWidget but does not need to
+        # create a new widget for every note.
+        self._renderer = NoteRenderer()
+
+        # Notes rendered by paint(). Scrolling back to a note that has already been painted is just a matter of copying the pixmap.
+        self._pixmap_cache = PixmapCache()
+
+        # Fills the pixmap cache with notes that are likely to be painted soon
+        self._background_renderer = BackgroundRenderer(self)
+        self._background_renderer.rendered.connect(self._rendered_handler)
+
+        # Heights returned by sizeHint(), indexed by note id. Each one is stored along with the modification time of
+        # the version of the note it was measured for and a flag saying whether it's exact or just an estimate.
+        # Views ask for size hints of all their items in every layout pass.
+        self._heights = {}
+
+        # In this mode sizeHint() returns estimated heights for notes that have not been measured yet.
+        # Exact heights are computed only by measure() and paint().
+        self._estimate_heights = False
+
+        # NOTE: Not using _display_widget here. Its layout does not notice that labels have changed until
+        # the event loop processes its events so the hint would depend on what was measured before.
+        one_line_widget = NoteWidget()
+        one_line_widget.load_note(Note(body = "x", tags = ["x"], created_at = datetime.utcnow()))
+
+        self._one_line_height = one_line_widget.sizeHint().height()
+        self._line_spacing    = QFontMetrics(NoteWidget.body_font()).lineSpacing()
+
+        # NOTE: Each sizeHintChanged() makes the view schedule a layout of all its items. Signals for notes
+        # measured in a single event loop iteration are sent together so that they result in a single layout.
+        self._resized_indexes   = []
+        self._size_change_timer = QTimer(self)
+        self._size_change_timer.setSingleShot(True)
+        self._size_change_timer.setInterval(0)
+
+        self._size_change_timer.timeout.connect(self._emit_size_changes)
+
+        # In preview mode only the beginning of a very long body is shown unless the note has been expanded.
+        # Measuring and painting the whole text of a huge note would make the whole tape slow.
+        self._preview_long_notes = False
+        self._body_preview_cache = BodyPreviewCache()
+        self._expanded_ids       = set()
+
+        # In compact mode every note gets the same height and shows only the first line of its body.
+        # The view can then assume that all rows are equally tall and skip asking for their size hints.
+        self._compact = False
+
+        # Editors closed by the view, waiting to be reused by createEditor(). Constructing a NoteEdit with
+        # all its child widgets each time the user starts editing another note is wasteful.
+        # NOTE: Pooled editors are kept inside a hidden widget. A widget without a parent is a window.
+        self._editor_pool   = []
+        self._editor_holder = QWidget()
+
+        # An optional RenderProfiler that gets timings of paint() and sizeHint()
+        self._profiler = None
+
+    def pixmap_cache(self):
+        """ Returns the cache of rendered notes. Can be used to change its memory budget. """
+
+        return self._pixmap_cache
+
+    def prerender(self, rows):
+        """ Starts rendering notes in the background so that paint() can take them from the cache.
+            rows is a list of (index, width) pairs. Notes are rendered at their exact heights.
+            Any rendering started by a previous call is cancelled. """
+
+        requests = []
+        for (index, width) in rows:
+            note    = index.data(Qt.DisplayRole)
+            size    = QSize(width, self.row_height(note))
+            variant = self.display_variant(note.id)
+            if note.id != None and not self._pixmap_cache.contains(note, size, variant):
+                requests.append((self.displayed_note(note), size, variant))
+
+        self._background_renderer.start(requests)
+
+    def set_profiler(self, profiler):
+        """ Makes paint() and sizeHint() report their timings and cache hits to the specified RenderProfiler.
+            None disables profiling. """
+
+        self._profiler = profiler
+
+    def profiler(self):
+        return self._profiler
+
+    def background_renderer(self):
+        return self._background_renderer
+
+    def set_estimate_heights(self, enabled):
+        """ Enables or disables the mode in which sizeHint() does not measure notes and returns estimated
+            heights instead. The view does not have to wait for all notes to be measured before it can
+            show the first ones. Notes need to be measured with measure() before they become visible. """
+
+        self._estimate_heights = enabled
+
+    def estimate_heights(self):
+        return self._estimate_heights
+
+    def estimated_height(self, note):
+        """ Guesses the height of the note, as displayed in the current mode, from the number and length of lines
+            in its body. Bodies of notes read from a binary tape are not decoded - only their length is used. """
+
+        if isinstance(note, MappedNote):
+            # NOTE: Decoding every body just to guess its height would defeat the purpose of the binary format
+            line_count = self._estimated_line_count(note.body_length())
+            if self.display_variant(note.id) == 'preview':
+                line_count = min(line_count, BodyPreviewCache.MAX_LINES + 1)
+        else:
+            line_count = sum(self._estimated_line_count(len(line)) for line in self.displayed_note(note).body.split('\n'))
+
+        return self._one_line_height + (line_count - 1) * self._line_spacing
+
+    def set_preview_long_notes(self, enabled):
+        """ Enables or disables the mode in which only the beginning of very long bodies is shown.
+            A collapsed note can be expanded by clicking the line at the end of its preview and collapsed
+            again by clicking the line at the end of the whole body. """
+
+        self._preview_long_notes = enabled
+        self._background_renderer.cancel()
+        self._pixmap_cache.clear()
+        self._heights.clear()
+
+    def preview_long_notes(self):
+        return self._preview_long_notes
+
+    def set_compact(self, enabled):
+        """ Enables or disables compact mode. In this mode notes are shown at the height of a note with a
+            single line of text and only the first line of the body is shown. """
+
+        self._compact = enabled
+        self._background_renderer.cancel()
+        self._pixmap_cache.clear()
+
+    def compact(self):
+        return self._compact
+
+    def compact_height(self):
+        return self._one_line_height
+
+    def is_collapsed(self, note):
+        """ Returns True if only a preview of the body of the note is being shown """
+
+        return self._preview_long_notes and note.id not in self._expanded_ids and self._body_preview_cache.get(note) != None
+
+    def is_expanded(self, note):
+        """ Returns True if the note would be collapsed if it had not been expanded by the user """
+
+        return self._preview_long_notes and note.id in self._expanded_ids and self._body_preview_cache.get(note) != None
+
+    def set_note_expanded(self, note_id, expanded):
+        if expanded:
+            self._expanded_ids.add(note_id)
+        else:
+            self._expanded_ids.discard(note_id)
+
+        self._background_renderer.cancel()
+        self._pixmap_cache.invalidate(note_id)
+        self._heights.pop(note_id, None)
+
+    def display_variant(self, note_id):
+        """ Identifies the way the note is displayed in the current mode. Pixmaps of the same version of
+            the note displayed in different ways are cached separately. """
+
+        if self._compact:
+            return 'compact'
+        elif self._preview_long_notes and note_id not in self._expanded_ids:
+            return 'preview'
+        else:
+            return 'full'
+
+    def displayed_note(self, note):
+        """ Returns the note as it's shown in the tape. If it's collapsed, this is a copy with the body
+            replaced with a preview. If it's expanded, the copy has a line that collapses it at the end.
+            Otherwise it's the note itself. """
+
+        if self._compact:
+            body = note.body.partition('\n')[0]
+            if body == note.body:
+                return note
+        elif self.is_collapsed(note):
+            body = self._body_preview_cache.get(note)
+        elif self.is_expanded(note):
+            body = note.body + '\n' + BodyPreviewCache.COLLAPSE_LINE
+        else:
+            return note
+
+        return Note(
+            body        = body,
+            tags        = note.tags,
+            created_at  = note.created_at,
+            modified_at = note.modified_at,
+            id          = note.id
+        )
+
+    def is_measured(self, note):
+        cached_height = self._heights.get(note.id)
+        return cached_height != None and cached_height[0] == note.modified_at and cached_height[2]
+
+    def measure(self, indexes):
+        """ Replaces estimated heights of notes at the specified indexes with exact ones. sizeHintChanged()
+            is emitted for the ones whose height has changed once control returns to the event loop. """
+
+        if self._compact:
+            return
+
+        for index in indexes:
+            note = index.data(Qt.DisplayRole)
+            if note.id == None or self.is_measured(note):
+                continue
+
+            estimated_height = self._note_height(note, measure = False)
+            if self._note_height(note) != estimated_height:
+                self._resized_indexes.append(QPersistentModelIndex(index))
+                self._size_change_timer.start()
+
     def createEditor(self, parent, option, index):
+        if len(self._editor_pool) > 0:
+            # NOTE: setParent() hides the widget. The view shows it once it's ready. The content is replaced
+            # by setEditorData() and NoteEdit.load_note() also clears the undo history of the old note.
+            widget = self._editor_pool.pop()
+            widget.setParent(parent)
+            return widget
+
         widget = NoteEdit(parent)
 
         palette = QPalette(widget.palette())
@@ -28,6 +263,29 @@ class NoteDelegate(QItemDelegate):
 
         return widget
 
+    def destroyEditor(self, editor, index):
+        """ Called by the view when it no longer needs the editor. Instead of being deleted, the editor is
+            detached from the view and kept for reuse unless the pool is already full. """
+
+        if isinstance(editor, NoteEdit) and len(self._editor_pool) < self.MAX_POOLED_EDITORS:
+            # NOTE: The view connects to destroyed() and installs the delegate as an event filter each time
+            # it gets an editor. Qt's views undo that before calling destroyEditor() but we must be sure.
+            # Otherwise the connections would pile up as the editor gets reused.
+            try:
+                editor.destroyed.disconnect()
+            except TypeError:
+                pass
+            editor.removeEventFilter(self)
+
+            editor.hide()
+            editor.setParent(self._editor_holder)
+            self._editor_pool.append(editor)
+        else:
+            super().destroyEditor(editor, index)
+
+    def pooled_editor_count(self):
+        return len(self._editor_pool)
+
     def setEditorData(self, editor, index):
         value = index.model().data(index, Qt.EditRole)
         assert isinstance(value, Note), "Note instance expected, got {}: '{}'".format(value.__class__, value)
@@ -38,13 +296,22 @@ class NoteDelegate(QItemDelegate):
         value = editor.dump_note()
         assert isinstance(value, Note), "Note instance expected, got {}: '{}'".format(value.__class__, value)
 
-        if value.to_dict() != model.data(index, Qt.EditRole).to_dict():
+        old_value = model.data(index, Qt.EditRole)
+        if value.to_dict() != old_value.to_dict():
+            # NOTE: We want the height the view is using at the moment, even if it's just an estimate
+            old_height = self.row_height(old_value, measure = not self._estimate_heights)
+
+            self._background_renderer.cancel()
+            self._pixmap_cache.invalidate(value.id)
+            self._body_preview_cache.invalidate(value.id)
+            self._heights.pop(value.id, None)
             model.setData(index, value, Qt.EditRole)
 
             # NOTE: sizeHintChanged() is quite heavy if there are a lot of notes becase it makes
             # some views (most notably QListView) call sizeHint() on every model item.
             # We want to emit it only if the size actually changed.
-            self.sizeHintChanged.emit(index)
+            if self.row_height(value) != old_height:
+                self.sizeHintChanged.emit(index)
 
     def _draw_focus_frame(self, painter, rect, width):
         pen = QPen()
@@ -55,31 +322,38 @@ class NoteDelegate(QItemDelegate):
         painter.drawRect(QRect(rect.x() + width // 2, rect.y() + width // 2, rect.width() - width, rect.height() - width))
 
     def paint(self, painter, option, index):
+        if self._profiler != None:
+            start_time = time.perf_counter()
+
         value = index.model().data(index, Qt.DisplayRole)
         assert isinstance(value, Note), "Note instance expected, got {}: '{}'".format(value.__class__, value)
 
+        # A note is about to be shown with an estimated height. Normally it should have been measured earlier.
+        if self._estimate_heights and not self._compact and value.id != None and not self.is_measured(value):
+            self.measure([index])
+
         if option.rect.width() > 0 and option.rect.height() > 0:
             painter.save()
 
-            # FIXME: It would be more efficient to create the widget in __init__() and then just
-            # replace the note with load_note() but it does not work. Its labels retain don't update
-            # their height immediately after setText(), probably because they're using signals to
-            # communicate with the layout and these signals are processed asynchronously by Qt event loop.
-            # As a result, the widget ignores resize() call and remains at the size corresponding to the
-            # previous note - the look of the note is different depending on which other note was painted before.
-            display_widget = NoteWidget()
-            display_widget.load_note(value)
-            display_widget.resize(option.rect.size())
-
-            # If the widget refuses to change its size, it might indicate a layout problem (see note above).
-            assert display_widget.size() == option.rect.size(), "Wanted to resize widget to {}x{} but it insists on {}x{}".format(
-                option.rect.size().width(),    option.rect.size().height(),
-                display_widget.size().width(), display_widget.size().height()
-            )
-
-            # FIXME: Draw the widget directly, without the intermediate pixmap
-            pixmap = QPixmap(option.rect.size())
-            display_widget.render(pixmap)
+            # NOTE: Items at different nesting levels have different widths so the width of the whole view
+            # is the only reliable way to detect that it has been resized.
+            if option.widget != None and option.widget.width() != self._pixmap_cache.view_width():
+                self._background_renderer.cancel()
+                self._pixmap_cache.set_view_width(option.widget.width())
+
+            variant    = self.display_variant(value.id)
+            pixmap     = self._pixmap_cache.get(value, option.rect.size(), variant)
+            pixmap_hit = pixmap != None
+            if not pixmap_hit:
+                if self._profiler != None:
+                    render_start_time = time.perf_counter()
+
+                pixmap = self._render_note(self.displayed_note(value), option.rect.size())
+                self._pixmap_cache.put(value, option.rect.size(), pixmap, variant)
+
+                if self._profiler != None:
+                    self._profiler.record_render(value, time.perf_counter() - render_start_time)
+
             painter.drawPixmap(option.rect.topLeft(), pixmap)
 
             if option.state & QStyle.State_Selected:
@@ -87,21 +361,127 @@ class NoteDelegate(QItemDelegate):
 
             painter.restore()
 
+            if self._profiler != None:
+                self._profiler.record_paint(time.perf_counter() - start_time, pixmap_hit)
+
+    def _render_note(self, note, size):
+        pixmap = QPixmap(size)
+
+        painter = QPainter(pixmap)
+        self._renderer.paint(painter, note, QRect(QPoint(0, 0), size))
+        painter.end()
+
+        return pixmap
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            value = index.data(Qt.DisplayRole)
+            if value.id != None and not self._compact and (self.is_collapsed(value) or self.is_expanded(value)):
+                if self._toggle_line_rect(value, option.rect).contains(event.pos()):
+                    self.set_note_expanded(value.id, self.is_collapsed(value))
+                    self.sizeHintChanged.emit(index)
+                    return True
+
+        return super().editorEvent(event, model, option, index)
+
+    def _toggle_line_rect(self, note, rect):
+        """ Returns the area occupied by the last line of the body, i.e. the one that expands a collapsed note
+            or collapses an expanded one when clicked """
+
+        (body_rect, tag_rect, timestamp_rect) = self._renderer.layout(self.displayed_note(note), rect)
+        return QRect(body_rect.left(), body_rect.bottom() + 1 - self._line_spacing, body_rect.width(), self._line_spacing)
+
     def updateEditorGeometry(self, editor, option, index):
         # FIXME: Why do I have to make the editor 3 pixels smaller on each side to make it have the same size
         # as the one I draw in paint()?
         editor.setGeometry(QRect(option.rect.x() + 3, option.rect.y() + 3, option.rect.width() - 6, option.rect.height() - 6))
 
     def sizeHint(self, option, index):
+        if self._profiler != None:
+            start_time = time.perf_counter()
+
         value = index.model().data(index, Qt.DisplayRole)
         assert isinstance(value, Note), "Note instance expected, got {}: '{}'".format(value.__class__, value)
 
-        # NOTE: While there are problems with updating widget size after changing label text (see note in paint()),
-        # sizeHint() works correctly so it's not necessary to create a new widget here. It's important because
-        # sizeHint() is called much more often than paint() and must execute quickly.
-        self._display_widget.load_note(value)
+        # NOTE: Notes without ids can't be measured later because their heights can't be cached
+        measure = not self._estimate_heights or value.id == None
+
+        if self._profiler != None:
+            height_hit = self._compact or self._cached_height(value, measure) != None
 
         # Ignore width suggested by widget. We want the label to be cut off at some point if it's too long.
         # We don't want the horizontal scroll bar inside the list view.
-        hint = self._display_widget.sizeHint()
-        return QSize(option.rect.width(), hint.height())
+        size = QSize(option.rect.width(), self.row_height(value, measure))
+
+        if self._profiler != None:
+            self._profiler.record_size_hint(time.perf_counter() - start_time, height_hit)
+
+        return size
+
+    def row_height(self, note, measure = True):
+        """ Returns the height of the row the note is displayed in """
+
+        if self._compact:
+            return self._one_line_height
+
+        return self._note_height(note, measure)
+
+    def _cached_height(self, note, measure = True):
+        """ Returns the height of the note from the cache or None if it's not there. If measure is True,
+            estimated heights are not accepted. """
+
+        if note.id == None:
+            return None
+
+        cached_height = self._heights.get(note.id)
+        if cached_height != None and cached_height[0] == note.modified_at and (cached_height[2] or not measure):
+            return cached_height[1]
+
+        return None
+
+    def _note_height(self, note, measure = True):
+        """ Returns the height of the note. If measure is False, the note is not measured and an estimate
+            is returned instead unless the exact height is already known. """
+
+        # NOTE: The height does not depend on the width of the view so there's no need to measure
+        # the notes again when the view is resized. Only a new version of the note invalidates it.
+        cached_height = self._cached_height(note, measure)
+        if cached_height != None:
+            return cached_height
+
+        if measure:
+            # NOTE: Labels don't update their geometry immediately after setText() because they communicate with
+            # the layout through events processed asynchronously by Qt event loop. sizeHint() works correctly
+            # anyway so it's not necessary to create a new widget here. It's important because sizeHint() is
+            # called much more often than paint() and must execute quickly.
+            self._display_widget.load_note(self.displayed_note(note))
+            height = self._display_widget.sizeHint().height()
+        else:
+            height = self.estimated_height(note)
+
+        if note.id != None:
+            self._heights[note.id] = (note.modified_at, height, measure)
+
+        return height
+
+    @classmethod
+    def _estimated_line_count(cls, text_length):
+        return max(1, (text_length + cls.ESTIMATED_LINE_LENGTH - 1) // cls.ESTIMATED_LINE_LENGTH)
+
+    def _rendered_handler(self, note, size, variant, image):
+        # NOTE: Results of cancelled runs never get here but the note could still have been measured again
+        # after the request was made. An image of the wrong height would never be taken from the cache.
+        height = self._one_line_height if self._compact else self._cached_height(note)
+        if height != size.height() or variant != self.display_variant(note.id):
+            return
+
+        # NOTE: Images come from the worker thread. They can be converted to pixmaps only here, in the GUI thread.
+        self._pixmap_cache.put(note, size, QPixmap.fromImage(image), variant)
+
+    def _emit_size_changes(self):
+        resized_indexes       = self._resized_indexes
+        self._resized_indexes = []
+
+        for index in resized_indexes:
+            if index.isValid():
+                self.sizeHintChanged.emit(QModelIndex(index))
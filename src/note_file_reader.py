@@ -0,0 +1,129 @@
+""" Reads note files incrementally. The notes are decoded one by one as the file is being read so that
+    neither the whole content of the file nor the whole list of decoded dicts has to be kept in memory. """
+
+import hashlib
+import re
+
+import simplejson
+
+WHITESPACE_PATTERN = re.compile(r'[ \t\n\r]*')
+
+class NoteFileReader:
+    # Number of characters read from the file at a time
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, json_file, progress_callback = None, chunk_size = CHUNK_SIZE):
+        """ json_file is a file opened in text mode and containing a JSON array. progress_callback, if given,
+            is called with the number of bytes read so far after each chunk. """
+
+        self._json_file         = json_file
+        self._progress_callback = progress_callback
+        self._chunk_size        = chunk_size
+        self._decoder           = simplejson.JSONDecoder()
+
+        # NOTE: index_store.content_key() is a hash of the UTF-8 encoded content. The encoding of a string is
+        # the concatenation of the encodings of its parts so the hash can be computed chunk by chunk.
+        self._content_hash = hashlib.sha1()
+        self._bytes_read   = 0
+
+        self._buffer   = ''
+        self._position = 0
+        self._eof      = False
+
+    def bytes_read(self):
+        return self._bytes_read
+
+    def content_key(self):
+        """ Returns the same key index_store.content_key() would return for the whole content of the file.
+            Available only after all notes have been read. """
+
+        assert self._eof
+        return self._content_hash.hexdigest()
+
+    def raw_notes(self):
+        """ Yields the elements of the array one by one. Raises simplejson.JSONDecodeError if the file
+            does not contain a valid JSON array. Can be used only once. """
+
+        self._skip_whitespace()
+        self._expect('[')
+
+        self._skip_whitespace()
+        if self._peek() == ']':
+            self._position += 1
+        else:
+            while True:
+                yield self._decode_value()
+
+                self._skip_whitespace()
+                if self._peek() == ']':
+                    self._position += 1
+                    break
+
+                self._expect(',')
+                self._skip_whitespace()
+
+        self._skip_whitespace()
+        if self._peek() != None:
+            raise simplejson.JSONDecodeError("Extra data", self._buffer, self._position)
+
+    def _read_chunk(self):
+        """ Appends the next chunk of the file to the buffer. Returns False if there's nothing left to read. """
+
+        if self._eof:
+            return False
+
+        chunk = self._json_file.read(self._chunk_size)
+        if chunk == '':
+            self._eof = True
+            return False
+
+        encoded_chunk = chunk.encode('utf-8')
+        self._content_hash.update(encoded_chunk)
+        self._bytes_read += len(encoded_chunk)
+
+        # Drop the part that has already been decoded
+        self._buffer   = self._buffer[self._position:] + chunk
+        self._position = 0
+
+        if self._progress_callback != None:
+            self._progress_callback(self._bytes_read)
+
+        return True
+
+    def _peek(self):
+        """ Returns the next character or None at the end of the file """
+
+        while self._position >= len(self._buffer):
+            if not self._read_chunk():
+                return None
+
+        return self._buffer[self._position]
+
+    def _skip_whitespace(self):
+        while True:
+            self._position = WHITESPACE_PATTERN.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer) or not self._read_chunk():
+                return
+
+    def _expect(self, character):
+        if self._peek() != character:
+            raise simplejson.JSONDecodeError("Expecting '{}'".format(character), self._buffer, self._position)
+
+        self._position += 1
+
+    def _decode_value(self):
+        while True:
+            try:
+                (value, end) = self._decoder.raw_decode(self._buffer, self._position)
+            except simplejson.JSONDecodeError:
+                # The value may just be cut off at the end of the chunk
+                if not self._read_chunk():
+                    raise
+                continue
+
+            # NOTE: Numbers and literals are not terminated by any character so they might continue in the next chunk
+            if end == len(self._buffer) and self._read_chunk():
+                continue
+
+            self._position = end
+            return value
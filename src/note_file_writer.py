@@ -0,0 +1,53 @@
+""" Writes note files in a way that never leaves a half-written file behind """
+
+import os
+import stat
+import tempfile
+
+import simplejson
+
+# NOTE: os.umask() can only be read by changing it, which is not safe once the autosaver's worker thread is running
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def serialize_notes(raw_notes):
+    """ Converts dicts returned by dump_notes() into the content of a note file """
+
+    if __debug__:
+        return simplejson.dumps(raw_notes, indent = 4, sort_keys = True)
+    else:
+        return simplejson.dumps(raw_notes)
+
+def write_atomically(file_name, content):
+    """ Writes the content to a temporary file in the same directory and then puts it in place of the
+        original file. If anything goes wrong, the original file remains intact. The content can be
+        either a string or bytes. If the file is a symbolic link, the file it points to is replaced. """
+
+    # NOTE: Replacing the link itself would turn it into a regular file
+    file_name = os.path.realpath(file_name)
+
+    (file_descriptor, temporary_path) = tempfile.mkstemp(
+        dir    = os.path.dirname(file_name),
+        prefix = os.path.basename(file_name) + '.',
+        suffix = '.tmp'
+    )
+
+    try:
+        with open(file_descriptor, 'wb' if isinstance(content, bytes) else 'w') as temporary_file:
+            temporary_file.write(content)
+            temporary_file.flush()
+
+            # NOTE: mkstemp() makes the file readable only by its owner. The new file should have the same
+            # permissions as the one it replaces or as a file created with open().
+            try:
+                mode = stat.S_IMODE(os.stat(file_name).st_mode)
+            except FileNotFoundError:
+                mode = 0o666 & ~UMASK
+            os.chmod(temporary_file.fileno(), mode)
+
+            os.fsync(temporary_file.fileno())
+
+        os.replace(temporary_path, file_name)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
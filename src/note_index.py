@@ -0,0 +1,352 @@
+""" An inverted index that maps words, trigrams and tags to ids of the notes containing them.
+    Also keeps notes sorted by timestamps to make it possible to quickly find notes from a date range. """
+
+import re
+from bisect      import bisect_left, insort
+from collections import defaultdict
+
+class NoteIndex:
+    WORD_PATTERN = re.compile(r'\w+')
+
+    def __init__(self):
+        self._notes       = {}
+        self._word_ids    = defaultdict(set)
+        self._trigram_ids = defaultdict(set)
+        self._tag_ids     = defaultdict(set)
+        self._max_id      = 0
+
+        # Incremented before every change. See revision().
+        self._revision = 0
+
+        # Like _tag_ids but with casefolded tags as keys
+        self._casefolded_tag_ids = defaultdict(set)
+
+        # All indexed words in alphabetical order. Built only when needed and discarded whenever
+        # a word is added or removed from the index.
+        self._sorted_words = None
+
+        # Sorted lists of (timestamp, id) pairs
+        self._timestamps = {
+            'created_at':  [],
+            'modified_at': []
+        }
+
+    @classmethod
+    def split_words(cls, text):
+        return set(cls.WORD_PATTERN.findall(text.casefold()))
+
+    @classmethod
+    def split_trigrams(cls, text):
+        casefolded_text = text.casefold()
+        return set(casefolded_text[i:i + 3] for i in range(len(casefolded_text) - 2))
+
+    @classmethod
+    def note_terms(cls, note):
+        """ Returns a tuple of three sets: words found in note body and tags, trigrams found in them
+            and the tags themselves. Trigrams never span more than one tag or tag and body.
+
+            Does not depend on the state of any index and can be safely called from any thread. """
+
+        words    = cls.split_words(note.body)
+        trigrams = cls.split_trigrams(note.body)
+        for tag in note.tags:
+            words    |= cls.split_words(tag)
+            trigrams |= cls.split_trigrams(tag)
+
+        return (words, trigrams, set(note.tags))
+
+    def add_note(self, note, terms = None):
+        """ Adds the note to the index. Notes without ids can't be indexed and are ignored.
+
+            terms, if specified, must be the value that note_terms() would return for the note.
+            Useful if they have been computed in advance, e.g. in a background thread or loaded from disk.
+
+            Returns True if the note has been indexed. """
+
+        if note.id == None:
+            return False
+
+        self._revision += 1
+
+        if note.id in self._notes:
+            self.remove_note(note.id)
+
+        (words, trigrams, tags) = terms if terms != None else self.note_terms(note)
+
+        for word in words:
+            if not word in self._word_ids:
+                self._sorted_words = None
+
+            self._word_ids[word].add(note.id)
+        for trigram in trigrams:
+            self._trigram_ids[trigram].add(note.id)
+        for tag in tags:
+            self._tag_ids[tag].add(note.id)
+            self._casefolded_tag_ids[tag.casefold()].add(note.id)
+        for (attribute, timestamps) in self._timestamps.items():
+            insort(timestamps, (getattr(note, attribute), note.id))
+
+        self._notes[note.id] = note
+        self._max_id         = max(self._max_id, note.id)
+
+        return True
+
+    def remove_note(self, note_id):
+        if not note_id in self._notes:
+            return
+
+        self._revision += 1
+
+        # NOTE: Indexed notes are never modified in place so their terms can be computed again instead of being stored
+        note = self._notes.pop(note_id)
+        (words, trigrams, tags) = self.note_terms(note)
+
+        for (attribute, timestamps) in self._timestamps.items():
+            position = bisect_left(timestamps, (getattr(note, attribute), note_id))
+            assert timestamps[position] == (getattr(note, attribute), note_id)
+            del timestamps[position]
+
+        if self._discard_postings(self._word_ids, words, note_id) > 0:
+            self._sorted_words = None
+        self._discard_postings(self._trigram_ids, trigrams, note_id)
+        self._discard_postings(self._tag_ids,     tags,     note_id)
+        self._discard_postings(self._casefolded_tag_ids, set(tag.casefold() for tag in tags), note_id)
+
+    def postings(self):
+        """ Returns dicts that map words, trigrams and tags to sets of ids of notes containing them.
+
+            The dicts should be treated as read-only. They're meant to be saved and passed to load_postings() later. """
+
+        return (self._word_ids, self._trigram_ids, self._tag_ids)
+
+    def load_postings(self, notes, word_ids, trigram_ids, tag_ids):
+        """ Replaces the content of the index with postings saved earlier. Much faster than adding the notes one by one.
+
+            The postings must describe exactly the specified notes: they must not contain any other ids and
+            the notes must not have changed since the postings were saved. The index takes ownership of the sets of ids. """
+
+        self.clear()
+
+        self._word_ids    = defaultdict(set, word_ids)
+        self._trigram_ids = defaultdict(set, trigram_ids)
+        self._tag_ids     = defaultdict(set, tag_ids)
+
+        for (tag, ids) in self._tag_ids.items():
+            self._casefolded_tag_ids[tag.casefold()] |= ids
+
+        for note in notes:
+            assert note.id != None
+            self._notes[note.id] = note
+            self._max_id         = max(self._max_id, note.id)
+
+        for (attribute, timestamps) in self._timestamps.items():
+            timestamps.extend(sorted((getattr(note, attribute), note.id) for note in notes))
+
+    def update_note(self, note):
+        """ Replaces an indexed note with a new version that has the same id. """
+
+        return self.add_note(note)
+
+    def clear(self):
+        self._revision += 1
+
+        self._notes.clear()
+        self._word_ids.clear()
+        self._trigram_ids.clear()
+        self._tag_ids.clear()
+        self._casefolded_tag_ids.clear()
+        self._max_id       = 0
+        self._sorted_words = None
+
+        for timestamps in self._timestamps.values():
+            timestamps.clear()
+
+    def __len__(self):
+        return len(self._notes)
+
+    def contains(self, note):
+        """ Checks whether this exact note object (not just a note with the same id) is in the index. """
+
+        return note.id != None and self._notes.get(note.id) is note
+
+    def note(self, note_id):
+        return self._notes[note_id]
+
+    def ids(self):
+        return self._notes.keys()
+
+    def revision(self):
+        """ Returns a number that changes whenever notes are added to or removed from the index. It changes before
+            the postings do so a reader in another thread can tell that they have changed while it was reading them. """
+
+        return self._revision
+
+    def reserve_id(self, note_id):
+        """ Makes sure that next_id() won't return the id even if no note with that id is indexed """
+
+        self._max_id = max(self._max_id, note_id)
+
+    def next_id(self):
+        """ Returns an id not used by any note that has ever been put in the index """
+
+        return self._max_id + 1
+
+    def word_ids(self, word):
+        return self._word_ids.get(word.casefold(), set())
+
+    def has_word(self, word):
+        return word in self._word_ids
+
+    def words_with_prefix(self, prefix, limit = None):
+        """ Returns indexed words starting with the prefix (including the prefix itself if it's a word)
+            in alphabetical order. The prefix must be casefolded. """
+
+        if self._sorted_words == None:
+            self._sorted_words = sorted(self._word_ids.keys())
+
+        words = []
+        for i in range(bisect_left(self._sorted_words, prefix), len(self._sorted_words)):
+            if not self._sorted_words[i].startswith(prefix) or limit != None and len(words) >= limit:
+                break
+
+            words.append(self._sorted_words[i])
+
+        return words
+
+    def trigram_ids(self, trigram):
+        return self._trigram_ids.get(trigram.casefold(), set())
+
+    def tag_ids(self, tag):
+        return self._tag_ids.get(tag, set())
+
+    def casefolded_tag_ids(self, casefolded_tag):
+        """ Returns ids of notes having a tag that is equal to the specified one after casefolding """
+
+        return set(self._casefolded_tag_ids.get(casefolded_tag, set()))
+
+    def casefolded_tag_count(self, casefolded_tag):
+        """ Returns the number of notes that casefolded_tag_ids() would return, without building the set """
+
+        return len(self._casefolded_tag_ids.get(casefolded_tag, ()))
+
+    def tags(self):
+        return self._tag_ids.keys()
+
+    def tag_counts(self):
+        """ Returns a dict that maps tags to the numbers of notes having them. Tags that differ only in
+            letter case are counted together and represented by the alphabetically first spelling. """
+
+        spellings = {}
+        for tag in self._tag_ids.keys():
+            casefolded_tag = tag.casefold()
+            if not casefolded_tag in spellings or tag < spellings[casefolded_tag]:
+                spellings[casefolded_tag] = tag
+
+        return {tag: len(self._casefolded_tag_ids[casefolded_tag]) for (casefolded_tag, tag) in spellings.items()}
+
+    def date_range_ids(self, attribute, lower_bound, upper_bound):
+        """ Returns ids of notes with the timestamp attribute in range [lower_bound, upper_bound).
+            None means that the range is not bounded on that side. """
+
+        (start, end) = self._date_range_positions(attribute, lower_bound, upper_bound)
+        return set(id for (timestamp, id) in self._timestamps[attribute][start:end])
+
+    def date_range_count(self, attribute, lower_bound, upper_bound):
+        (start, end) = self._date_range_positions(attribute, lower_bound, upper_bound)
+        return max(0, end - start)
+
+    def candidate_count_estimate(self, fixed_string):
+        """ Returns an upper bound on the number of notes that candidate_ids() would return for the string.
+            Much cheaper to compute than the candidates themselves. """
+
+        query = fixed_string.casefold()
+        if len(query) < 3:
+            return len(self._notes)
+
+        return min(len(self._trigram_ids.get(trigram, ())) for trigram in self.split_trigrams(query))
+
+    def candidate_ids(self, fixed_string):
+        """ Returns ids of notes that may contain the string. Each note that does contain it is guaranteed
+            to be in the result but there may be false positives. The candidates need to be verified. """
+
+        query = fixed_string.casefold()
+
+        if len(query) >= 3:
+            return self._trigram_candidate_ids(query)
+        else:
+            return self._word_candidate_ids(query)
+
+    def _trigram_candidate_ids(self, query):
+        assert len(query) >= 3
+
+        # NOTE: A note can contain the string only if it contains all its trigrams. Starting with the
+        # rarest ones keeps intermediate sets small and lets us stop early if there are no candidates.
+        postings = sorted(
+            (self._trigram_ids.get(trigram, set()) for trigram in self.split_trigrams(query)),
+            key = len
+        )
+
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            if len(candidates) == 0:
+                break
+
+            candidates &= ids
+
+        return candidates
+
+    def _word_candidate_ids(self, query):
+        # NOTE: Every word found in the query must be a part of some word in a matching note. What is more,
+        # if there's a non-word character before or after the word in the query, the note must contain
+        # a word with the same beginning or ending respectively. Words enclosed on both sides must be
+        # present in the note verbatim and can be found without scanning the vocabulary.
+        candidates = None
+        for match in self.WORD_PATTERN.finditer(query):
+            word           = match.group()
+            bounded_before = match.start() > 0
+            bounded_after  = match.end()   < len(query)
+
+            if bounded_before and bounded_after:
+                word_ids = self._word_ids.get(word, set())
+            else:
+                word_ids = set()
+                for indexed_word, ids in self._word_ids.items():
+                    if (
+                        bounded_before and indexed_word.startswith(word) or
+                        bounded_after  and indexed_word.endswith(word)   or
+                        not bounded_before and not bounded_after and word in indexed_word
+                    ):
+                        word_ids |= ids
+
+            candidates = set(word_ids) if candidates == None else candidates & word_ids
+            if len(candidates) == 0:
+                break
+
+        if candidates == None:
+            # There are no words in the query so the index can't tell us anything.
+            return set(self._notes.keys())
+
+        return candidates
+
+    def _date_range_positions(self, attribute, lower_bound, upper_bound):
+        timestamps = self._timestamps[attribute]
+
+        # NOTE: A tuple with only the timestamp is smaller than any (timestamp, id) pair with the same timestamp
+        start = bisect_left(timestamps, (lower_bound,)) if lower_bound != None else 0
+        end   = bisect_left(timestamps, (upper_bound,)) if upper_bound != None else len(timestamps)
+
+        return (start, end)
+
+    @classmethod
+    def _discard_postings(cls, postings, terms, note_id):
+        """ Removes the note from postings of the terms. Returns the number of terms that no longer have any postings. """
+
+        num_removed_terms = 0
+        for term in terms:
+            ids = postings[term]
+            ids.discard(note_id)
+            if len(ids) == 0:
+                del postings[term]
+                num_removed_terms += 1
+
+        return num_removed_terms
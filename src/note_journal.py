@@ -0,0 +1,234 @@
+""" Records changes made to the tape in a journal file next to the note file. Saving the tape is then just
+    a matter of appending a few lines to the journal instead of rewriting the whole note file. The note file
+    is rewritten only once in a while, when the journal gets too big (compaction).
+
+    The journal is a sequence of JSON objects, one per line. The first one identifies the note file the
+    journal applies to by its content key (see index_store). Each of the others describes one change:
+
+    - {"operation": "add",    "note": {...}} - a new note. The dict has the same format as the ones
+      produced by dump_notes(). parent_id and prev_sibling_id tell where it has been inserted.
+    - {"operation": "edit",   "note": {...}} - a new version of an existing note. Position is unchanged.
+    - {"operation": "remove", "ids": [...]}  - removal of a note (the first id) along with all its descendants.
+
+    Moving a note is recorded as its removal followed by an addition. """
+
+import os
+
+import simplejson
+
+from PyQt5.QtCore import QObject, QTimer, Qt
+from PyQt5.QtGui  import QStandardItem
+
+from .model_helpers      import all_items, subtree_indexes
+from .note               import Note, MissingProperties, WrongAttributeType, InvalidTagCharacter
+from .note_model_helpers import item_to_note, set_item_note, note_link
+
+JOURNAL_SUFFIX = '.journal'
+
+class InvalidJournal(Exception): pass
+
+def journal_path(file_name):
+    return file_name + JOURNAL_SUFFIX
+
+def read_journal(file_name, key):
+    """ Returns changes recorded in the journal of the note file. Returns an empty list if there is no journal
+        or if it was written for a different version of the note file. A line cut off by a crash is ignored. """
+
+    try:
+        with open(journal_path(file_name), 'r') as journal_file:
+            lines = journal_file.read().split('\n')
+    except OSError:
+        return []
+
+    entries = []
+    for line in lines:
+        try:
+            entries.append(simplejson.loads(line))
+        except simplejson.JSONDecodeError:
+            # NOTE: Lines are written whole so only the last one can be damaged
+            break
+
+    if len(entries) == 0 or entries[0].get('key') != key:
+        return []
+
+    return entries[1:]
+
+def replay_journal(model, file_name, key):
+    """ Applies changes recorded in the journal of the note file to a model loaded from that file.
+        Returns the number of changes applied. Raises InvalidJournal if a change refers to notes that are
+        not in the model or can't be interpreted. The model may be partially modified in that case. """
+
+    entries = read_journal(file_name, key)
+    if len(entries) == 0:
+        return 0
+
+    items = {item_to_note(item).id: item for item in all_items(model)}
+
+    def parent_item(parent_id):
+        return items[parent_id] if parent_id != None else model.invisibleRootItem()
+
+    for (position, entry) in enumerate(entries, 1):
+        try:
+            if entry['operation'] == 'add':
+                note = Note.from_dict(entry['note'])
+                item = QStandardItem()
+                set_item_note(item, note)
+
+                prev_sibling_id = entry['note']['prev_sibling_id']
+                parent_item(entry['note']['parent_id']).insertRow(items[prev_sibling_id].row() + 1 if prev_sibling_id != None else 0, item)
+                items[note.id] = item
+            elif entry['operation'] == 'edit':
+                note = Note.from_dict(entry['note'])
+                set_item_note(items[note.id], note)
+            elif entry['operation'] == 'remove':
+                item = items[entry['ids'][0]]
+
+                # NOTE: parent() of top-level items is None rather than invisibleRootItem(). See note_link().
+                parent = item.parent() if item.parent() != None else model.invisibleRootItem()
+                parent.takeRow(item.row())
+
+                for note_id in entry['ids']:
+                    del items[note_id]
+            else:
+                raise InvalidJournal("Change {} has unknown operation '{}'".format(position, entry['operation']))
+        except (KeyError, IndexError, TypeError, ValueError, MissingProperties, WrongAttributeType, InvalidTagCharacter) as error:
+            raise InvalidJournal("Change {} can't be applied: {!r}".format(position, error))
+
+    return len(entries)
+
+class NoteJournal(QObject):
+    # Changes are written to the disk in batches, at most this many milliseconds after they're made.
+    # Calling fsync() after every single change would make typing slow.
+    FLUSH_INTERVAL = 1000
+
+    # The journal is not worth compacting until it's at least this big (in bytes)
+    MIN_COMPACTION_SIZE = 1024 * 1024
+
+    def __init__(self, file_name, key, parent = None):
+        """ Opens the journal of the note file with the specified content key. If the journal has been
+            written for a different version of the file, it's discarded and a new one is started.
+            Changes already in the journal should be replayed before it's opened. """
+
+        super().__init__(parent)
+
+        self._file_name     = file_name
+        self._model         = None
+        self._pending_lines = []
+        self._journal_file  = None
+
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(self.FLUSH_INTERVAL)
+
+        self._flush_timer.timeout.connect(self.flush)
+
+        # NOTE: The journal is rewritten rather than appended to. If its last line has been cut off,
+        # new lines must not end up glued to it.
+        self._rewrite(key, read_journal(file_name, key))
+
+    def key(self):
+        return self._key
+
+    def entry_count(self):
+        """ Returns the number of changes in the journal, including ones that have not been flushed yet """
+
+        return self._entry_count
+
+    def restart(self, key, position):
+        """ Starts a new journal for a new version of the note file that already contains the first
+            position changes from the current journal. The remaining changes are carried over. """
+
+        self.flush()
+        self._rewrite(key, read_journal(self._file_name, self._key)[position:])
+
+    def set_model(self, model):
+        """ Starts recording changes made to the model. Changes made to the previous model are no longer recorded. """
+
+        if self._model != None:
+            self._model.rowsInserted.disconnect(self._rows_inserted_handler)
+            self._model.rowsAboutToBeRemoved.disconnect(self._rows_about_to_be_removed_handler)
+            self._model.dataChanged.disconnect(self._data_changed_handler)
+
+        self._model = model
+
+        if model != None:
+            model.rowsInserted.connect(self._rows_inserted_handler)
+            model.rowsAboutToBeRemoved.connect(self._rows_about_to_be_removed_handler)
+            model.dataChanged.connect(self._data_changed_handler)
+
+    def size(self):
+        """ Returns the number of bytes in the journal, including changes that have not been flushed yet """
+
+        return self._journal_file.tell() + sum(len(line.encode('utf-8')) + 1 for line in self._pending_lines)
+
+    def needs_compaction(self):
+        """ Checks if it would be better to save the whole tape and start a new journal. That's when replaying
+            the journal takes longer than reading the note file. """
+
+        return self.size() > max(self.MIN_COMPACTION_SIZE, self._snapshot_size)
+
+    def flush(self):
+        """ Writes pending changes to the disk and waits until they're really there """
+
+        self._flush_timer.stop()
+        if len(self._pending_lines) == 0:
+            return
+
+        self._journal_file.write(''.join(line + '\n' for line in self._pending_lines))
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+
+        self._pending_lines = []
+
+    def close(self):
+        self.set_model(None)
+        self.flush()
+        self._journal_file.close()
+
+    def _rewrite(self, key, entries):
+        # NOTE: A new file replaces the old one only once it's complete
+        temporary_path = journal_path(self._file_name) + '.tmp'
+        with open(temporary_path, 'w') as temporary_file:
+            temporary_file.write(''.join(simplejson.dumps(entry) + '\n' for entry in [{'key': key}] + entries))
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+
+        if self._journal_file != None:
+            self._journal_file.close()
+
+        os.replace(temporary_path, journal_path(self._file_name))
+
+        self._journal_file  = open(journal_path(self._file_name), 'a')
+        self._key           = key
+        self._entry_count   = len(entries)
+        self._snapshot_size = os.path.getsize(self._file_name)
+
+    def _record(self, entry):
+        self._pending_lines.append(simplejson.dumps(entry))
+        self._entry_count += 1
+
+        # NOTE: Restarting the timer on every change would postpone flushing for as long as the user keeps typing
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+    def _note_dict(self, item):
+        note_dict = item_to_note(item).to_dict()
+        (note_dict['parent_id'], note_dict['prev_sibling_id']) = note_link(self._model, item)
+
+        return note_dict
+
+    def _rows_inserted_handler(self, parent, first, last):
+        # NOTE: Descendants come after their ancestors and previous siblings before next ones
+        # so that each note can be inserted in the right place when the journal is replayed.
+        for index in subtree_indexes(self._model, parent, first, last):
+            self._record({'operation': 'add', 'note': self._note_dict(self._model.itemFromIndex(index))})
+
+    def _rows_about_to_be_removed_handler(self, parent, first, last):
+        for row in range(first, last + 1):
+            ids = [self._model.data(index, Qt.EditRole).id for index in subtree_indexes(self._model, parent, row, row)]
+            self._record({'operation': 'remove', 'ids': ids})
+
+    def _data_changed_handler(self, top_left, bottom_right):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            item = self._model.itemFromIndex(self._model.index(row, 0, top_left.parent()))
+            self._record({'operation': 'edit', 'note': self._note_dict(item)})
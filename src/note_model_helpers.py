@@ -54,7 +54,38 @@ def assign_note_ids(model):
 
     return num_empty_ids
 
-def dump_notes(model):
+def note_link(model, item):
+    """ Returns (parent_id, prev_sibling_id) pair describing the position of the item in the tree """
+
+    # There is an old bug in Qt that causes the parent() of top-level items in QStandardItemModel
+    # to return None rather than invisibleRootItem(). This was supposedly fixed a year ago but I'm
+    # experiencing it with both python-pyqt4 4.10.2/qt4 4.8.5 and pyqt5 5.0/qt5 5.1.0 on Arch Linux.
+    # See https://bugreports.qt-project.org/browse/QTBUG-18785
+    if item.parent() in [None, model.invisibleRootItem()]:
+        parent_id       = None
+        prev_sibling_id = item_to_note(model.item(item.row() - 1)).id if item.row() > 0 else None
+    else:
+        parent_id       = item_to_note(item.parent()).id
+        prev_sibling_id = item_to_note(item.parent().child(item.row() - 1)).id if item.row() > 0 else None
+
+    return (parent_id, prev_sibling_id)
+
+def note_links(model):
+    """ Yields (note, parent_id, prev_sibling_id) tuples describing the position of every note in the tree.
+        All notes must already have ids. """
+
+    for item in all_items(model):
+        note = item_to_note(item)
+        assert note.id != None
+
+        (parent_id, prev_sibling_id) = note_link(model, item)
+        yield (note, parent_id, prev_sibling_id)
+
+def snapshot_notes(model):
+    """ Returns a list of (note, parent_id, prev_sibling_id) tuples describing the current state of the model.
+        Notes are replaced rather than modified when edited so the snapshot stays valid after the model changes
+        and can be safely passed to another thread. Notes without ids get them first. """
+
     assert (
         len(set([item_to_id(item) for item in all_items(model) if item_to_id(item) != None])) ==
         len(    [item_to_id(item) for item in all_items(model) if item_to_id(item) != None])
@@ -62,32 +93,34 @@ def dump_notes(model):
 
     assign_note_ids(model)
 
-    raw_notes = []
-    for item in all_items(model):
-        note = item_to_note(item)
-        assert note.id != None
+    return list(note_links(model))
 
+def dump_snapshot(snapshot):
+    """ Converts a snapshot from snapshot_notes() into dicts in the same format as dump_notes() """
+
+    raw_notes = []
+    for (note, parent_id, prev_sibling_id) in snapshot:
         note_dict = note.to_dict()
         assert not 'parent_id'       in note_dict
         assert not 'prev_sibling_id' in note_dict
 
-        # There is an old bug in Qt that causes the parent() of top-level items in QStandardItemModel
-        # to return None rather than invisibleRootItem(). This was supposedly fixed a year ago but I'm
-        # experiencing it with both python-pyqt4 4.10.2/qt4 4.8.5 and pyqt5 5.0/qt5 5.1.0 on Arch Linux.
-        # See https://bugreports.qt-project.org/browse/QTBUG-18785
-        if item.parent() in [None, model.invisibleRootItem()]:
-            note_dict['parent_id']       = None
-            note_dict['prev_sibling_id'] = item_to_note(model.item(item.row() - 1)).id if item.row() > 0 else None
-        else:
-            note_dict['parent_id']       = item_to_note(item.parent()).id
-            note_dict['prev_sibling_id'] = item_to_note(item.parent().child(item.row() - 1)).id if item.row() > 0 else None
+        note_dict['parent_id']       = parent_id
+        note_dict['prev_sibling_id'] = prev_sibling_id
 
         raw_notes.append(note_dict)
 
     return raw_notes
 
+def dump_notes(model):
+    return dump_snapshot(snapshot_notes(model))
+
 def load_notes(raw_notes):
-    item_map = {}
+    """ Builds a model from note dicts in the format produced by dump_notes(). raw_notes can be any iterable,
+        including a generator. It's traversed only once and the dicts are not kept after being converted. """
+
+    return load_note_links(_raw_note_links(raw_notes))
+
+def _raw_note_links(raw_notes):
     for note_dict in raw_notes:
         note = Note.from_dict(note_dict)
 
@@ -106,9 +139,21 @@ def load_notes(raw_notes):
                     attribute, [int, type(None)], type(note_dict[attribute])
                 ))
 
+        yield (note, note_dict['parent_id'], note_dict['prev_sibling_id'])
+
+def load_note_links(note_links):
+    """ Builds a model from (note, parent_id, prev_sibling_id) tuples like the ones yielded by note_links().
+        All notes must have ids. note_links can be any iterable and is traversed only once. """
+
+    item_map   = {}
+    note_count = 0
+    for (note, parent_id, prev_sibling_id) in note_links:
+        assert note.id != None
+        note_count += 1
+
         item = QStandardItem()
         set_item_note(item, note)
-        item_map[note.id] = (item, note_dict['parent_id'], note_dict['prev_sibling_id'])
+        item_map[note.id] = (item, parent_id, prev_sibling_id)
 
     new_model = QStandardItemModel()
     inserted  = set()
@@ -162,7 +207,7 @@ def load_notes(raw_notes):
                     inserted.add(id)
                     priority_ids.pop()
 
-    if len(list(all_items(new_model))) != len(raw_notes):
+    if len(list(all_items(new_model))) != note_count:
         raise ParentCycle("Not all items are reachable from the top level of the new model. There must be a vertical cycle somewhere.")
 
     return new_model
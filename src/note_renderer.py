@@ -0,0 +1,308 @@
+""" Paints notes in display mode directly with QPainter, without creating any widgets.
+
+    The result looks the same as NoteWidget resized to the same size. Fonts, colors, margins and spacing
+    are taken from NoteWidget and the text is measured the same way QLabel measures it.
+
+    Only the parts that need the style or the local time zone have to be prepared in the GUI thread (see prepare()).
+    The rest of the work can be done in a worker thread (see paint_prepared()). """
+
+import math
+
+from PyQt5.QtWidgets import QApplication, QStyle, QStyleOptionFrame
+from PyQt5.QtGui     import QFontMetrics, QFontMetricsF, QPalette, QPainter, QPicture, QPen
+from PyQt5.QtCore    import Qt, QRect, QRectF, QSize
+
+from .note        import Note
+from .note_widget import NoteWidget
+
+class NoteRenderer:
+    # The same flags QLabel uses to draw plain text
+    BODY_FLAGS  = Qt.AlignLeft | Qt.AlignVCenter | Qt.TextExpandTabs | Qt.TextWordWrap
+    LABEL_FLAGS = Qt.AlignLeft | Qt.AlignVCenter | Qt.TextExpandTabs
+
+    # QLabel measures text in a rectangle of this size when it's not constrained by anything else
+    UNCONSTRAINED_SIZE = 2000
+
+    def __init__(self):
+        # NOTE: The template is used only to read metrics that depend on the style. It's never shown nor painted.
+        template = NoteWidget()
+
+        self._body_font      = NoteWidget.body_font()
+        self._tag_font       = NoteWidget.tag_font()
+        self._timestamp_font = NoteWidget.timestamp_font()
+
+        self._body_metrics      = QFontMetrics(self._body_font)
+        self._tag_metrics       = QFontMetrics(self._tag_font)
+        self._timestamp_metrics = QFontMetrics(self._timestamp_font)
+
+        (self._margins, self._spacing, self._tag_panel_margins, self._tag_panel_spacing) = template.layout_metrics()
+
+        self._frame_width = template.frameWidth()
+        self._line_width  = template.lineWidth()
+        self._palette     = QPalette(template.palette())
+
+        self._tag_palette = QPalette(self._palette)
+        self._tag_palette.setColor(QPalette.WindowText, NoteWidget.TAG_COLOR)
+
+        self._timestamp_palette = QPalette(self._palette)
+        self._timestamp_palette.setColor(QPalette.WindowText, NoteWidget.TIMESTAMP_COLOR)
+
+    def texts(self, note):
+        """ Returns the body, tags and timestamp as they're shown in the note. Must be called in the GUI thread
+            because the timestamp is converted to local time using a cache that's not thread-safe. """
+
+        return (note.body, Note.join_tags(note.tags), NoteWidget.timestamp_text(note))
+
+    def body_height(self, note, width):
+        """ Returns the height of the body text wrapped to fit in a note of the specified width """
+
+        return self._body_height(note.body, width)
+
+    def tag_panel_height(self, note):
+        return self._tag_panel_height(self.texts(note))
+
+    def height(self, note, width):
+        """ Returns the height at which the note fits in the specified width without cutting off any text """
+
+        texts = self.texts(note)
+        return (
+            2 * self._frame_width +
+            self._margins.top() +
+            self._body_height(texts[0], width) +
+            self._spacing +
+            self._tag_panel_height(texts) +
+            self._margins.bottom()
+        )
+
+    def layout(self, note, rect):
+        """ Returns rectangles occupied by the body, tags and timestamp of the note painted in the specified rectangle """
+
+        return self._layout(self.texts(note), rect)
+
+    def _body_height(self, body, width):
+        text_width = max(width - 2 * self._frame_width - self._margins.left() - self._margins.right(), 1)
+        return self._text_size(self._body_metrics, body, text_width, word_wrap = True).height()
+
+    def _tag_panel_height(self, texts):
+        (body, tag_text, timestamp_text) = texts
+
+        return (
+            self._tag_panel_margins.top() +
+            max(
+                self._text_size(self._tag_metrics,       tag_text).height(),
+                self._text_size(self._timestamp_metrics, timestamp_text).height()
+            ) +
+            self._tag_panel_margins.bottom()
+        )
+
+    def _layout(self, texts, rect):
+        (body, tag_text, timestamp_text) = texts
+
+        content_rect = rect.adjusted(
+            self._frame_width + self._margins.left(),
+            self._frame_width + self._margins.top(),
+            -self._frame_width - self._margins.right(),
+            -self._frame_width - self._margins.bottom()
+        )
+
+        (body_height, tag_panel_height) = self.distribute_space(
+            content_rect.height() - self._spacing,
+            [self._body_height(body, rect.width()), self._tag_panel_height(texts)]
+        )
+
+        body_rect      = QRect(content_rect.left(), content_rect.top(), content_rect.width(), body_height)
+        tag_panel_rect = QRect(content_rect.left(), body_rect.bottom() + 1 + self._spacing, content_rect.width(), tag_panel_height)
+
+        tag_panel_content_rect = tag_panel_rect.adjusted(
+            self._tag_panel_margins.left(),
+            self._tag_panel_margins.top(),
+            -self._tag_panel_margins.right(),
+            -self._tag_panel_margins.bottom()
+        )
+
+        # NOTE: The stretch between the labels takes all the extra space so the timestamp sticks to the right edge.
+        # The widget refuses to become too narrow to fit both labels; we just let the tags get cut off instead.
+        timestamp_width = self._text_size(self._timestamp_metrics, timestamp_text).width()
+        tag_width       = self._text_size(self._tag_metrics,       tag_text).width()
+
+        timestamp_rect = QRect(
+            tag_panel_content_rect.right() - timestamp_width + 1,
+            tag_panel_content_rect.top(),
+            timestamp_width,
+            tag_panel_content_rect.height()
+        )
+        tag_rect = QRect(
+            tag_panel_content_rect.left(),
+            tag_panel_content_rect.top(),
+            max(0, min(tag_width, timestamp_rect.left() - self._tag_panel_spacing - tag_panel_content_rect.left())),
+            tag_panel_content_rect.height()
+        )
+
+        return (body_rect, tag_rect, timestamp_rect)
+
+    @classmethod
+    def distribute_space(cls, space, sizes):
+        """ Splits space between a column of widgets the way QBoxLayout does it when none of them can be
+            shrunk below its preferred size, has a stretch factor or wants to expand.
+
+            Returns the sizes the widgets get. """
+
+        if space <= 0:
+            return [0] * len(sizes)
+
+        if space < sum(sizes):
+            # Not enough space. Shrink the biggest widgets first until the rest fits.
+            sorted_sizes = sorted(sizes)
+            used_space   = 0
+            fitting_sum  = 0
+            current      = 0
+            index        = 0
+            while index < len(sizes) and used_space < space:
+                current      = sorted_sizes[index]
+                used_space   = fitting_sum + current * (len(sizes) - index)
+                fitting_sum += current
+                index       += 1
+
+            shrunk_count = len(sizes) - index + 1
+            deficit      = used_space - space
+            limit        = current - deficit // shrunk_count
+
+            result    = []
+            remainder = 0
+            for size in sizes:
+                remainder += deficit % shrunk_count
+                if remainder >= shrunk_count:
+                    remainder -= shrunk_count
+                    result.append(min(size, limit - 1))
+                else:
+                    result.append(min(size, limit))
+
+            return result
+
+        # Extra space. Everyone gets an equal share unless it's smaller than its preferred size.
+        # Those that don't fit get their preferred size and the rest is divided again.
+        # Shares are calculated using fixed-point numbers with 8 fractional bits, just like in Qt.
+        result    = list(sizes)
+        pending   = list(range(len(sizes)))
+        remaining = space
+        while len(pending) > 0:
+            share_sum = 0
+            too_small = []
+            for position in pending:
+                share_sum       += (remaining << 8) // len(pending)
+                result[position] = (share_sum >> 8) + (1 if (share_sum & 0xff) >= 0x80 else 0)
+                share_sum       -= result[position] << 8
+
+                if result[position] < sizes[position]:
+                    too_small.append(position)
+
+            for position in too_small:
+                result[position] = sizes[position]
+                remaining       -= sizes[position]
+                pending.remove(position)
+
+            if len(too_small) == 0:
+                break
+
+        return result
+
+    def paint(self, painter, note, rect):
+        self.paint_prepared(painter, self.prepare(note, rect), rect)
+
+    def prepare(self, note, rect):
+        """ Does the part of painting that must be done in the GUI thread. The result can be passed
+            to paint_prepared() in any thread. """
+
+        # NOTE: Styles are not thread-safe. The frame is recorded here and only replayed by paint_prepared().
+        frame   = QPicture()
+        painter = QPainter(frame)
+        self._paint_frame(painter, rect)
+        painter.end()
+
+        return (self.texts(note), frame)
+
+    def paint_prepared(self, painter, prepared, rect):
+        """ Paints a note prepared with prepare(). Safe to call in any thread as long as no other thread
+            is using the same renderer at the same time. """
+
+        (texts, frame) = prepared
+        (body, tag_text, timestamp_text) = texts
+
+        painter.save()
+        painter.setClipRect(rect)
+
+        painter.fillRect(rect, NoteWidget.BACKGROUND_COLOR)
+        painter.drawPicture(0, 0, frame)
+
+        (body_rect, tag_rect, timestamp_rect) = self._layout(texts, rect)
+
+        self._paint_text(painter, body_rect,      self.BODY_FLAGS,  self._body_font,      self._palette,           body)
+        self._paint_text(painter, tag_rect,       self.LABEL_FLAGS, self._tag_font,       self._tag_palette,       tag_text)
+        self._paint_text(painter, timestamp_rect, self.LABEL_FLAGS, self._timestamp_font, self._timestamp_palette, timestamp_text)
+
+        painter.restore()
+
+    def _text_size(self, font_metrics, text, width = UNCONSTRAINED_SIZE, word_wrap = False):
+        """ Returns the size QLabel would request to display the text """
+
+        # An empty label still reserves space for one line
+        if text == '':
+            return QSize(font_metrics.averageCharWidth(), font_metrics.lineSpacing())
+
+        # NOTE: Like QLabel, we measure the text without vertical centering. Centering rounds the
+        # position of the text and can make the bounding rectangle one pixel taller. The rectangle
+        # can also be wider than the advance of the text and QLabel sizes itself to fit the former.
+        flags = (self.BODY_FLAGS if word_wrap else self.LABEL_FLAGS) & ~Qt.AlignVCenter
+        return font_metrics.boundingRect(0, 0, width, self.UNCONSTRAINED_SIZE, flags, text).size()
+
+    def _paint_text(self, painter, rect, flags, font, palette, text):
+        # NOTE: QLabel paints its text with QStyle.drawItemText(). For enabled text that is just drawText() with
+        # the pen set to the text color, which we do ourselves because the style must not be used outside the
+        # GUI thread. Text is cut off at the edges of its label.
+        if text == '':
+            return
+
+        painter.save()
+        painter.setClipRect(rect, Qt.IntersectClip)
+        painter.setFont(font)
+        painter.setPen(QPen(palette.brush(QPalette.WindowText), painter.pen().widthF()))
+
+        overflow_height = self._overflow_height(font, rect, flags, text)
+        if overflow_height == None:
+            painter.drawText(rect, flags, text)
+        else:
+            top_rect = QRectF(rect.left(), rect.top() + (rect.height() - overflow_height) / 2, rect.width(), self.UNCONSTRAINED_SIZE)
+            painter.drawText(top_rect, (flags & ~Qt.AlignVCenter) | Qt.AlignTop, text)
+
+        painter.restore()
+
+    def _overflow_height(self, font, rect, flags, text):
+        """ Returns the height of the block of lines drawText() centers when the text does not fit in the
+            rectangle or None if it does fit.
+
+            When called from C++ without asking for the bounding rectangle, drawText() stops laying out lines
+            as soon as they fill the rectangle and centers only those. PyQt always asks for the rectangle so
+            we have to find the position of the first line ourselves. Every line is assumed to be as tall as
+            the font. """
+
+        font_metrics = QFontMetrics(font)
+        if font_metrics.boundingRect(rect.left(), rect.top(), rect.width(), self.UNCONSTRAINED_SIZE, flags & ~Qt.AlignVCenter, text).height() <= rect.height():
+            return None
+
+        # NOTE: This is how qt_format_text() accumulates the height of the lines
+        font_metrics = QFontMetricsF(font)
+        height       = -font_metrics.leading()
+        while True:
+            height = math.ceil(height + font_metrics.leading()) + font_metrics.height()
+            if height >= rect.height():
+                return height
+
+    def _paint_frame(self, painter, rect):
+        option = QStyleOptionFrame()
+        option.rect         = rect
+        option.palette      = self._palette
+        option.state        = QStyle.State_Enabled
+        option.lineWidth    = self._line_width
+        option.midLineWidth = 0
+
+        QApplication.style().drawPrimitive(QStyle.PE_Frame, option, painter)
@@ -1,27 +1,29 @@
 """ The UI widget that represents a single note """
 
-from datetime import datetime
+from datetime  import datetime
+from functools import lru_cache
 
 from PyQt5.QtWidgets import QWidget, QFrame, QVBoxLayout, QHBoxLayout, QLabel
 from PyQt5.QtGui     import QFont, QPalette
 from PyQt5.QtCore    import Qt
 
-from .utils import utc_to_localtime
+from .utils import localtime_utc_delta
 from .note  import Note
 
 class NoteWidget(QFrame):
-    def __init__(self, parent = None):
-        super().__init__(parent)
+    BACKGROUND_COLOR = Qt.white
+    TAG_COLOR        = Qt.red
+    TIMESTAMP_COLOR  = Qt.darkGray
 
-        # Use Liberation Mono font if present. If not, TypeWriter hint
-        # will make Qt select some other monospace font.
-        monospace_font = QFont("Liberation Mono", 10, QFont.TypeWriter)
+    # Number of formatted timestamp texts remembered by timestamp_text(). Far more than ever fits on the screen.
+    TIMESTAMP_TEXT_CACHE_SIZE = 4096
 
-        tag_font = QFont()
-        tag_font.setPointSize(8)
+    def __init__(self, parent = None):
+        super().__init__(parent)
 
-        timestamp_font = QFont()
-        timestamp_font.setPointSize(7)
+        monospace_font = self.body_font()
+        tag_font       = self.tag_font()
+        timestamp_font = self.timestamp_font()
 
         self._main_layout = QVBoxLayout(self)
         self._tag_panel   = QWidget(self)
@@ -39,10 +41,10 @@ class NoteWidget(QFrame):
         self._main_layout.addWidget(self._tag_panel)
 
         tag_palette = QPalette(self._tag_label.palette())
-        tag_palette.setColor(self._tag_label.foregroundRole(), Qt.red)
+        tag_palette.setColor(self._tag_label.foregroundRole(), self.TAG_COLOR)
 
         timestamp_palette = QPalette(self._timestamp_label.palette())
-        timestamp_palette.setColor(self._timestamp_label.foregroundRole(), Qt.darkGray)
+        timestamp_palette.setColor(self._timestamp_label.foregroundRole(), self.TIMESTAMP_COLOR)
 
         self._tag_label.setPalette(tag_palette)
         self._tag_label.setTextFormat(Qt.PlainText)
@@ -56,27 +58,71 @@ class NoteWidget(QFrame):
         self._timestamp_label.setPalette(timestamp_palette)
 
         widget_palette = QPalette(self.palette())
-        widget_palette.setColor(QPalette.Background, Qt.white)
+        widget_palette.setColor(QPalette.Background, self.BACKGROUND_COLOR)
 
         self.setAutoFillBackground(True)
         self.setPalette(widget_palette)
         self.setFrameStyle(QFrame.StyledPanel)
 
+    @classmethod
+    def body_font(cls):
+        # Use Liberation Mono font if present. If not, TypeWriter hint
+        # will make Qt select some other monospace font.
+        return QFont("Liberation Mono", 10, QFont.TypeWriter)
+
+    @classmethod
+    def tag_font(cls):
+        tag_font = QFont()
+        tag_font.setPointSize(8)
+        return tag_font
+
+    @classmethod
+    def timestamp_font(cls):
+        timestamp_font = QFont()
+        timestamp_font.setPointSize(7)
+        return timestamp_font
+
+    def layout_metrics(self):
+        """ Returns margins and spacing of the main layout and the layout of the tag panel.
+            Lets NoteRenderer reproduce the layout without creating widgets. """
+
+        return (
+            self._main_layout.contentsMargins(),
+            self._main_layout.spacing(),
+            self._tag_layout.contentsMargins(),
+            self._tag_layout.spacing()
+        )
+
     def load_note(self, note):
         self._body_label.setText(note.body)
         self._tag_label.setText(Note.join_tags(note.tags))
+        self._timestamp_label.setText(self.timestamp_text(note))
 
-        if note.created_at != note.modified_at:
-            self._timestamp_label.setText("{} (Modified: {})".format(
-                self.format_timestamp(note.created_at),
-                self.format_timestamp(note.modified_at)
-            ))
+    @classmethod
+    def timestamp_text(cls, note):
+        """ Returns the text shown in the timestamp label of the note. The text is formatted only once for
+            each version of the note and recomputed only if the local time zone offset changes. """
+
+        return cls._cached_timestamp_text(note.created_at, note.modified_at, localtime_utc_delta())
+
+    @staticmethod
+    @lru_cache(maxsize = TIMESTAMP_TEXT_CACHE_SIZE)
+    def _cached_timestamp_text(created_at, modified_at, localtime_utc_delta):
+        if created_at != modified_at:
+            return "{} (Modified: {})".format(
+                NoteWidget._format_local_timestamp(created_at + localtime_utc_delta),
+                NoteWidget._format_local_timestamp(modified_at + localtime_utc_delta)
+            )
         else:
-            self._timestamp_label.setText(self.format_timestamp(note.created_at))
+            return NoteWidget._format_local_timestamp(created_at + localtime_utc_delta)
 
     @classmethod
-    def format_timestamp(self, timestamp):
+    def format_timestamp(cls, timestamp):
         assert timestamp != None
 
+        return cls._format_local_timestamp(timestamp + localtime_utc_delta())
+
+    @staticmethod
+    def _format_local_timestamp(local_timestamp):
         # TODO: Use system settings for date format?
-        return utc_to_localtime(timestamp).strftime("%Y-%m-%d %H:%M")
+        return local_timestamp.strftime("%Y-%m-%d %H:%M")
@@ -0,0 +1,126 @@
+""" A cache of pixmaps with notes rendered in display mode. Keeps the most recently used ones within a memory budget. """
+
+from collections import OrderedDict, defaultdict
+
+class PixmapCache:
+    DEFAULT_BUDGET = 64 * 1024 * 1024
+
+    def __init__(self, budget = DEFAULT_BUDGET):
+        # NOTE: Least recently used entries come first
+        self._pixmaps    = OrderedDict()
+        self._keys_by_id = defaultdict(set)
+        self._total_cost = 0
+        self._budget     = budget
+        self._view_width = None
+
+        self.reset_statistics()
+
+    @classmethod
+    def key(cls, note, size, variant = None):
+        """ Identifies a particular version of the note rendered at a particular size. The variant distinguishes
+            different ways of displaying the same version, e.g. a preview and the whole note. Selection is not
+            a part of the key - it's drawn on top of the cached pixmap. """
+
+        return (note.id, note.modified_at, size.width(), size.height(), variant)
+
+    @classmethod
+    def pixmap_cost(cls, pixmap):
+        """ Approximate number of bytes occupied by the pixmap """
+
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def get(self, note, size, variant = None):
+        """ Returns the cached pixmap or None. Notes without ids are never cached. """
+
+        if note.id == None:
+            return None
+
+        key    = self.key(note, size, variant)
+        pixmap = self._pixmaps.get(key)
+        if pixmap == None:
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        self._pixmaps.move_to_end(key)
+        return pixmap
+
+    def contains(self, note, size, variant = None):
+        """ Checks if there's a pixmap for the note without counting it as a hit or miss or making it more recently used """
+
+        return note.id != None and self.key(note, size, variant) in self._pixmaps
+
+    def put(self, note, size, pixmap, variant = None):
+        if note.id == None:
+            return
+
+        key = self.key(note, size, variant)
+        if key in self._pixmaps:
+            self._remove(key)
+
+        cost = self.pixmap_cost(pixmap)
+        if cost > self._budget:
+            return
+
+        self._pixmaps[key] = pixmap
+        self._keys_by_id[note.id].add(key)
+        self._total_cost += cost
+
+        self._evict(self._budget)
+
+    def invalidate(self, note_id):
+        """ Removes all pixmaps of all versions of the note """
+
+        for key in list(self._keys_by_id.get(note_id, [])):
+            self._remove(key)
+
+    def set_view_width(self, width):
+        """ Discards all pixmaps if the width of the view has changed. Pixmaps rendered for the old width won't be used again. """
+
+        if width != self._view_width:
+            self.clear()
+            self._view_width = width
+
+    def view_width(self):
+        return self._view_width
+
+    def clear(self):
+        self._pixmaps.clear()
+        self._keys_by_id.clear()
+        self._total_cost = 0
+
+    def __len__(self):
+        return len(self._pixmaps)
+
+    def total_cost(self):
+        return self._total_cost
+
+    def budget(self):
+        return self._budget
+
+    def set_budget(self, budget):
+        self._budget = budget
+        self._evict(budget)
+
+    def hits(self):
+        return self._hits
+
+    def misses(self):
+        return self._misses
+
+    def reset_statistics(self):
+        self._hits   = 0
+        self._misses = 0
+
+    def _evict(self, budget):
+        while self._total_cost > budget:
+            self._remove(next(iter(self._pixmaps)))
+
+    def _remove(self, key):
+        pixmap = self._pixmaps.pop(key)
+        self._total_cost -= self.pixmap_cost(pixmap)
+
+        note_id = key[0]
+        self._keys_by_id[note_id].discard(key)
+        if len(self._keys_by_id[note_id]) == 0:
+            del self._keys_by_id[note_id]
@@ -0,0 +1,152 @@
+""" Collects timings of painting and measuring notes in the tape. Meant for finding out where the time goes
+    while scrolling through real tapes. Enabled by setting the NASTRO_PROFILE environment variable. """
+
+import os
+import heapq
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+class FrameStatistics:
+    """ Numbers of calls to NoteDelegate methods and the total time spent in them """
+
+    def __init__(self):
+        self.paint_count     = 0
+        self.paint_time      = 0.0
+        self.size_hint_count = 0
+        self.size_hint_time  = 0.0
+        self.pixmap_hits     = 0
+        self.pixmap_misses   = 0
+        self.height_hits     = 0
+        self.height_misses   = 0
+
+    def add(self, other):
+        for (name, value) in vars(other).items():
+            setattr(self, name, getattr(self, name) + value)
+
+    @classmethod
+    def hit_rate(cls, hits, misses):
+        """ Returns the fraction of lookups that were hits or None if there were no lookups at all """
+
+        return hits / (hits + misses) if hits + misses > 0 else None
+
+    def pixmap_hit_rate(self):
+        return self.hit_rate(self.pixmap_hits, self.pixmap_misses)
+
+    def height_hit_rate(self):
+        return self.hit_rate(self.height_hits, self.height_misses)
+
+class RenderProfiler(QObject):
+    ENVIRONMENT_VARIABLE = 'NASTRO_PROFILE'
+    SLOWEST_NOTE_COUNT   = 10
+    SUMMARY_LENGTH       = 40
+
+    # Emitted when control returns to the event loop after a batch of paint() and sizeHint() calls
+    frame_finished = pyqtSignal()
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+
+        # NOTE: There's no way to get notified when the view finishes painting. Everything that happens
+        # before control returns to the event loop is treated as a single frame.
+        self._frame_timer = QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.setInterval(0)
+
+        self._frame_timer.timeout.connect(self.finish_frame)
+
+        self.reset()
+
+    @classmethod
+    def enabled_by_environment(cls):
+        return os.environ.get(cls.ENVIRONMENT_VARIABLE, '') not in ['', '0']
+
+    @classmethod
+    def note_summary(cls, note):
+        first_line = note.body.split('\n', 1)[0]
+        return first_line[:cls.SUMMARY_LENGTH] + ("..." if len(first_line) > cls.SUMMARY_LENGTH else "")
+
+    def reset(self):
+        self._frame_timer.stop()
+
+        self._current_frame = FrameStatistics()
+        self._last_frame    = FrameStatistics()
+        self._totals        = FrameStatistics()
+        self._frame_count   = 0
+
+        # The longest time it took to render each note, indexed by note id. Stored along with a summary of the note.
+        self._render_times = {}
+
+    def record_paint(self, seconds, pixmap_hit):
+        self._current_frame.paint_count += 1
+        self._current_frame.paint_time  += seconds
+        if pixmap_hit:
+            self._current_frame.pixmap_hits += 1
+        else:
+            self._current_frame.pixmap_misses += 1
+
+        self._frame_timer.start()
+
+    def record_size_hint(self, seconds, height_hit):
+        self._current_frame.size_hint_count += 1
+        self._current_frame.size_hint_time  += seconds
+        if height_hit:
+            self._current_frame.height_hits += 1
+        else:
+            self._current_frame.height_misses += 1
+
+        self._frame_timer.start()
+
+    def record_render(self, note, seconds):
+        """ Records how long it took to render a note that was not in the pixmap cache """
+
+        previous = self._render_times.get(note.id)
+        if previous == None or previous[0] < seconds:
+            self._render_times[note.id] = (seconds, self.note_summary(note))
+
+    def finish_frame(self):
+        self._frame_timer.stop()
+
+        self._last_frame     = self._current_frame
+        self._current_frame  = FrameStatistics()
+        self._frame_count   += 1
+        self._totals.add(self._last_frame)
+
+        self.frame_finished.emit()
+
+    def last_frame(self):
+        return self._last_frame
+
+    def totals(self):
+        return self._totals
+
+    def frame_count(self):
+        return self._frame_count
+
+    def slowest_notes(self, count = SLOWEST_NOTE_COUNT):
+        """ Returns (seconds, note id, summary) tuples for notes that took the longest to render, slowest first """
+
+        return heapq.nlargest(count, ((seconds, note_id, summary) for (note_id, (seconds, summary)) in self._render_times.items()))
+
+    def report(self):
+        """ Returns the statistics formatted as plain text """
+
+        def format_rate(rate):
+            return "{:.1f}%".format(rate * 100) if rate != None else "-"
+
+        lines = ["Frames: {}".format(self._frame_count), ""]
+
+        for (title, statistics) in [("Last frame", self._last_frame), ("All frames", self._totals)]:
+            lines += [
+                title,
+                "  paint():    {:6d} calls {:9.2f} ms".format(statistics.paint_count,     statistics.paint_time     * 1000),
+                "  sizeHint(): {:6d} calls {:9.2f} ms".format(statistics.size_hint_count, statistics.size_hint_time * 1000),
+                "  pixmap cache hits: {}".format(format_rate(statistics.pixmap_hit_rate())),
+                "  height cache hits: {}".format(format_rate(statistics.height_hit_rate())),
+                ""
+            ]
+
+        lines.append("Slowest notes")
+        for (seconds, note_id, summary) in self.slowest_notes():
+            lines.append("  {:7.2f} ms  #{}: {}".format(seconds * 1000, note_id, summary))
+
+        return '\n'.join(lines)
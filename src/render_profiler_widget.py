@@ -0,0 +1,66 @@
+""" A panel that shows statistics collected by RenderProfiler """
+
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPlainTextEdit, QPushButton
+from PyQt5.QtGui     import QFont
+from PyQt5.QtCore    import QTimer
+
+class RenderProfilerWidget(QWidget):
+    # Minimum time between updates of the report, in milliseconds. Refreshing it after every frame
+    # would make the panel itself a noticeable part of what it's measuring.
+    REFRESH_INTERVAL = 250
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+
+        self._main_layout  = QVBoxLayout(self)
+        self._report_edit  = QPlainTextEdit(self)
+        self._reset_button = QPushButton(self)
+
+        self._report_edit.setReadOnly(True)
+        self._report_edit.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self._report_edit.setFont(QFont("Liberation Mono", 8, QFont.TypeWriter))
+        self._reset_button.setText("Reset")
+
+        self._main_layout.addWidget(self._report_edit)
+        self._main_layout.addWidget(self._reset_button)
+
+        self._profiler = None
+
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(self.REFRESH_INTERVAL)
+
+        self._refresh_timer.timeout.connect(self.refresh)
+        self._reset_button.clicked.connect(self._reset_handler)
+
+    def set_profiler(self, profiler):
+        if self._profiler != None:
+            self._profiler.frame_finished.disconnect(self._frame_finished_handler)
+
+        self._profiler = profiler
+        self._profiler.frame_finished.connect(self._frame_finished_handler)
+        self.refresh()
+
+    def profiler(self):
+        return self._profiler
+
+    def report(self):
+        return self._report_edit.toPlainText()
+
+    def refresh(self):
+        self._refresh_timer.stop()
+
+        if self._profiler != None:
+            self._report_edit.setPlainText(self._profiler.report())
+        else:
+            self._report_edit.clear()
+
+    def _frame_finished_handler(self):
+        if not self._refresh_timer.isActive():
+            self._refresh_timer.start()
+
+    def _reset_handler(self):
+        if self._profiler != None:
+            self._profiler.reset()
+
+        self.refresh()
@@ -0,0 +1,278 @@
+""" Structured search queries like 'tag:work created:>2013-01-01 modified:<7d "exact phrase"'.
+
+    A query is a conjunction of clauses. Each clause can find its candidates in a NoteIndex and
+    tell whether a particular note matches it. Queries that do not use any special syntax are
+    treated as a single fixed string, exactly as typed. """
+
+import re
+from datetime import datetime, timedelta
+
+from .utils             import localtime_to_utc
+from .search_text_cache import SearchTextCache
+
+class TextClause:
+    def __init__(self, text):
+        self.text            = text
+        self.casefolded_text = text.casefold()
+
+    def estimate(self, note_index):
+        return note_index.candidate_count_estimate(self.text)
+
+    def candidate_ids(self, note_index):
+        return note_index.candidate_ids(self.text)
+
+    def matches(self, note, search_text):
+        return SearchTextCache.text_matches(self.casefolded_text, search_text)
+
+class TagClause:
+    def __init__(self, tag):
+        self.tag            = tag
+        self.casefolded_tag = tag.casefold()
+
+    def estimate(self, note_index):
+        return note_index.casefolded_tag_count(self.casefolded_tag)
+
+    def candidate_ids(self, note_index):
+        return note_index.casefolded_tag_ids(self.casefolded_tag)
+
+    def matches(self, note, search_text):
+        return any(tag.casefold() == self.casefolded_tag for tag in note.tags)
+
+class DateClause:
+    """ Matches notes with the timestamp attribute in range [lower_bound, upper_bound). None means no bound. """
+
+    def __init__(self, attribute, lower_bound, upper_bound):
+        assert attribute in ['created_at', 'modified_at']
+
+        self.attribute   = attribute
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+
+    def estimate(self, note_index):
+        return note_index.date_range_count(self.attribute, self.lower_bound, self.upper_bound)
+
+    def candidate_ids(self, note_index):
+        return note_index.date_range_ids(self.attribute, self.lower_bound, self.upper_bound)
+
+    def matches(self, note, search_text):
+        timestamp = getattr(note, self.attribute)
+
+        return (
+            (self.lower_bound == None or self.lower_bound <= timestamp) and
+            (self.upper_bound == None or timestamp < self.upper_bound)
+        )
+
+class SearchQuery:
+    # NOTE: A quote or a backslash can be included in a quoted value or phrase by preceding it with a backslash
+    TOKEN_PATTERN         = re.compile(r'(?P<key>[a-z]+):(?:"(?P<quoted_value>(?:[^"\\]|\\.?)*)"?|(?P<value>\S*))|"(?P<phrase>(?:[^"\\]|\\.?)*)"?|(?P<word>\S+)')
+    ESCAPE_PATTERN        = re.compile(r'\\(["\\])')
+    DATE_VALUE_PATTERN    = re.compile(r'^(?P<operator><=|>=|<|>|=)?(?P<date>.*)$')
+    ABSOLUTE_DATE_PATTERN = re.compile(r'^(?P<year>\d{4})(-(?P<month>\d{1,2})(-(?P<day>\d{1,2}))?)?$')
+    RELATIVE_DATE_PATTERN = re.compile(r'^(?P<amount>\d+)(?P<unit>[hdwmy])$')
+
+    DATE_ATTRIBUTES = {
+        'created':  'created_at',
+        'modified': 'modified_at'
+    }
+    RELATIVE_DATE_UNITS = {
+        'h': timedelta(hours = 1),
+        'd': timedelta(days  = 1),
+        'w': timedelta(weeks = 1),
+        'm': timedelta(days  = 30),
+        'y': timedelta(days  = 365)
+    }
+
+    def __init__(self, clauses, plain_text = None):
+        self.clauses    = clauses
+        self.plain_text = plain_text
+
+    @classmethod
+    def parse(cls, text, now = None):
+        """ Converts a query string into a SearchQuery.
+
+            Parsing never fails. The query is likely to be incomplete while the user is still typing it so
+            terms that can't be interpreted are treated as text and terms with empty values are ignored. """
+
+        if now == None:
+            now = datetime.utcnow()
+
+        clauses       = []
+        words         = []
+        is_structured = False
+
+        for match in cls.TOKEN_PATTERN.finditer(text):
+            if match.group('key') != None:
+                key = match.group('key')
+                if match.group('quoted_value') != None:
+                    value = cls.unescape(match.group('quoted_value'))
+                else:
+                    value = match.group('value')
+
+                if key == 'tag':
+                    is_structured = True
+                    if value != '':
+                        clauses.append(TagClause(value))
+                elif key in cls.DATE_ATTRIBUTES:
+                    is_structured = True
+                    date_clause   = cls._parse_date_clause(cls.DATE_ATTRIBUTES[key], value, now)
+                    if date_clause != None:
+                        clauses.append(date_clause)
+                    elif not cls._is_incomplete_date(value):
+                        words.append(match.group())
+                else:
+                    words.append(match.group())
+            elif match.group('phrase') != None:
+                is_structured = True
+                if match.group('phrase') != '':
+                    clauses.append(TextClause(cls.unescape(match.group('phrase'))))
+            else:
+                words.append(match.group('word'))
+
+        if not is_structured:
+            # NOTE: Whitespace is significant in fixed strings so we can't just join the words
+            return cls([TextClause(text)], text)
+
+        # NOTE: Words outside of quotes don't have to be next to each other in the note. Only phrases do.
+        clauses += [TextClause(word) for word in words]
+
+        return cls(clauses)
+
+    @classmethod
+    def quote(cls, text):
+        """ Puts the text in quotes so that parse() reads it as a single value or phrase. Reverses unescape(). """
+
+        return '"{}"'.format(text.replace('\\', '\\\\').replace('"', '\\"'))
+
+    @classmethod
+    def unescape(cls, text):
+        """ Removes backslashes from escaped quotes and backslashes in a quoted value or phrase """
+
+        return cls.ESCAPE_PATTERN.sub(r'\1', text)
+
+    def is_plain_text(self):
+        return self.plain_text != None
+
+    def is_empty(self):
+        """ Returns True if the query matches every note """
+
+        return len(self.clauses) == 0 or self.is_plain_text() and self.plain_text == ''
+
+    def needs_search_text(self):
+        return any(isinstance(clause, TextClause) for clause in self.clauses)
+
+    def matches(self, note, search_text):
+        """ Checks if the note matches all clauses. search_text must be the text returned by
+            SearchTextCache.search_text() for the note. It's not used if needs_search_text() is False. """
+
+        return all(clause.matches(note, search_text) for clause in self.clauses)
+
+    def plan(self, note_index):
+        """ Returns clauses in the order in which they should be evaluated: the ones expected to
+            match the smallest number of notes first """
+
+        return sorted(self.clauses, key = lambda clause: clause.estimate(note_index))
+
+    def candidate_ids(self, note_index):
+        """ Returns ids of notes that may match the query. Each matching note is guaranteed to be
+            in the result but the candidates still need to be verified with matches(). """
+
+        return self._plan_candidate_ids(note_index, self.plan(note_index))
+
+    def find_matching_ids(self, note_index, search_text_getter, candidate_ids = None):
+        """ Returns ids of all indexed notes matching the query. search_text_getter is a function
+            that returns the search text for a note, e.g. SearchTextCache.get(). """
+
+        plan = self.plan(note_index)
+        if candidate_ids == None:
+            candidate_ids = self._plan_candidate_ids(note_index, plan)
+
+        # NOTE: The most selective clause has already been used to select the candidates but its
+        # candidates are not necessarily exact so we still check all the clauses.
+        needs_search_text = self.needs_search_text()
+
+        matching_ids = set()
+        for id in candidate_ids:
+            note        = note_index.note(id)
+            search_text = search_text_getter(note) if needs_search_text else None
+
+            if all(clause.matches(note, search_text) for clause in plan):
+                matching_ids.add(id)
+
+        return matching_ids
+
+    def is_refinement_of(self, other_query):
+        """ Checks whether all notes matching this query must also match the other one """
+
+        # NOTE: If a note contains the new string and the new string contains the old one, the note
+        # is guaranteed to contain the old one too.
+        return (
+            self.is_plain_text() and other_query.is_plain_text() and
+            other_query.clauses[0].casefolded_text in self.clauses[0].casefolded_text
+        )
+
+    @classmethod
+    def _plan_candidate_ids(cls, note_index, plan):
+        if len(plan) == 0:
+            return set(note_index.ids())
+
+        return set(plan[0].candidate_ids(note_index))
+
+    @classmethod
+    def _is_incomplete_date(cls, value):
+        """ Checks whether the value might become a valid date once the user finishes typing it """
+
+        return re.match(r'^(<=|>=|<|>|=)?[\d-]*$', value) != None
+
+    @classmethod
+    def _parse_date_clause(cls, attribute, value, now):
+        value_match = cls.DATE_VALUE_PATTERN.match(value)
+        operator    = value_match.group('operator') or '='
+        date_text   = value_match.group('date')
+
+        relative_match = cls.RELATIVE_DATE_PATTERN.match(date_text)
+        if relative_match != None:
+            # NOTE: Relative dates refer to age: 'modified:<7d' means 'modified less than 7 days ago'
+            # and 'modified:7d' means 'modified 7 days ago', i.e. at least 7 but less than 8 days ago.
+            unit          = cls.RELATIVE_DATE_UNITS[relative_match.group('unit')]
+            point_in_time = now - int(relative_match.group('amount')) * unit
+
+            if operator == '=':
+                return DateClause(attribute, point_in_time - unit, point_in_time)
+            elif operator in ['<', '<=']:
+                return DateClause(attribute, point_in_time, None)
+            else:
+                return DateClause(attribute, None, point_in_time)
+
+        absolute_match = cls.ABSOLUTE_DATE_PATTERN.match(date_text)
+        if absolute_match != None:
+            # NOTE: Absolute dates denote whole periods (a year, a month or a day) in local time
+            try:
+                (period_start, period_end) = cls._date_period(
+                    int(absolute_match.group('year')),
+                    int(absolute_match.group('month')) if absolute_match.group('month') != None else None,
+                    int(absolute_match.group('day'))   if absolute_match.group('day')   != None else None
+                )
+            except ValueError:
+                return None
+
+            (period_start, period_end) = (localtime_to_utc(period_start), localtime_to_utc(period_end))
+
+            return {
+                '<':  DateClause(attribute, None,         period_start),
+                '<=': DateClause(attribute, None,         period_end),
+                '>':  DateClause(attribute, period_end,   None),
+                '>=': DateClause(attribute, period_start, None),
+                '=':  DateClause(attribute, period_start, period_end)
+            }[operator]
+
+        return None
+
+    @classmethod
+    def _date_period(cls, year, month, day):
+        if month == None:
+            return (datetime(year, 1, 1), datetime(year + 1, 1, 1))
+        elif day == None:
+            return (datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1))
+        else:
+            start = datetime(year, month, day)
+            return (start, start + timedelta(days = 1))
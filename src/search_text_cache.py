@@ -0,0 +1,80 @@
+""" A cache of normalized text used when searching notes for a fixed string """
+
+class SearchTextCache:
+    # NOTE: Separates note components so that a search string can't match across them.
+    # It can't be entered in the search box.
+    SEPARATOR = '\0'
+
+    def __init__(self):
+        self._texts = {}
+        self.reset_statistics()
+
+    @classmethod
+    def search_text(cls, note):
+        """ Returns all the text from the note that should be searched, casefolded and joined into a single string """
+
+        return cls.SEPARATOR.join(note.tags + [note.body]).casefold()
+
+    @classmethod
+    def text_matches(cls, casefolded_string, search_text):
+        return casefolded_string in search_text
+
+    def get(self, note):
+        """ Returns search text for the note. The text is computed only if this particular version of the note
+            has not been seen before. Notes without ids are not cached. """
+
+        entry = self._texts.get(note.id) if note.id != None else None
+
+        # NOTE: Notes are replaced rather than modified when edited so a different object means a different version.
+        if entry != None and entry[0] is note:
+            self._hits += 1
+            return entry[1]
+
+        self._misses += 1
+
+        text = self.search_text(note)
+        if note.id != None:
+            self._texts[note.id] = (note, text)
+
+        return text
+
+    def copy(self):
+        """ Returns a new cache with the same texts. Meant to be used in another thread while this one keeps
+            being used and modified in the GUI thread. Statistics are not copied. """
+
+        other = self.__class__()
+        other._texts = dict(self._texts)
+
+        return other
+
+    def merge(self, other):
+        """ Takes texts computed by a copy of this cache. They must be for notes that are still current. """
+
+        self._texts.update(other._texts)
+
+    def invalidate(self, note_id):
+        self._texts.pop(note_id, None)
+
+    def clear(self):
+        self._texts.clear()
+
+    def __len__(self):
+        return len(self._texts)
+
+    def hits(self):
+        return self._hits
+
+    def misses(self):
+        return self._misses
+
+    def hit_rate(self):
+        """ Returns the fraction of get() calls that did not have to compute the text. 0.0 if there were no calls. """
+
+        if self._hits + self._misses == 0:
+            return 0.0
+
+        return self._hits / (self._hits + self._misses)
+
+    def reset_statistics(self):
+        self._hits   = 0
+        self._misses = 0
@@ -0,0 +1,215 @@
+""" Stores the tape in an SQLite database. Unlike a JSON file, the database does not have to be rewritten
+    as a whole on every save. Only notes that have been added, edited or moved since the last save are
+    written and notes removed from the tape are deleted. """
+
+import os
+import sqlite3
+import stat
+import tempfile
+
+from .note               import Note
+from .note_file_writer   import UMASK
+from .note_model_helpers import note_links, load_notes, assign_note_ids
+
+FORMAT_VERSION = 1
+FILE_SUFFIX    = '.sqlite'
+
+# Files SQLite keeps next to the database while a transaction is in progress. If the application crashes,
+# they're left behind and applied to whatever database has that name when it's opened next time.
+JOURNAL_SUFFIXES = ['-journal', '-wal']
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS notes (
+        id              INTEGER PRIMARY KEY,
+        body            TEXT    NOT NULL,
+        created_at      TEXT    NOT NULL,
+        modified_at     TEXT    NOT NULL,
+        parent_id       INTEGER,
+        prev_sibling_id INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tags (
+        note_id  INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        tag      TEXT    NOT NULL,
+        PRIMARY KEY (note_id, position)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag)"
+]
+
+class UnsupportedFormatVersion(Exception): pass
+
+def is_store_file(file_name):
+    return file_name.endswith(FILE_SUFFIX)
+
+def _remove_if_exists(file_name):
+    try:
+        os.remove(file_name)
+    except FileNotFoundError:
+        pass
+
+class SqliteNoteStore:
+    # Number of rows fetched from the database at a time while loading
+    FETCH_SIZE = 1000
+
+    @classmethod
+    def create(cls, file_name, model):
+        """ Writes all notes from the model into a new database that replaces the file if it exists and returns
+            the store opened on it. The database is written to a temporary file in the same directory first so
+            if anything goes wrong, the original file remains intact. """
+
+        # NOTE: Replacing the link itself would turn it into a regular file
+        file_name = os.path.realpath(file_name)
+
+        (file_descriptor, temporary_path) = tempfile.mkstemp(
+            dir    = os.path.dirname(file_name),
+            prefix = os.path.basename(file_name) + '.',
+            suffix = '.tmp'
+        )
+
+        try:
+            # NOTE: mkstemp() makes the file readable only by its owner. See write_atomically().
+            try:
+                mode = stat.S_IMODE(os.stat(file_name).st_mode)
+            except FileNotFoundError:
+                mode = 0o666 & ~UMASK
+            os.chmod(file_descriptor, mode)
+            os.close(file_descriptor)
+
+            # NOTE: SQLite treats an empty file as an empty database
+            temporary_store = cls(temporary_path)
+            try:
+                temporary_store.save(model)
+            finally:
+                temporary_store.close()
+
+            # NOTE: A journal left behind by the database being replaced would be rolled back into the new one
+            for suffix in JOURNAL_SUFFIXES:
+                _remove_if_exists(file_name + suffix)
+
+            os.replace(temporary_path, file_name)
+        except BaseException:
+            for path in [temporary_path] + [temporary_path + suffix for suffix in JOURNAL_SUFFIXES]:
+                _remove_if_exists(path)
+            raise
+
+        store        = cls(file_name)
+        store._saved = temporary_store._saved
+
+        return store
+
+    def __init__(self, file_name):
+        """ Opens the database or creates an empty one if the file does not exist """
+
+        self._connection = sqlite3.connect(file_name)
+
+        try:
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        except sqlite3.DatabaseError:
+            # Not a database at all
+            self._connection.close()
+            raise
+
+        if version == 0:
+            with self._connection:
+                for statement in SCHEMA:
+                    self._connection.execute(statement)
+
+                self._connection.execute("PRAGMA user_version = {}".format(FORMAT_VERSION))
+        elif version != FORMAT_VERSION:
+            self._connection.close()
+            raise UnsupportedFormatVersion("Expected format version {}, got {}".format(FORMAT_VERSION, version))
+
+        # What was written to the database for each note in the last save or read in the last load, indexed by
+        # note id: the note object, its modification time and its parent and previous sibling ids.
+        # NOTE: Notes are replaced rather than modified when edited so a different object means a different version.
+        self._saved = {}
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def load(self):
+        """ Reads all notes into a new model. Notes are read in batches and converted one by one, without
+            first building a list of all of them. """
+
+        model = load_notes(self._raw_notes())
+        self._saved = {note.id: (note, note.modified_at, parent_id, prev_sibling_id) for (note, parent_id, prev_sibling_id) in note_links(model)}
+
+        return model
+
+    def save(self, model):
+        """ Writes notes that differ from what has been saved or loaded before and deletes notes that are
+            no longer in the model. Everything is done in a single transaction. Returns the number of notes written. """
+
+        assign_note_ids(model)
+
+        saved       = {}
+        dirty_notes = []
+        for (note, parent_id, prev_sibling_id) in note_links(model):
+            entry          = (note, note.modified_at, parent_id, prev_sibling_id)
+            saved_entry    = self._saved.get(note.id)
+            saved[note.id] = entry
+
+            if saved_entry == None or saved_entry[0] is not note or saved_entry[1:] != entry[1:]:
+                dirty_notes.append(entry)
+
+        removed_ids = set(self._saved.keys()) - set(saved.keys())
+
+        with self._connection:
+            for (note, modified_at, parent_id, prev_sibling_id) in dirty_notes:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO notes (id, body, created_at, modified_at, parent_id, prev_sibling_id) VALUES (?, ?, ?, ?, ?, ?)",
+                    (note.id, note.body, Note.serialize_timestamp(note.created_at), Note.serialize_timestamp(modified_at), parent_id, prev_sibling_id)
+                )
+                self._connection.execute("DELETE FROM tags WHERE note_id = ?", (note.id,))
+                self._connection.executemany(
+                    "INSERT INTO tags (note_id, position, tag) VALUES (?, ?, ?)",
+                    [(note.id, position, tag) for (position, tag) in enumerate(note.tags)]
+                )
+
+            self._connection.executemany("DELETE FROM notes WHERE id = ?",    [(note_id,) for note_id in removed_ids])
+            self._connection.executemany("DELETE FROM tags WHERE note_id = ?", [(note_id,) for note_id in removed_ids])
+
+        self._saved = saved
+        return len(dirty_notes)
+
+    def _raw_notes(self):
+        """ Yields notes in the format produced by dump_notes() """
+
+        # NOTE: Both queries return rows sorted by note id so tags can be matched with notes
+        # by walking both result sets at the same time.
+        note_cursor = self._connection.execute("SELECT id, body, created_at, modified_at, parent_id, prev_sibling_id FROM notes ORDER BY id")
+        tag_cursor  = self._connection.cursor()
+        tag_cursor.execute("SELECT note_id, tag FROM tags ORDER BY note_id, position")
+
+        tag_row = tag_cursor.fetchone()
+        while True:
+            rows = note_cursor.fetchmany(self.FETCH_SIZE)
+            if len(rows) == 0:
+                break
+
+            for (note_id, body, created_at, modified_at, parent_id, prev_sibling_id) in rows:
+                # Skip tags of notes that no longer exist
+                while tag_row != None and tag_row[0] < note_id:
+                    tag_row = tag_cursor.fetchone()
+
+                tags = []
+                while tag_row != None and tag_row[0] == note_id:
+                    tags.append(tag_row[1])
+                    tag_row = tag_cursor.fetchone()
+
+                yield {
+                    'id':              note_id,
+                    'body':            body,
+                    'tags':            tags,
+                    'created_at':      created_at,
+                    'modified_at':     modified_at,
+                    'parent_id':       parent_id,
+                    'prev_sibling_id': prev_sibling_id
+                }
@@ -0,0 +1,110 @@
+""" A panel that lists all tags used in the tape along with the number of notes having them.
+    Clicking a tag filters the tape to show only notes with that tag. """
+
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QListWidget, QListWidgetItem
+from PyQt5.QtCore    import Qt, QTimer
+
+from .search_query import SearchQuery
+
+class TagFacetWidget(QWidget):
+    def __init__(self, parent = None):
+        super().__init__(parent)
+
+        self._main_layout = QVBoxLayout(self)
+        self._tag_list    = QListWidget(self)
+
+        self._main_layout.addWidget(self._tag_list)
+
+        self._tape_widget = None
+
+        # NOTE: The index changes once per model operation. Adding many notes one by one would
+        # refresh the list many times in a row so refreshes are postponed until control returns
+        # to the event loop.
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(0)
+
+        self._refresh_timer.timeout.connect(self.refresh)
+        self._tag_list.itemClicked.connect(self._item_clicked_handler)
+        self._tag_list.itemActivated.connect(self._item_clicked_handler)
+
+    def set_tape_widget(self, tape_widget):
+        if self._tape_widget != None:
+            self._tape_widget.proxy_model().index_changed.disconnect(self._refresh_timer.start)
+
+        self._tape_widget = tape_widget
+        self._tape_widget.proxy_model().index_changed.connect(self._refresh_timer.start)
+        self.refresh()
+
+    def tape_widget(self):
+        return self._tape_widget
+
+    def tag_counts(self):
+        """ Returns (tag, count) pairs in the order in which they are listed in the panel """
+
+        return [(item.data(Qt.UserRole), item.data(Qt.UserRole + 1)) for item in self._items()]
+
+    def refresh(self):
+        """ Updates the list from the tag counts maintained by the index of the tape. Does not need to look at the notes. """
+
+        self._refresh_timer.stop()
+
+        if self._tape_widget == None:
+            self._tag_list.clear()
+            return
+
+        tag_counts = self._tape_widget.proxy_model().note_index().tag_counts()
+
+        # Most common tags first
+        sorted_tag_counts = sorted(tag_counts.items(), key = lambda tag_count: (-tag_count[1], tag_count[0].casefold()))
+
+        # NOTE: Items are updated in place rather than recreated. Clearing the list would reset the selection
+        # and the scroll position every time a note is edited.
+        current_item = self._tag_list.currentItem()
+        current_tag  = current_item.data(Qt.UserRole) if current_item != None else None
+
+        while self._tag_list.count() > len(sorted_tag_counts):
+            self._tag_list.takeItem(self._tag_list.count() - 1)
+
+        current_row = -1
+        for (row, (tag, count)) in enumerate(sorted_tag_counts):
+            item = self._tag_list.item(row)
+            if item == None:
+                item = QListWidgetItem()
+                self._tag_list.addItem(item)
+
+            if item.data(Qt.UserRole) != tag or item.data(Qt.UserRole + 1) != count:
+                item.setText("{} ({})".format(tag, count))
+                item.setData(Qt.UserRole,     tag)
+                item.setData(Qt.UserRole + 1, count)
+
+            if tag == current_tag:
+                current_row = row
+
+        # The selected tag may have moved to a different row or disappeared.
+        # NOTE: Changing the current row scrolls the list to it. The user should stay where they were.
+        if current_tag != None and current_row != self._tag_list.currentRow():
+            scroll_position = self._tag_list.verticalScrollBar().value()
+            self._tag_list.setCurrentRow(current_row)
+            self._tag_list.verticalScrollBar().setValue(scroll_position)
+
+    @classmethod
+    def tag_filter(cls, tag):
+        """ Returns a query that matches notes with the tag """
+
+        if tag.startswith('"') or any(character.isspace() for character in tag):
+            return 'tag:' + SearchQuery.quote(tag)
+        else:
+            return 'tag:{}'.format(tag)
+
+    def select_tag(self, tag):
+        """ Filters the tape to show only notes having the tag """
+
+        if self._tape_widget != None:
+            self._tape_widget.set_filter(self.tag_filter(tag))
+
+    def _items(self):
+        return [self._tag_list.item(row) for row in range(self._tag_list.count())]
+
+    def _item_clicked_handler(self, item):
+        self.select_tag(item.data(Qt.UserRole))
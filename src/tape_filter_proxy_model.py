@@ -1,25 +1,231 @@
-from PyQt5.QtCore import QRegExp, QSortFilterProxyModel
+from PyQt5.QtCore import Qt, QRegExp, QModelIndex, QSortFilterProxyModel, QTimer, pyqtSignal
 
-from .note import Note
+from .note               import Note
+from .note_index         import NoteIndex
+from .search_text_cache  import SearchTextCache
+from .search_query       import SearchQuery
+from .model_helpers      import subtree_indexes
+from .background_indexer import BackgroundIndexer
 
 class TapeFilterProxyModel(QSortFilterProxyModel):
+    # Models with more notes are indexed in the background when set. Smaller ones are indexed right away
+    # because it takes less time than waiting for the thread pool.
+    SYNCHRONOUS_INDEXING_LIMIT = 1000
+
+    # Emitted when all notes that were left to be indexed in the background have been indexed
+    background_indexing_finished = pyqtSignal()
+
+    # Emitted after notes have been added to or removed from the index
+    index_changed = pyqtSignal()
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+
+        self._note_index = NoteIndex()
+
+        # Ids of indexed notes that match the current query. None if the filter has been set in some
+        # other way than setFilterFixedString() - in that case the rows are matched one by one.
+        self._accepted_ids   = None
+        self._accepted_query = None
+
+        # Whether the current filter accepts everything. Checked for every row so it's determined once per filter.
+        # None if it needs to be determined again.
+        self._filter_empty = None
+
+        self._search_text_cache     = SearchTextCache()
+        self._incremental_filtering = True
+
+        # Incremented whenever the index changes. Lets us detect that filter results computed
+        # in the background from a snapshot of notes are no longer up to date.
+        self._index_revision = 0
+
+        # Ids of notes that match the filter or have a matching descendant. Used only in ancestor-preserving
+        # mode. None if it needs to be recomputed.
+        self._ancestor_preserving_filter = False
+        self._visible_ids                = None
+
+        # NOTE: A change deep in the tree may change visibility of ancestors that the base class has already
+        # filtered and won't check again. Such changes are applied by refiltering everything once the
+        # model is done emitting signals.
+        self._refilter_timer = QTimer(self)
+        self._refilter_timer.setSingleShot(True)
+        self._refilter_timer.setInterval(0)
+        # NOTE: PyQt keeps a strong reference to a wrapped C++ method connected to a signal. Connected directly,
+        # invalidateFilter() would keep the proxy alive after the garbage collector has cleared its attributes.
+        self._refilter_timer.timeout.connect(self._refilter_timer_handler)
+
+        # Postings loaded from disk, to be used by the next setSourceModel() call
+        self._stored_index = None
+
+        # Notes from the source model that are waiting to be indexed in the background, by id. Until
+        # they're indexed, they're matched against the filter one by one, just like notes without ids.
+        self._pending_notes      = {}
+        self._background_indexer = BackgroundIndexer(self)
+        self._background_indexer.terms_ready.connect(self._terms_ready_handler)
+
+    def note_index(self):
+        """ Returns the index of all notes in the source model.
+
+            The index should be treated as read-only. It's kept up to date by the proxy. """
+
+        return self._note_index
+
+    def search_text_cache(self):
+        """ Returns the cache of texts searched by the fixed string filter. Useful mostly for checking its hit rate. """
+
+        return self._search_text_cache
+
+    def set_incremental_filtering(self, enabled):
+        """ In incremental mode, when the new fixed string contains the previous one, only the notes that
+            matched the previous string are checked. This keeps search-as-you-type fast on large tapes. """
+
+        self._incremental_filtering = enabled
+
+    def incremental_filtering(self):
+        return self._incremental_filtering
+
+    def set_ancestor_preserving_filter(self, enabled):
+        """ In ancestor-preserving mode a note is accepted if it matches the filter or if any of its descendants does.
+            Visibility of all notes is determined in a single pass over the whole tree and cached until the filter
+            or the model changes. """
+
+        self._ancestor_preserving_filter = enabled
+        self._visible_ids                = None
+        self.invalidateFilter()
+
+    def ancestor_preserving_filter(self):
+        return self._ancestor_preserving_filter
+
+    def set_stored_index(self, stored_index):
+        """ Makes the next setSourceModel() call take postings from a StoredIndex (see index_store) rather than
+            build the index from scratch. Notes that have been modified since the postings were saved are
+            indexed in the background. """
+
+        self._stored_index = stored_index
+
+    def is_indexing(self):
+        """ Returns True if some notes from the source model are still being indexed in the background """
+
+        return len(self._pending_notes) > 0
+
+    def setSourceModel(self, source_model):
+        old_source_model = self.sourceModel()
+        if old_source_model != None:
+            old_source_model.rowsInserted.disconnect(self._rows_inserted_handler)
+            old_source_model.rowsAboutToBeRemoved.disconnect(self._rows_about_to_be_removed_handler)
+            old_source_model.dataChanged.disconnect(self._data_changed_handler)
+            old_source_model.modelReset.disconnect(self._model_reset_handler)
+
+        # NOTE: QSortFilterProxyModel connects its own handlers to the same signals in setSourceModel().
+        # Slots are executed in the order of connection and the index must already be up to date when
+        # the proxy starts filtering new rows so ours must be connected first.
+        source_model.rowsInserted.connect(self._rows_inserted_handler)
+        source_model.rowsAboutToBeRemoved.connect(self._rows_about_to_be_removed_handler)
+        source_model.dataChanged.connect(self._data_changed_handler)
+        source_model.modelReset.connect(self._model_reset_handler)
+
+        self._rebuild_index(source_model)
+
+        super().setSourceModel(source_model)
+
     def filterAcceptsRow(self, source_row, source_parent):
-        # FIXME: This filter is very slow for large amounts of data (like 3k+ notes).
-        # index() and data() calls below seem to be quite heavy - the filter is slow even
-        # if I return immediately after them.
+        # NOTE: An empty filter accepts everything. Checking notes against it would only make us read their bodies.
+        if self._filter_empty == None:
+            self._filter_empty = self._filter_is_empty()
+
+        if self._filter_empty:
+            return True
+
+        # FIXME: index() and data() calls below seem to be quite heavy - filtering large amounts
+        # of data (like 3k+ notes) is slow even if we return immediately after them.
         source_model = self.sourceModel()
         index = source_model.index(source_row, 0, source_parent)
         note  = source_model.data(index)
         assert isinstance(note, Note)
 
-        return self.__class__.note_matches(self.filterRegExp(), note)
+        # NOTE: Notes without ids are not indexed and can only be accepted if they match themselves
+        if self._ancestor_preserving_filter and note.id != None:
+            if self._visible_ids == None:
+                self._visible_ids = set()
+                self._find_visible_notes(source_model, QModelIndex(), self._visible_ids)
+
+            return note.id in self._visible_ids
+
+        return self._note_accepted(note)
 
     def setFilterFixedString(self, fixed_string):
+        """ Sets the filter to a search query. Queries can contain clauses like 'tag:work', 'created:>2013-01-01',
+            'modified:<7d' or '"exact phrase"'. A string that does not contain any of them is matched verbatim,
+            as a case-insensitive fixed string. See SearchQuery for details. """
+
+        query = SearchQuery.parse(fixed_string)
+
+        # NOTE: The set must be ready before setFilterRegExp() because that's when the rows get filtered.
+        self._accepted_ids   = self._find_matching_ids(query, self._refined_candidate_ids(query))
+        self._accepted_query = query
+        self._visible_ids    = None
+        self._filter_empty   = None
+
         # In case of fixed strings we want case-insensitive match
-        super().setFilterFixedString(fixed_string)
+        super().setFilterRegExp(QRegExp(fixed_string, Qt.CaseInsensitive, QRegExp.FixedString))
+
+    def filter_snapshot(self, fixed_string):
+        """ Returns what's needed to find notes matching the query in another thread: the parsed query,
+            ids of notes that matched the current query if the new one is a refinement of it (None otherwise),
+            the index, a copy of the search text cache and the revision of the index they were taken from.
+
+            Only the ids and the cache are copied. Candidates are selected from the index and their search texts
+            computed in the other thread (see FilterTask). Notes are never modified in place once in
+            the model (they are replaced with new objects) so it's safe to check them while the model is being
+            edited. The index itself may change while it's being read but the revision changes first so the
+            result is then rejected by apply_filter_result(). """
+
+        query         = SearchQuery.parse(fixed_string)
+        candidate_ids = self._refined_candidate_ids(query)
+
+        return (
+            query,
+            frozenset(candidate_ids) if candidate_ids != None else None,
+            self._note_index,
+            self._search_text_cache.copy(),
+            self._index_revision
+        )
+
+    def apply_filter_result(self, fixed_string, accepted_ids, index_revision, search_text_cache = None):
+        """ Sets the filter using ids of matching notes found by the caller, without checking the notes
+            again. search_text_cache is the copy taken by filter_snapshot(); texts computed in it are kept.
+            Returns False and leaves the filter unchanged if the result is out of date.
+
+            If neither the query nor the result have changed, the rows are not filtered again. """
+
+        if index_revision != self._index_revision:
+            return False
+
+        if search_text_cache != None:
+            self._search_text_cache.merge(search_text_cache)
+
+        if self._accepted_ids != None and self.filterRegExp().pattern() == fixed_string and self._accepted_ids == accepted_ids:
+            return True
 
-        regex = self.filterRegExp()
-        super().setFilterRegExp(QRegExp(regex.pattern(), False, regex.patternSyntax()))
+        self._accepted_ids   = set(accepted_ids)
+        self._accepted_query = SearchQuery.parse(fixed_string)
+        self._visible_ids    = None
+        self._filter_empty   = None
+        super().setFilterRegExp(QRegExp(fixed_string, Qt.CaseInsensitive, QRegExp.FixedString))
+
+        return True
+
+    def setFilterRegExp(self, *args):
+        self._accepted_ids = None
+        self._visible_ids  = None
+        self._filter_empty = None
+        super().setFilterRegExp(*args)
+
+    def setFilterWildcard(self, *args):
+        self._accepted_ids = None
+        self._visible_ids  = None
+        self._filter_empty = None
+        super().setFilterWildcard(*args)
 
     @classmethod
     def note_matches(cls, regex, note):
@@ -28,3 +234,273 @@ class TapeFilterProxyModel(QSortFilterProxyModel):
                 return True
 
         return False
+
+    def _filter_is_empty(self):
+        if self._accepted_ids == None:
+            return self.filterRegExp().isEmpty()
+
+        return self._accepted_query.is_empty()
+
+    def _note_accepted(self, note):
+        """ Checks whether the note itself matches the current filter """
+
+        if self._accepted_ids == None:
+            return self.__class__.note_matches(self.filterRegExp(), note)
+
+        if not self._note_index.contains(note):
+            return self._query_matches(self._accepted_query, note)
+
+        return note.id in self._accepted_ids
+
+    def _find_visible_notes(self, source_model, parent, visible_ids):
+        """ Adds ids of visible notes from subtrees of all children of parent to visible_ids.
+            Returns True if at least one of the children is visible.
+
+            Children are processed before their parents (post-order) so that each note needs to be checked only once. """
+
+        any_child_visible = False
+        for row in range(source_model.rowCount(parent)):
+            index = source_model.index(row, 0, parent)
+            note  = source_model.data(index, Qt.EditRole)
+
+            descendant_visible = source_model.rowCount(index) > 0 and self._find_visible_notes(source_model, index, visible_ids)
+
+            if descendant_visible or isinstance(note, Note) and self._note_accepted(note):
+                if note.id != None:
+                    visible_ids.add(note.id)
+                any_child_visible = True
+
+        return any_child_visible
+
+    def _note_visible(self, source_model, index):
+        """ Checks whether the note matches the filter or has a visible child. Visibility of its children must be up to date. """
+
+        note = source_model.data(index, Qt.EditRole)
+        if not isinstance(note, Note):
+            return False
+
+        if self._note_accepted(note):
+            return True
+
+        for row in range(source_model.rowCount(index)):
+            child = source_model.data(source_model.index(row, 0, index), Qt.EditRole)
+            if isinstance(child, Note) and (child.id in self._visible_ids if child.id != None else self._note_accepted(child)):
+                return True
+
+        return False
+
+    def _update_note_visibility(self, source_model, index):
+        """ Updates the cached visibility of a single note. Returns True if visibility of its parent may have changed. """
+
+        note = source_model.data(index, Qt.EditRole)
+        if not isinstance(note, Note) or note.id == None:
+            # Visibility of notes without ids is not cached
+            return True
+
+        visible = self._note_visible(source_model, index)
+        if visible == (note.id in self._visible_ids):
+            return False
+
+        if visible:
+            self._visible_ids.add(note.id)
+        else:
+            self._visible_ids.discard(note.id)
+
+        return True
+
+    def _update_visible_notes(self, source_model, indexes):
+        """ Updates the cached visibility of notes that have been added or changed and of their ancestors.
+            Children must come before their parents. Only the affected branches are checked, not the whole tree. """
+
+        if self._visible_ids == None:
+            return
+
+        ancestors_changed = False
+        for index in indexes:
+            if not self._update_note_visibility(source_model, index):
+                continue
+
+            ancestor = index.parent()
+            while ancestor.isValid() and self._update_note_visibility(source_model, ancestor):
+                ancestors_changed = True
+                ancestor          = ancestor.parent()
+
+        # NOTE: The base class checks only the rows that have been added or changed, not their ancestors
+        if ancestors_changed and self._ancestor_preserving_filter:
+            self._refilter_timer.start()
+
+    def _invalidate_visible_notes(self):
+        if self._visible_ids == None:
+            return
+
+        self._visible_ids = None
+        if self._ancestor_preserving_filter:
+            self._refilter_timer.start()
+
+    def _refined_candidate_ids(self, query):
+        """ If all notes matching the new query must have matched the current one, returns ids
+            of notes that matched the current one. Otherwise returns None. """
+
+        if not self._incremental_filtering or self._accepted_ids == None:
+            return None
+
+        if not query.is_refinement_of(self._accepted_query):
+            return None
+
+        return self._accepted_ids
+
+    def _query_matches(self, query, note):
+        # NOTE: Bodies are not read unless the query really needs them. Reading all of them is slow on large
+        # binary tapes and the search text cache would keep copies of them.
+        if query.is_empty():
+            return True
+
+        return query.matches(note, self._search_text_cache.get(note) if query.needs_search_text() else None)
+
+    def _find_matching_ids(self, query, candidate_ids = None):
+        if query.is_empty():
+            return set(self._note_index.ids())
+
+        return query.find_matching_ids(self._note_index, self._search_text_cache.get, candidate_ids)
+
+    def _rebuild_index(self, source_model):
+        # NOTE: It's faster to find all matching notes after indexing than to check them one by one
+        filter_active      = self._accepted_ids != None
+        self._accepted_ids = None
+
+        self._background_indexer.cancel()
+        self._pending_notes = {}
+
+        self._note_index.clear()
+        self._search_text_cache.clear()
+        self._visible_ids     = None
+        self._index_revision += 1
+
+        (stored_index, self._stored_index) = (self._stored_index, None)
+        if stored_index != None:
+            self._load_stored_index(source_model, stored_index)
+        else:
+            notes = self._indexable_notes(source_model)
+            if len(notes) <= self.SYNCHRONOUS_INDEXING_LIMIT:
+                for note in notes:
+                    self._index_note(note)
+            else:
+                self._index_in_background(notes)
+
+        if filter_active:
+            self._accepted_ids = self._find_matching_ids(self._accepted_query)
+            self._filter_empty = None
+
+        self.index_changed.emit()
+
+    @classmethod
+    def _indexable_notes(cls, source_model):
+        notes = [
+            source_model.data(index, Qt.EditRole)
+            for index in subtree_indexes(source_model, QModelIndex(), 0, source_model.rowCount() - 1)
+        ]
+
+        return [note for note in notes if isinstance(note, Note) and note.id != None]
+
+    def _load_stored_index(self, source_model, stored_index):
+        notes = self._indexable_notes(source_model)
+
+        up_to_date_notes = [note for note in notes if stored_index.is_up_to_date(note)]
+        outdated_notes   = [note for note in notes if not stored_index.is_up_to_date(note)]
+
+        self._note_index.load_postings(up_to_date_notes, *stored_index.postings(note.id for note in up_to_date_notes))
+        self._index_in_background(outdated_notes)
+
+    def _index_in_background(self, notes):
+        """ Queues the notes for indexing in a background thread. Until then they're matched against the filter one by one. """
+
+        if len(notes) == 0:
+            return
+
+        # NOTE: Ids of notes that are not indexed yet must not be given to new notes
+        self._note_index.reserve_id(max(note.id for note in notes))
+
+        self._pending_notes = {note.id: note for note in notes}
+        self._background_indexer.start(notes)
+
+    def _discard_pending_note(self, note_id):
+        if not note_id in self._pending_notes:
+            return
+
+        del self._pending_notes[note_id]
+        if len(self._pending_notes) == 0:
+            self._background_indexer.cancel()
+            self.background_indexing_finished.emit()
+
+    def _index_note(self, note, terms = None):
+        self._index_revision += 1
+        self._search_text_cache.invalidate(note.id)
+
+        if self._note_index.add_note(note, terms) and self._accepted_ids != None:
+            if self._query_matches(self._accepted_query, note):
+                self._accepted_ids.add(note.id)
+            else:
+                self._accepted_ids.discard(note.id)
+
+        # NOTE: If a newer version of a pending note gets indexed, the old one must not be indexed later
+        self._discard_pending_note(note.id)
+
+    def _index_notes(self, source_model, parent, first, last):
+        for index in subtree_indexes(source_model, parent, first, last):
+            note = source_model.data(index, Qt.EditRole)
+            if isinstance(note, Note):
+                self._index_note(note)
+
+    def _rows_inserted_handler(self, parent, first, last):
+        source_model = self.sourceModel()
+        self._index_notes(source_model, parent, first, last)
+        self._update_visible_notes(source_model, reversed(list(subtree_indexes(source_model, parent, first, last))))
+        self.index_changed.emit()
+
+    def _rows_about_to_be_removed_handler(self, parent, first, last):
+        source_model = self.sourceModel()
+        for index in subtree_indexes(source_model, parent, first, last):
+            note = source_model.data(index, Qt.EditRole)
+            if isinstance(note, Note) and self._note_index.contains(note):
+                self._note_index.remove_note(note.id)
+                self._search_text_cache.invalidate(note.id)
+                self._invalidate_visible_notes()
+                self._index_revision += 1
+
+                if self._accepted_ids != None:
+                    self._accepted_ids.discard(note.id)
+            elif isinstance(note, Note):
+                self._discard_pending_note(note.id)
+
+        self.index_changed.emit()
+
+    def _data_changed_handler(self, top_left, bottom_right, roles = []):
+        source_model    = self.sourceModel()
+        index_revision  = self._index_revision
+        changed_indexes = []
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            index = source_model.index(row, 0, top_left.parent())
+            note  = source_model.data(index, Qt.EditRole)
+
+            if isinstance(note, Note) and not self._note_index.contains(note):
+                self._index_note(note)
+                changed_indexes.append(index)
+
+        self._update_visible_notes(source_model, changed_indexes)
+
+        if self._index_revision != index_revision:
+            self.index_changed.emit()
+
+    def _model_reset_handler(self):
+        self._rebuild_index(self.sourceModel())
+
+    def _refilter_timer_handler(self):
+        self.invalidateFilter()
+
+    def _terms_ready_handler(self, results):
+        for (note, terms) in results:
+            # NOTE: The note might have been removed or replaced with a newer version in the meantime
+            if self._pending_notes.get(note.id) is note:
+                self._index_note(note, terms)
+
+        self.index_changed.emit()
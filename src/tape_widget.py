@@ -2,15 +2,16 @@
 
 from PyQt5.QtWidgets import QLineEdit, QVBoxLayout, QHBoxLayout, QScrollArea, QWidget, QPushButton, QTreeView, QAbstractItemView, QMessageBox
 from PyQt5.QtGui     import QStandardItem, QStandardItemModel
-from PyQt5.QtCore    import Qt, QModelIndex, QItemSelection, QItemSelectionModel
+from PyQt5.QtCore    import Qt, QModelIndex, QItemSelection, QItemSelectionModel, QPoint
 
 from datetime import datetime
 
 from .note_delegate           import NoteDelegate
 from .note                    import Note
 from .tape_filter_proxy_model import TapeFilterProxyModel
-from .model_helpers           import all_items, remove_items
-from .note_model_helpers      import item_to_id, set_item_note, all_notes, assign_note_ids
+from .filter_engine           import FilterEngine
+from .model_helpers           import all_items, remove_items, subtree_indexes
+from .note_model_helpers      import item_to_note, item_to_id, set_item_note, all_notes, assign_note_ids
 
 class TapeWidget(QWidget):
     def __init__(self, parent = None):
@@ -49,6 +50,17 @@ class TapeWidget(QWidget):
 
         self._tape_filter_proxy_model = TapeFilterProxyModel()
         self._note_delegate           = NoteDelegate()
+        self._filter_engine           = FilterEngine(self._tape_filter_proxy_model, self)
+
+        # NOTE: With variable row heights QTreeView asks for the height of every single row before it can
+        # show anything. Measuring all of them would make opening large tapes very slow.
+        self._note_delegate.set_estimate_heights(True)
+        self._note_delegate.set_preview_long_notes(True)
+
+        # Items of the tape model by the id of their note and the other way round (by id() of the item, because
+        # items are not hashable). Lets focus_note() find a note without walking the whole tree.
+        self._note_items    = {}
+        self._item_note_ids = {}
 
         self._tape_model = QStandardItemModel()
         self.set_model(self._tape_model)
@@ -59,7 +71,9 @@ class TapeWidget(QWidget):
         self._add_sibling_button.clicked.connect(self._new_sibling_handler)
         self._add_child_button.clicked.connect(self._new_child_handler)
         self._delete_note_button.clicked.connect(self.delete_selected_notes)
-        self._search_box.textChanged.connect(self._tape_filter_proxy_model.setFilterFixedString)
+        self._search_box.textChanged.connect(self._filter_engine.set_filter)
+        self._view.verticalScrollBar().valueChanged.connect(lambda value: self._scroll_handler())
+        self._view.verticalScrollBar().rangeChanged.connect(lambda minimum, maximum: self._scroll_handler())
 
     def model(self):
         """ Returns the model that contains all notes managed by the tape.
@@ -77,22 +91,45 @@ class TapeWidget(QWidget):
 
         return self._tape_filter_proxy_model
 
-    def set_model(self, model):
+    def set_model(self, model, stored_index = None):
+        """ Replaces the model. stored_index is an optional StoredIndex (see index_store) with
+            postings for notes from the model. It saves the time needed to index them. """
+
         assert (
             len(set([item_to_id(item) for item in all_items(model) if item_to_id(item) != None])) ==
             len(    [item_to_id(item) for item in all_items(model) if item_to_id(item) != None])
         )
 
+        # NOTE: Only notes that have ids can be indexed for searching
+        assign_note_ids(model)
+
         # NOTE: If there's an exception in setSourceModel(), we can hope that the source model
         # remains unchanged. That's why we assing to _tape_model only if that instruction succeeds.
+        old_model = self._tape_filter_proxy_model.sourceModel()
+        self._tape_filter_proxy_model.set_stored_index(stored_index)
         self._tape_filter_proxy_model.setSourceModel(model)
         self._tape_model = model
 
+        if old_model != None:
+            old_model.rowsInserted.disconnect(self._rows_inserted_handler)
+            old_model.rowsAboutToBeRemoved.disconnect(self._rows_about_to_be_removed_handler)
+            old_model.dataChanged.disconnect(self._data_changed_handler)
+            old_model.modelReset.disconnect(self._model_reset_handler)
+
+        model.rowsInserted.connect(self._rows_inserted_handler)
+        model.rowsAboutToBeRemoved.connect(self._rows_about_to_be_removed_handler)
+        model.dataChanged.connect(self._data_changed_handler)
+        model.modelReset.connect(self._model_reset_handler)
+
+        self._map_all_note_items()
+
     def notes(self):
         return all_notes(self._tape_model)
 
     def assign_ids(self):
-        assign_note_ids(self._tape_model)
+        # NOTE: Ids are assigned without notifying the model
+        if assign_note_ids(self._tape_model) > 0:
+            self._map_all_note_items()
 
     def create_empty_note(self):
         return Note(
@@ -116,6 +153,9 @@ class TapeWidget(QWidget):
         else:
             note = self.create_empty_note()
 
+        if note.id == None:
+            note.id = self._tape_filter_proxy_model.note_index().next_id()
+
         item = QStandardItem()
         set_item_note(item, note)
         parent_item.appendRow(item)
@@ -146,8 +186,144 @@ class TapeWidget(QWidget):
 
         self.clear_selection()
         self.set_note_selection(new_note_proxy_index, True)
+        self._note_delegate.measure([new_note_proxy_index])
         self._view.scrollTo(new_note_proxy_index)
 
+    def focus_note(self, note_id):
+        """ Selects the note with the specified id and scrolls the tape to it. Clears the filter if
+            the note does not match it. Returns False if there's no such note in the tape. """
+
+        note_item = self._note_items.get(note_id)
+        if note_item == None:
+            return False
+
+        if not self._tape_filter_proxy_model.mapFromSource(note_item.index()).isValid():
+            self.set_filter('')
+
+        # NOTE: Take the proxy index only after changing the filter. The old one may no longer be valid.
+        note_proxy_index = self._tape_filter_proxy_model.mapFromSource(note_item.index())
+
+        self.clear_selection()
+        self.set_note_selection(note_proxy_index, True)
+        self._note_delegate.measure([note_proxy_index])
+        self._view.scrollTo(note_proxy_index)
+
+        return True
+
+    def set_compact(self, enabled):
+        """ Switches between the default mode, in which whole notes are shown, and the compact mode, in which
+            every note takes just one line of text. In compact mode all rows have the same height so the view
+            does not need to know the size of every note to lay them out. """
+
+        self._note_delegate.set_compact(enabled)
+        self._view.setUniformRowHeights(enabled)
+
+        # NOTE: The view does not notice that size hints have changed on its own
+        self._view.doItemsLayout()
+
+    def compact(self):
+        return self._note_delegate.compact()
+
+    def set_show_ancestors_of_matches(self, enabled):
+        """ When enabled, the filter keeps ancestors of matching notes visible even if they do not match
+            themselves. Otherwise a matching note is hidden along with its parent. Disabled by default. """
+
+        self._tape_filter_proxy_model.set_ancestor_preserving_filter(enabled)
+
+    def show_ancestors_of_matches(self):
+        return self._tape_filter_proxy_model.ancestor_preserving_filter()
+
+    def set_render_profiler(self, profiler):
+        """ Makes the tape report timings of painting and measuring notes to a RenderProfiler. None disables profiling. """
+
+        self._note_delegate.set_profiler(profiler)
+
+    def render_profiler(self):
+        return self._note_delegate.profiler()
+
+    def measure_visible_notes(self):
+        """ Makes the delegate measure notes that are visible or can become visible after scrolling by
+            less than a page in either direction. Other notes keep their estimated heights. """
+
+        self._note_delegate.measure(self._indexes_near_viewport())
+
+    def prerender_notes_near_viewport(self):
+        """ Makes the delegate render notes that are not visible but can become visible after scrolling
+            by less than a page. They're rendered in the background and cached until they're painted. """
+
+        viewport_rect = self._view.viewport().rect()
+        self._note_delegate.prerender([
+            (index, self._view.visualRect(index).width())
+            for index in self._indexes_near_viewport()
+            if not self._view.visualRect(index).intersects(viewport_rect)
+        ])
+
+    def _indexes_near_viewport(self):
+        page_height = self._view.viewport().height()
+        top_index   = self._view.indexAt(QPoint(0, 0))
+        if not top_index.isValid():
+            return []
+
+        indexes = []
+
+        index = top_index
+        while index.isValid() and self._view.visualRect(index).bottom() >= -page_height:
+            indexes.append(index)
+            index = self._view.indexAbove(index)
+
+        index = self._view.indexBelow(top_index)
+        while index.isValid() and self._view.visualRect(index).top() < 2 * page_height:
+            indexes.append(index)
+            index = self._view.indexBelow(index)
+
+        return indexes
+
+    def _scroll_handler(self):
+        self.measure_visible_notes()
+        self.prerender_notes_near_viewport()
+
+    def _map_note_item(self, item):
+        self._unmap_note_item(item)
+
+        note = item_to_note(item)
+        if not isinstance(note, Note) or note.id == None:
+            return
+
+        # NOTE: Ids should be unique but if they're not, the item inserted last wins
+        replaced_item = self._note_items.get(note.id)
+        if replaced_item != None:
+            del self._item_note_ids[id(replaced_item)]
+
+        self._note_items[note.id]     = item
+        self._item_note_ids[id(item)] = note.id
+
+    def _unmap_note_item(self, item):
+        note_id = self._item_note_ids.pop(id(item), None)
+        if note_id != None:
+            del self._note_items[note_id]
+
+    def _map_all_note_items(self):
+        self._note_items    = {}
+        self._item_note_ids = {}
+
+        for item in all_items(self._tape_model):
+            self._map_note_item(item)
+
+    def _rows_inserted_handler(self, parent, first, last):
+        for index in subtree_indexes(self._tape_model, parent, first, last):
+            self._map_note_item(self._tape_model.itemFromIndex(index))
+
+    def _rows_about_to_be_removed_handler(self, parent, first, last):
+        for index in subtree_indexes(self._tape_model, parent, first, last):
+            self._unmap_note_item(self._tape_model.itemFromIndex(index))
+
+    def _data_changed_handler(self, top_left, bottom_right, roles = []):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            self._map_note_item(self._tape_model.itemFromIndex(self._tape_model.index(row, 0, top_left.parent())))
+
+    def _model_reset_handler(self):
+        self._map_all_note_items()
+
     def remove_notes(self, indexes):
         remove_items(self._tape_model, indexes)
 
@@ -158,6 +334,10 @@ class TapeWidget(QWidget):
         # NOTE: This triggers textChanged() signal which applies the filter
         self._search_box.setText(text)
 
+        # NOTE: On large tapes the filter is applied asynchronously but callers expect it to be
+        # in effect when we return.
+        self._filter_engine.flush()
+
     def get_filter(self):
         return self._search_box.text()
 
@@ -0,0 +1,134 @@
+import unittest
+import os
+import tempfile
+from datetime import datetime
+
+import simplejson
+
+from PyQt5.QtCore import QCoreApplication
+from PyQt5.QtGui  import QStandardItem
+
+from .dummy_application   import application
+from ..note               import Note
+from ..note_model_helpers import load_notes, dump_notes, set_item_note
+from ..note_file_writer   import serialize_notes
+from ..note_journal       import NoteJournal, read_journal, replay_journal
+from ..index_store        import content_key
+from ..autosaver          import Autosaver
+
+class AutosaverTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_name           = os.path.join(self.temporary_directory.name, 'notes.json')
+
+        self.model = load_notes([])
+        self.model.appendRow(self.new_item(1, "A"))
+
+        self.autosaver = Autosaver()
+        self.autosaver.set_target(self.model, self.file_name)
+
+        self.saves    = []
+        self.failures = []
+        self.autosaver.saved.connect(lambda file_name, key, seconds: self.saves.append((file_name, key)))
+        self.autosaver.save_failed.connect(lambda file_name, message: self.failures.append(file_name))
+
+    def tearDown(self):
+        self.autosaver.set_target(None, None)
+        self.autosaver.wait_for_done()
+        self.temporary_directory.cleanup()
+
+    def new_item(self, note_id, body):
+        item = QStandardItem()
+        set_item_note(item, Note(body = body, tags = [], created_at = datetime(2013, 1, note_id), id = note_id))
+        return item
+
+    def file_content(self):
+        with open(self.file_name) as json_file:
+            return json_file.read()
+
+    def test_save_now_should_write_model_to_file(self):
+        self.autosaver.save_now()
+        self.assertTrue(self.autosaver.is_saving())
+
+        self.autosaver.wait_for_done()
+
+        content = serialize_notes(dump_notes(self.model))
+        self.assertFalse(self.autosaver.is_saving())
+        self.assertEqual(self.file_content(), content)
+        self.assertEqual(self.saves, [(self.file_name, content_key(content))])
+        self.assertIsNotNone(self.autosaver.last_latency())
+        self.assertEqual([name for name in os.listdir(self.temporary_directory.name)], ['notes.json'])
+
+    def test_changes_should_be_saved_together(self):
+        self.autosaver._save_timer.setInterval(0)
+
+        self.model.appendRow(self.new_item(2, "B"))
+        self.model.appendRow(self.new_item(3, "C"))
+        self.assertTrue(self.autosaver.is_scheduled())
+
+        QCoreApplication.processEvents()
+        self.autosaver.wait_for_done()
+
+        self.assertEqual(len(self.saves), 1)
+        self.assertEqual(self.file_content(), serialize_notes(dump_notes(self.model)))
+
+    def test_changes_made_during_save_should_be_saved_when_it_finishes(self):
+        self.autosaver.save_now()
+        self.model.appendRow(self.new_item(2, "B"))
+        self.autosaver.save_now()
+        self.assertTrue(self.autosaver.is_scheduled())
+
+        self.autosaver.wait_for_done()
+        self.autosaver.wait_for_done()
+
+        self.assertEqual(len(self.saves), 2)
+        self.assertEqual(self.file_content(), serialize_notes(dump_notes(self.model)))
+
+    def test_disabled_autosaver_should_not_schedule_saves(self):
+        self.autosaver.set_enabled(False)
+        self.model.appendRow(self.new_item(2, "B"))
+
+        self.assertFalse(self.autosaver.is_scheduled())
+
+    def test_journal_should_keep_only_changes_made_after_snapshot(self):
+        with open(self.file_name, 'w') as json_file:
+            json_file.write(serialize_notes(dump_notes(self.model)))
+
+        journal = NoteJournal(self.file_name, 'key')
+        journal.set_model(self.model)
+        self.autosaver.set_target(self.model, self.file_name, journal)
+
+        self.model.appendRow(self.new_item(2, "B"))
+        self.autosaver.save_now()
+        self.model.appendRow(self.new_item(3, "C"))
+        self.autosaver.set_enabled(False)
+        self.autosaver.wait_for_done()
+        journal.flush()
+
+        key = self.saves[0][1]
+        self.assertEqual(journal.key(), key)
+        self.assertEqual([entry['note']['id'] for entry in read_journal(self.file_name, key)], [3])
+
+        replayed_model = load_notes(simplejson.loads(self.file_content()))
+        replay_journal(replayed_model, self.file_name, key)
+        self.assertEqual(dump_notes(replayed_model), dump_notes(self.model))
+
+        journal.close()
+
+    def test_failed_save_should_be_reported(self):
+        missing_file_name = os.path.join(self.temporary_directory.name, 'missing', 'notes.json')
+        self.autosaver.set_target(self.model, missing_file_name)
+
+        self.autosaver.save_now()
+        self.autosaver.wait_for_done()
+
+        self.assertEqual(self.failures, [missing_file_name])
+        self.assertEqual(self.saves, [])
+        self.assertFalse(self.autosaver.is_saving())
+
+    def test_result_of_save_for_previous_target_should_be_ignored(self):
+        self.autosaver.save_now()
+        self.autosaver.set_target(None, None)
+        self.autosaver.wait_for_done()
+
+        self.assertEqual(self.saves, [])
@@ -0,0 +1,131 @@
+import unittest
+import os
+import tempfile
+from datetime import datetime
+
+from .dummy_application   import application
+from ..note               import Note
+from ..note_model_helpers import load_notes, dump_notes, load_note_links, snapshot_notes, item_to_note
+from ..binary_note_file   import BinaryNoteFile, MappedNote, InvalidFormat, UnsupportedFormatVersion, HEADER, RECORD
+from ..note_file_writer   import write_atomically
+from ..binary_note_file   import encode_notes, encode_snapshot, header_key, is_binary_note_file
+
+class BinaryNoteFileTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_name           = os.path.join(self.temporary_directory.name, 'notes.tape')
+
+        self.raw_notes = [
+            {'id': 1, 'body': "A",         'tags': ["x", "y"], 'parent_id': None, 'prev_sibling_id': None},
+            {'id': 2, 'body': "B\nżółw",   'tags': [],         'parent_id': None, 'prev_sibling_id': 1},
+            {'id': 3, 'body': "",          'tags': ["ź"],      'parent_id': 1,    'prev_sibling_id': None},
+            {'id': 7, 'body': "D",         'tags': ["y", "x"], 'parent_id': 1,    'prev_sibling_id': 3}
+        ]
+        for note_dict in self.raw_notes:
+            note_dict['created_at']  = Note.serialize_timestamp(datetime(2013, 1, note_dict['id']))
+            note_dict['modified_at'] = Note.serialize_timestamp(datetime(2013, 2, note_dict['id'], 1, 2, 3, 456789))
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def write(self, content):
+        with open(self.file_name, 'wb') as note_file:
+            note_file.write(content)
+
+    def test_conversion_from_json_format_and_back_should_be_lossless(self):
+        content = encode_notes(self.raw_notes)
+        self.write(content)
+
+        note_file = BinaryNoteFile(self.file_name)
+
+        self.assertEqual(len(note_file), 4)
+        self.assertEqual(note_file.key(), header_key(content))
+        self.assertEqual(list(note_file.raw_notes()), self.raw_notes)
+
+    def test_tags_should_be_stored_only_once(self):
+        content = encode_notes(self.raw_notes)
+
+        (magic, version, key, note_count, tag_count, tag_id_count) = HEADER.unpack_from(content)
+        self.assertEqual(tag_count,    3)
+        self.assertEqual(tag_id_count, 5)
+        self.assertEqual(content.count("ź".encode('utf-8')), 1)
+
+    def test_bodies_should_not_be_kept_in_memory_after_being_decoded(self):
+        self.write(encode_notes(self.raw_notes))
+
+        model = load_note_links(BinaryNoteFile(self.file_name).note_links())
+        notes = [item_to_note(model.item(0)), item_to_note(model.item(1))]
+
+        self.assertTrue(all(isinstance(note, MappedNote) and not note.is_materialized() for note in notes))
+        self.assertEqual(notes[1].body, "B\nżółw")
+        self.assertEqual(notes[1].body_length(), len("B\nżółw".encode('utf-8')))
+        self.assertFalse(notes[1].is_materialized())
+        self.assertFalse(notes[0].is_materialized())
+
+    def test_model_saved_from_binary_file_should_not_change(self):
+        self.write(encode_notes(self.raw_notes))
+        model = load_note_links(BinaryNoteFile(self.file_name).note_links())
+        item_to_note(model.item(1)).body
+
+        content = encode_snapshot(snapshot_notes(model))
+        self.assertEqual(content, encode_notes(dump_notes(load_notes(self.raw_notes))))
+
+        # NOTE: The old file stays mapped while it's being replaced
+        write_atomically(self.file_name, encode_notes([]))
+        self.assertEqual(dump_notes(model), dump_notes(load_notes(self.raw_notes)))
+
+    def test_empty_tape_should_be_supported(self):
+        self.write(encode_notes([]))
+
+        self.assertEqual(list(BinaryNoteFile(self.file_name).raw_notes()), [])
+
+    def test_file_in_other_format_should_be_rejected(self):
+        self.write(b'[]')
+        with self.assertRaises(InvalidFormat):
+            BinaryNoteFile(self.file_name)
+
+        self.write(b'x' * HEADER.size)
+        with self.assertRaises(InvalidFormat):
+            BinaryNoteFile(self.file_name)
+
+    def test_file_in_unsupported_version_should_be_rejected(self):
+        content = encode_notes(self.raw_notes)
+        self.write(content[:4] + (2).to_bytes(4, 'little') + content[8:])
+
+        with self.assertRaises(UnsupportedFormatVersion):
+            BinaryNoteFile(self.file_name)
+
+    def test_truncated_file_should_be_rejected(self):
+        content = encode_notes(self.raw_notes)
+
+        self.write(content[:HEADER.size + RECORD.size])
+        with self.assertRaises(InvalidFormat):
+            BinaryNoteFile(self.file_name)
+
+        self.write(content[:-1])
+        with self.assertRaises(InvalidFormat):
+            list(BinaryNoteFile(self.file_name).note_links())
+
+    def test_file_with_invalid_utf8_in_heap_should_be_rejected(self):
+        content = encode_notes(self.raw_notes)
+        self.write(content.replace("żółw".encode('utf-8'), b'\xff' * len("żółw".encode('utf-8'))))
+
+        with self.assertRaises(InvalidFormat):
+            BinaryNoteFile(self.file_name)
+
+    def test_body_ending_in_the_middle_of_a_character_should_be_rejected(self):
+        content = bytearray(encode_notes(self.raw_notes))
+        for record_offset in range(HEADER.size, HEADER.size + 4 * RECORD.size, RECORD.size):
+            record = list(RECORD.unpack_from(content, record_offset))
+            if record[0] == 2:
+                # Cuts the last byte of 'ł' off along with 'w'
+                record[6] -= 2
+                RECORD.pack_into(content, record_offset, *record)
+        self.write(bytes(content))
+
+        with self.assertRaises(InvalidFormat):
+            list(BinaryNoteFile(self.file_name).note_links())
+
+    def test_is_binary_note_file(self):
+        self.assertTrue(is_binary_note_file('notes.tape'))
+        self.assertFalse(is_binary_note_file('notes.json'))
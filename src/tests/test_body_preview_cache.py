@@ -0,0 +1,54 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from ..note               import Note
+from ..body_preview_cache import BodyPreviewCache
+
+class BodyPreviewCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.body_preview_cache = BodyPreviewCache()
+
+        self.lines = ["line {}".format(i) for i in range(BodyPreviewCache.MAX_LINES + 5)]
+        self.note  = Note(body = '\n'.join(self.lines), created_at = datetime.utcnow(), id = 1)
+
+    def test_preview_should_return_none_for_short_bodies(self):
+        self.assertEqual(BodyPreviewCache.preview("short"), None)
+        self.assertEqual(BodyPreviewCache.preview('\n'.join(self.lines[:BodyPreviewCache.MAX_LINES])), None)
+        self.assertEqual(BodyPreviewCache.preview("x" * BodyPreviewCache.MAX_CHARACTERS), None)
+
+    def test_preview_should_keep_first_lines_and_count_hidden_ones(self):
+        expected_preview = '\n'.join(self.lines[:BodyPreviewCache.MAX_LINES] + [BodyPreviewCache.EXPAND_LINE_FORMAT.format(5, "lines")])
+
+        self.assertEqual(BodyPreviewCache.preview(self.note.body), expected_preview)
+
+    def test_preview_should_cut_long_lines_and_count_hidden_characters(self):
+        body = "x" * (BodyPreviewCache.MAX_CHARACTERS + 10)
+
+        self.assertEqual(
+            BodyPreviewCache.preview(body),
+            "x" * BodyPreviewCache.MAX_CHARACTERS + '\n' + BodyPreviewCache.EXPAND_LINE_FORMAT.format(10, "characters")
+        )
+
+    def test_preview_should_use_singular_for_one_hidden_line(self):
+        body = '\n'.join(self.lines[:BodyPreviewCache.MAX_LINES + 1])
+
+        self.assertTrue(BodyPreviewCache.preview(body).endswith(BodyPreviewCache.EXPAND_LINE_FORMAT.format(1, "line")))
+
+    def test_get_should_compute_preview_only_once_per_note_version(self):
+        with patch.object(BodyPreviewCache, 'preview', wraps = BodyPreviewCache.preview) as preview_mock:
+            first_preview  = self.body_preview_cache.get(self.note)
+            second_preview = self.body_preview_cache.get(self.note)
+
+            self.assertEqual(preview_mock.call_count, 1)
+            self.assertEqual(first_preview, second_preview)
+
+            new_note = Note(body = "New", created_at = datetime.utcnow(), id = 1)
+            self.assertEqual(self.body_preview_cache.get(new_note), None)
+            self.assertEqual(preview_mock.call_count, 2)
+
+    def test_get_should_not_cache_notes_without_ids(self):
+        self.note.id = None
+        self.body_preview_cache.get(self.note)
+
+        self.assertEqual(len(self.body_preview_cache), 0)
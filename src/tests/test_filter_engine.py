@@ -0,0 +1,97 @@
+import unittest
+from datetime import datetime
+
+from PyQt5.QtGui    import QStandardItemModel, QStandardItem
+from PyQt5.QtCore   import QThreadPool
+from PyQt5.QtTest   import QTest
+
+from .dummy_application        import application
+from ..note                    import Note
+from ..filter_engine           import FilterEngine
+from ..tape_filter_proxy_model import TapeFilterProxyModel
+from ..note_model_helpers      import set_item_note
+
+class FilterEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.source_model            = QStandardItemModel()
+        self.tape_filter_proxy_model = TapeFilterProxyModel()
+        self.filter_engine           = FilterEngine(self.tape_filter_proxy_model)
+
+        self.notes = [
+            Note(body = "apple",  tags = [],      created_at = datetime.utcnow(), id = 1),
+            Note(body = "banana", tags = ["pie"], created_at = datetime.utcnow(), id = 2),
+            Note(body = "cherry", tags = ["pie"], created_at = datetime.utcnow(), id = 3)
+        ]
+
+        for note in self.notes:
+            item = QStandardItem()
+            set_item_note(item, note)
+            self.source_model.appendRow(item)
+
+        self.tape_filter_proxy_model.setSourceModel(self.source_model)
+        self.filter_engine.min_background_notes = 0
+
+    def wait_for_filter(self):
+        QThreadPool.globalInstance().waitForDone()
+        QTest.qWait(FilterEngine.DEBOUNCE_INTERVAL * 2)
+        QThreadPool.globalInstance().waitForDone()
+        QTest.qWait(10)
+
+    def visible_notes(self):
+        return [self.tape_filter_proxy_model.data(self.tape_filter_proxy_model.index(row, 0)) for row in range(self.tape_filter_proxy_model.rowCount())]
+
+    def test_set_filter_should_apply_filter_immediately_if_tape_is_small(self):
+        self.filter_engine.min_background_notes = len(self.notes) + 1
+
+        self.filter_engine.set_filter('PIE')
+
+        self.assertFalse(self.filter_engine.is_pending())
+        self.assertEqual(self.visible_notes(), self.notes[1:3])
+
+    def test_set_filter_should_apply_filter_asynchronously_if_tape_is_large(self):
+        self.filter_engine.set_filter('PIE')
+
+        self.assertTrue(self.filter_engine.is_pending())
+        self.assertEqual(self.visible_notes(), self.notes)
+
+        self.wait_for_filter()
+
+        self.assertFalse(self.filter_engine.is_pending())
+        self.assertEqual(self.visible_notes(), self.notes[1:3])
+        self.assertEqual(self.tape_filter_proxy_model.filterRegExp().pattern(), 'PIE')
+
+    def test_set_filter_should_only_apply_the_most_recent_query(self):
+        self.filter_engine.set_filter('a')
+        self.filter_engine.set_filter('ap')
+        self.filter_engine.set_filter('ch')
+
+        self.wait_for_filter()
+
+        self.assertEqual(self.visible_notes(), [self.notes[2]])
+
+    def test_cancel_should_discard_pending_query(self):
+        self.filter_engine.set_filter('apple')
+        self.filter_engine.cancel()
+
+        self.wait_for_filter()
+
+        self.assertFalse(self.filter_engine.is_pending())
+        self.assertEqual(self.visible_notes(), self.notes)
+
+    def test_flush_should_apply_pending_query_immediately(self):
+        self.filter_engine.set_filter('apple')
+
+        self.filter_engine.flush()
+
+        self.assertFalse(self.filter_engine.is_pending())
+        self.assertEqual(self.visible_notes(), [self.notes[0]])
+
+    def test_filter_should_take_into_account_notes_modified_while_query_is_pending(self):
+        self.filter_engine.set_filter('pie')
+
+        new_note = Note(body = "apple pie", tags = [], created_at = datetime.utcnow(), id = 1)
+        set_item_note(self.source_model.item(0), new_note)
+
+        self.wait_for_filter()
+
+        self.assertEqual(self.visible_notes(), [new_note] + self.notes[1:3])
@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, timedelta
+
+from ..note         import Note
+from ..note_index   import NoteIndex
+from ..fuzzy_search import FuzzySearch
+
+class FuzzySearchTest(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2013, 8, 10, 12, 0, 0)
+
+        self.notes = [
+            Note(body = "Project plan for the next year",     tags = ["work"],    created_at = self.now - timedelta(days = 300), id = 1),
+            Note(body = "Shopping list: milk, bread",         tags = ["home"],    created_at = self.now - timedelta(days = 1),   id = 2),
+            Note(body = "Notes about the projection screen",  tags = [],          created_at = self.now - timedelta(days = 2),   id = 3),
+            Note(body = "Call the plumber about the project", tags = ["project"], created_at = self.now - timedelta(days = 300), id = 4),
+        ]
+
+        self.note_index = NoteIndex()
+        for note in self.notes:
+            self.note_index.add_note(note)
+
+        self.fuzzy_search = FuzzySearch(self.note_index)
+
+    def search_ids(self, query, limit = 10):
+        return [note.id for (score, note) in self.fuzzy_search.search(query, limit, self.now)]
+
+    def test_edits_should_return_strings_at_edit_distance_one(self):
+        edits = FuzzySearch.edits('abc')
+
+        self.assertTrue({'ab', 'bac', 'abd', 'abcd', 'xabc'} <= edits)
+        self.assertFalse('abc' in edits)
+        self.assertFalse('a'   in edits)
+
+    def test_expand_word_should_weight_exact_prefix_and_typo_matches(self):
+        self.assertEqual(self.fuzzy_search.expand_word('plan'), {'plan': FuzzySearch.EXACT_MATCH_WEIGHT})
+
+        expansions = self.fuzzy_search.expand_word('projct')
+
+        self.assertEqual(expansions['project'], FuzzySearch.TYPO_MATCH_WEIGHT)
+        self.assertFalse('projection' in expansions)
+
+        expansions = self.fuzzy_search.expand_word('proj')
+
+        self.assertEqual(set(expansions.keys()), {'project', 'projection'})
+        self.assertEqual(expansions['project'], FuzzySearch.PREFIX_MATCH_WEIGHT)
+
+    def test_expand_word_should_only_look_for_exact_matches_of_short_words(self):
+        self.assertEqual(self.fuzzy_search.expand_word('pla'), {'plan': FuzzySearch.PREFIX_MATCH_WEIGHT})
+        self.assertEqual(self.fuzzy_search.expand_word('pl'),  {})
+        self.assertEqual(self.fuzzy_search.expand_word('x'),   {})
+
+    def test_search_should_tolerate_typos(self):
+        self.assertEqual(set(self.search_ids('shoping')), {2})
+        self.assertEqual(set(self.search_ids('mlik')),    {2})
+
+    def test_search_should_require_all_query_words_to_match(self):
+        self.assertEqual(self.search_ids('project plan'), [1])
+        self.assertEqual(self.search_ids('milk plan'),    [])
+        self.assertEqual(self.search_ids(''),             [])
+
+    def test_search_should_rank_exact_matches_above_prefix_matches(self):
+        ids = self.search_ids('project')
+
+        # NOTE: Note 3 is much more recent but it only contains 'projection'
+        self.assertLess(ids.index(1), ids.index(3))
+
+    def test_search_should_prefer_tag_hits_and_early_matches(self):
+        # NOTE: Both notes match 'project' exactly and are equally old but note 4 has it in tags
+        self.assertEqual(self.search_ids('project')[:2], [4, 1])
+
+    def test_search_should_prefer_recently_modified_notes(self):
+        note_index = NoteIndex()
+        for (id, age) in [(1, 100), (2, 1), (3, 10)]:
+            note_index.add_note(Note(body = "meeting", created_at = self.now - timedelta(days = age), id = id))
+
+        results = FuzzySearch(note_index).search('meeting', 10, self.now)
+
+        self.assertEqual([note.id for (score, note) in results], [2, 3, 1])
+        self.assertEqual([score for (score, note) in results], sorted([score for (score, note) in results], reverse = True))
+
+    def test_search_should_return_at_most_limit_best_results(self):
+        note_index = NoteIndex()
+        for id in range(1, 201):
+            note_index.add_note(Note(body = "meeting", created_at = self.now - timedelta(hours = id), id = id))
+
+        results = FuzzySearch(note_index).search('meeting', 5, self.now)
+
+        self.assertEqual([note.id for (score, note) in results], [1, 2, 3, 4, 5])
+
+    def test_search_should_not_compute_bonuses_for_candidates_that_cannot_make_it_into_results(self):
+        note_index = NoteIndex()
+        for id in range(1, 201):
+            if id <= 3:
+                note_index.add_note(Note(body = "meeting", created_at = self.now - timedelta(hours = id), id = id))
+            else:
+                note_index.add_note(Note(body = "meting", created_at = self.now - timedelta(days = 300), id = id))
+
+        fetched_notes = []
+        def search_text_getter(note):
+            fetched_notes.append(note)
+            return note.body.casefold()
+
+        results = FuzzySearch(note_index, search_text_getter).search('meeting', 3, self.now)
+
+        self.assertEqual([note.id for (score, note) in results], [1, 2, 3])
+        self.assertLess(len(fetched_notes), 200)
@@ -0,0 +1,91 @@
+import unittest
+from datetime import datetime
+
+from PyQt5.QtCore import Qt, QCoreApplication
+
+from .dummy_application    import application
+from ..fuzzy_search_widget import FuzzySearchWidget
+from ..tape_widget         import TapeWidget
+from ..note                import Note
+from ..note_model_helpers  import set_item_note
+
+class FuzzySearchWidgetTest(unittest.TestCase):
+    def setUp(self):
+        self.tape_widget         = TapeWidget()
+        self.fuzzy_search_widget = FuzzySearchWidget()
+        self.fuzzy_search_widget.set_tape_widget(self.tape_widget)
+
+        self.notes = [
+            Note(body = "Project plan",                   tags = ["work"], created_at = datetime.utcnow()),
+            Note(body = "Shopping list",                  tags = ["home"], created_at = datetime.utcnow()),
+            Note(body = "Projection screen\nIt's broken", tags = [],       created_at = datetime.utcnow())
+        ]
+
+        for note in self.notes:
+            self.tape_widget.add_note(note)
+
+    def test_set_query_should_list_best_matches(self):
+        self.fuzzy_search_widget.set_query("projct")
+
+        self.assertEqual(self.fuzzy_search_widget.result_ids(), [self.notes[0].id])
+
+        self.fuzzy_search_widget.set_query("proj")
+
+        self.assertEqual(set(self.fuzzy_search_widget.result_ids()), {self.notes[0].id, self.notes[2].id})
+
+    def test_set_query_should_list_nothing_for_empty_query(self):
+        self.fuzzy_search_widget.set_query("")
+
+        self.assertEqual(self.fuzzy_search_widget.result_ids(), [])
+
+    def test_note_summary_should_contain_first_line_and_tags(self):
+        self.assertEqual(FuzzySearchWidget.note_summary(self.notes[0]), "Project plan [work]")
+        self.assertEqual(FuzzySearchWidget.note_summary(self.notes[2]), "Projection screen")
+
+    def test_activate_result_should_focus_the_tape_on_the_note(self):
+        self.tape_widget.set_filter("Shopping")
+        self.fuzzy_search_widget.set_query("plan")
+
+        self.assertTrue(self.fuzzy_search_widget.activate_result(0))
+
+        self.assertEqual(self.tape_widget.get_filter(), '')
+        self.assertEqual(self.tape_widget.selected_indexes(), [self.tape_widget.model().item(0).index()])
+
+    def test_activate_result_should_ignore_rows_out_of_range(self):
+        self.fuzzy_search_widget.set_query("plan")
+
+        self.assertFalse(self.fuzzy_search_widget.activate_result(1))
+
+    def test_set_tape_widget_should_search_the_new_tape(self):
+        self.fuzzy_search_widget.set_query("shopping")
+        assert self.fuzzy_search_widget.result_ids() == [self.notes[1].id]
+
+        self.fuzzy_search_widget.set_tape_widget(TapeWidget())
+
+        self.assertEqual(self.fuzzy_search_widget.result_ids(), [])
+
+    def test_results_should_be_refreshed_when_notes_change(self):
+        self.fuzzy_search_widget.set_query("shopping")
+        assert self.fuzzy_search_widget.result_ids() == [self.notes[1].id]
+
+        model = self.tape_widget.model()
+        set_item_note(model.item(1), Note(body = "Groceries", tags = [], created_at = datetime.utcnow(), id = self.notes[1].id))
+        QCoreApplication.processEvents()
+
+        self.assertEqual(self.fuzzy_search_widget.result_ids(), [])
+
+        new_note = Note(body = "Shopping for shoes", tags = [], created_at = datetime.utcnow())
+        self.tape_widget.add_note(new_note)
+        QCoreApplication.processEvents()
+
+        self.assertEqual(self.fuzzy_search_widget.result_ids(), [new_note.id])
+
+    def test_set_tape_widget_should_stop_following_the_old_tape(self):
+        old_tape_widget = self.tape_widget
+        self.fuzzy_search_widget.set_query("shoes")
+        self.fuzzy_search_widget.set_tape_widget(TapeWidget())
+
+        old_tape_widget.add_note(Note(body = "Shoes", tags = [], created_at = datetime.utcnow()))
+        QCoreApplication.processEvents()
+
+        self.assertEqual(self.fuzzy_search_widget.result_ids(), [])
@@ -0,0 +1,122 @@
+import unittest
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from ..note        import Note
+from ..note_index  import NoteIndex
+from ..index_store import sidecar_path, content_key, save_index, load_index, source_signature, IndexChanged
+
+class IndexStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_name           = os.path.join(self.temporary_directory.name, 'notes.json')
+
+        self.notes = [
+            Note(body = "Project plan",  tags = ["work"], created_at = datetime(2013, 1, 1), id = 1),
+            Note(body = "Shopping list", tags = ["home"], created_at = datetime(2013, 1, 2), id = 2),
+            Note(body = "projection",    tags = [],       created_at = datetime(2013, 1, 3), id = 3)
+        ]
+
+        self.note_index = NoteIndex()
+        for note in self.notes:
+            self.note_index.add_note(note)
+
+        with open(self.file_name, 'w') as note_file:
+            note_file.write('[]')
+
+    def save(self):
+        save_index(self.file_name, 'key', source_signature(self.file_name), self.note_index)
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def test_content_key_should_depend_on_content(self):
+        self.assertEqual(content_key('[]'), content_key('[]'))
+        self.assertNotEqual(content_key('[]'), content_key('[ ]'))
+
+    def test_load_index_should_return_postings_saved_by_save_index(self):
+        self.save()
+
+        stored_index = load_index(self.file_name)
+
+        self.assertTrue(os.path.exists(sidecar_path(self.file_name)))
+        self.assertEqual(stored_index.key, 'key')
+        self.assertEqual(len(stored_index), len(self.notes))
+        self.assertTrue(all(stored_index.is_up_to_date(note) for note in self.notes))
+
+        loaded_index = NoteIndex()
+        loaded_index.load_postings(self.notes, *stored_index.postings([1, 2, 3]))
+
+        self.assertEqual(loaded_index.word_ids('project'),   {1})
+        self.assertEqual(loaded_index.candidate_ids('ject'), {1, 3})
+        self.assertEqual(loaded_index.tag_ids('home'),       {2})
+
+    def test_is_up_to_date_should_detect_modified_and_unknown_notes(self):
+        self.save()
+        stored_index = load_index(self.file_name)
+
+        modified_note = Note(body = "Holiday plan", tags = [], created_at = datetime(2013, 1, 1), modified_at = datetime(2013, 2, 1), id = 1)
+        new_note      = Note(body = "New",          tags = [], created_at = datetime(2013, 1, 1), id = 4)
+
+        self.assertFalse(stored_index.is_up_to_date(modified_note))
+        self.assertFalse(stored_index.is_up_to_date(new_note))
+        self.assertTrue(stored_index.is_up_to_date(self.notes[1]))
+
+    def test_postings_should_not_contain_outdated_ids(self):
+        self.save()
+
+        (word_ids, trigram_ids, tag_ids) = load_index(self.file_name).postings([2, 3])
+
+        self.assertFalse('project' in word_ids)
+        self.assertFalse('work'    in tag_ids)
+        self.assertEqual(trigram_ids['oje'], {3})
+        self.assertEqual(word_ids['list'],   {2})
+
+    def test_load_index_should_return_none_if_there_is_no_valid_sidecar(self):
+        self.assertEqual(load_index(self.file_name), None)
+
+        with open(sidecar_path(self.file_name), 'wb') as sidecar_file:
+            sidecar_file.write(b'not an index')
+
+        self.assertEqual(load_index(self.file_name), None)
+
+        with open(sidecar_path(self.file_name), 'wb') as sidecar_file:
+            pass
+
+        self.assertEqual(load_index(self.file_name), None)
+
+    def test_load_index_should_return_none_if_sidecar_is_damaged(self):
+        self.save()
+        with open(sidecar_path(self.file_name), 'rb') as sidecar_file:
+            content = sidecar_file.read()
+
+        for damaged_content in [content[:-1], content[:len(content) // 2], content.replace(b'project', b'\xffroject')]:
+            with open(sidecar_path(self.file_name), 'wb') as sidecar_file:
+                sidecar_file.write(damaged_content)
+
+            self.assertEqual(load_index(self.file_name), None)
+
+    def test_load_index_should_return_none_if_note_file_has_changed_since_sidecar_was_saved(self):
+        self.save()
+        assert load_index(self.file_name) != None
+
+        with open(self.file_name, 'w') as note_file:
+            note_file.write('[ ]')
+
+        self.assertEqual(load_index(self.file_name), None)
+
+    def test_load_index_should_return_none_if_sidecar_has_been_built_from_different_number_of_notes(self):
+        self.save()
+
+        self.assertNotEqual(load_index(self.file_name, len(self.notes)), None)
+        self.assertEqual(load_index(self.file_name, len(self.notes) + 1), None)
+
+    def test_save_index_should_not_write_sidecar_if_index_has_changed_since_revision(self):
+        revision = self.note_index.revision()
+        self.note_index.remove_note(3)
+
+        with self.assertRaises(IndexChanged):
+            save_index(self.file_name, 'key', source_signature(self.file_name), self.note_index, revision)
+
+        self.assertFalse(os.path.exists(sidecar_path(self.file_name)))
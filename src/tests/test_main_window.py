@@ -1,20 +1,44 @@
 import unittest
 import sys
-from datetime import datetime
+import os
+import tempfile
+import threading
+from contextlib    import contextmanager
+from datetime      import datetime
+from unittest.mock import patch
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui  import QStandardItem, QStandardItemModel
+import simplejson
+
+from PyQt5.QtWidgets import QMessageBox
+from PyQt5.QtCore    import Qt, QCoreApplication, QThreadPool
+from PyQt5.QtGui     import QStandardItem, QStandardItemModel
 
 from .dummy_application   import application
 from ..main_window        import MainWindow
 from ..tape_widget        import TapeWidget
 from ..note               import Note
 from ..note_model_helpers import item_to_note, set_item_note
+from ..note_index         import NoteIndex
+from ..index_store        import load_index, save_index, content_key, source_signature
+from ..render_profiler    import RenderProfiler
+from ..sqlite_store       import SqliteNoteStore
+from ..note_journal       import NoteJournal, journal_path
+from ..binary_note_file   import MappedNote, encode_notes
+from ..                   import index_saver
 
 class MainWindowTest(unittest.TestCase):
     def setUp(self):
         self.window = MainWindow()
 
+    @contextmanager
+    def temporary_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            try:
+                yield directory
+            finally:
+                # NOTE: The sidecar may still be being written in the background
+                self.window.index_saver.wait_for_done()
+
     def test_replace_tape_widget_should_destroy_old_tape_and_put_a_new_one_on_the_panel(self):
         old_tape_widget = self.window.tape_widget
 
@@ -65,3 +89,342 @@ class MainWindowTest(unittest.TestCase):
         self.assertEqual(len(list(self.window.tape_widget.notes())), 0)
         self.assertNotEqual(self.window.tape_widget.model(), model_before)
         self.assertEqual(self.window.tape_widget.get_filter(), '')
+
+    def test_replace_tape_widget_should_make_side_panels_use_the_new_tape(self):
+        new_model = QStandardItemModel()
+        new_item  = QStandardItem()
+        set_item_note(new_item, Note(body = "Y", tags = ["Z"], created_at = datetime.utcnow()))
+        new_model.appendRow(new_item)
+
+        self.window._replace_tape_widget(new_model)
+
+        self.assertEqual(self.window.fuzzy_search_widget.tape_widget(), self.window.tape_widget)
+        self.assertEqual(self.window.tag_facet_widget.tape_widget(),    self.window.tape_widget)
+        self.assertEqual(self.window.tag_facet_widget.tag_counts(),     [('Z', 1)])
+
+    def test_open_note_file_should_save_search_index_next_to_the_file(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.json')
+
+            self.window.tape_widget.add_note(Note(body = "Y", tags = ["Z"], created_at = datetime.utcnow()))
+            self.window.save_note_file_as(file_name)
+            self.window.index_saver.wait_for_done()
+
+            stored_index = load_index(file_name)
+            self.assertNotEqual(stored_index, None)
+            self.assertEqual(len(stored_index), 1)
+
+            with patch.object(NoteIndex, 'note_terms', wraps = NoteIndex.note_terms) as note_terms_mock:
+                self.window.open_note_file(file_name)
+
+            self.assertEqual(note_terms_mock.call_count, 0)
+            self.assertEqual(self.window.tape_widget.proxy_model().note_index().tag_ids('Z'), {1})
+
+    def test_save_index_when_ready_should_save_only_the_latest_index_once_indexing_finishes(self):
+        proxy_model = self.window.tape_widget.proxy_model()
+        signal      = proxy_model.background_indexing_finished
+
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.json')
+            with open(file_name, 'w') as note_file:
+                note_file.write('[]')
+
+            with patch.object(proxy_model, 'is_indexing', return_value = True), patch.object(self.window, '_save_index') as save_index_mock:
+                self.window._save_index_when_ready(file_name, 'old key')
+                self.window._save_index_when_ready(file_name, 'new key')
+                self.assertEqual(proxy_model.receivers(signal), 1)
+
+                signal.emit()
+                signal.emit()
+
+            save_index_mock.assert_called_once_with(file_name, 'new key', source_signature(file_name), proxy_model.note_index(), False)
+            self.assertEqual(proxy_model.receivers(signal), 0)
+
+    def test_autosaver_saved_handler_should_not_save_index_in_gui_thread(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.json')
+
+            self.window.tape_widget.add_note(Note(body = "Y", tags = ["Z"], created_at = datetime.utcnow()))
+            self.window.save_note_file_as(file_name)
+            self.window.index_saver.wait_for_done()
+
+            save_threads = []
+            def save_index_side_effect(*args):
+                save_threads.append(threading.current_thread())
+                save_index(*args)
+
+            with patch.object(index_saver, 'save_index', side_effect = save_index_side_effect):
+                self.window.tape_widget.add_note(Note(body = "W", tags = [], created_at = datetime.utcnow()))
+                self.window.autosaver.save_now()
+                self.window.autosaver.wait_for_done()
+
+                self.assertEqual(save_threads, [])
+                self.assertTrue(self.window.index_saver.is_scheduled())
+
+                self.window.index_saver.save_now()
+                self.window.index_saver.wait_for_done()
+
+            self.assertEqual(len(save_threads), 1)
+            self.assertIsNot(save_threads[0], threading.main_thread())
+            self.assertEqual(len(load_index(file_name)), 2)
+
+    def test_save_index_should_write_sidecar_in_worker_thread(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.json')
+
+            self.window.tape_widget.add_note(Note(body = "Y", tags = ["Z"], created_at = datetime.utcnow()))
+
+            save_threads = []
+            def save_index_side_effect(*args):
+                save_threads.append(threading.current_thread())
+                save_index(*args)
+
+            with patch.object(index_saver, 'save_index', side_effect = save_index_side_effect):
+                self.window.save_note_file_as(file_name)
+                self.window.index_saver.wait_for_done()
+
+            self.assertEqual(len(save_threads), 1)
+            self.assertIsNot(save_threads[0], threading.main_thread())
+            self.assertEqual(len(load_index(file_name)), 1)
+
+    def test_replace_tape_widget_should_cancel_index_save_of_the_old_tape(self):
+        proxy_model = self.window.tape_widget.proxy_model()
+        signal      = proxy_model.background_indexing_finished
+
+        with patch.object(proxy_model, 'is_indexing', return_value = True), patch.object(self.window, '_save_index') as save_index_mock:
+            self.window._save_index_when_ready('notes.json', 'key')
+            self.window._replace_tape_widget(QStandardItemModel())
+
+            self.assertEqual(proxy_model.receivers(signal), 0)
+            signal.emit()
+
+        self.assertEqual(save_index_mock.call_count, 0)
+
+    def test_render_profiler_should_be_enabled_only_by_environment_variable(self):
+        self.assertEqual(self.window.render_profiler, None)
+        self.assertEqual(self.window.tape_widget.render_profiler(), None)
+
+        with patch.dict(os.environ, {RenderProfiler.ENVIRONMENT_VARIABLE: '1'}):
+            window = MainWindow()
+
+        self.assertIsInstance(window.render_profiler, RenderProfiler)
+        self.assertIs(window.tape_widget.render_profiler(), window.render_profiler)
+
+        window.new_handler()
+        self.assertIs(window.tape_widget.render_profiler(), window.render_profiler)
+
+    def test_compact_action_should_apply_to_current_and_future_tapes(self):
+        self.window.compact_action.setChecked(True)
+        self.assertTrue(self.window.tape_widget.compact())
+
+        self.window.new_handler()
+        self.assertTrue(self.window.tape_widget.compact())
+
+        self.window.compact_action.setChecked(False)
+        self.assertFalse(self.window.tape_widget.compact())
+
+    def test_show_ancestors_action_should_apply_to_current_and_future_tapes(self):
+        self.assertFalse(self.window.show_ancestors_action.isChecked())
+        self.assertFalse(self.window.tape_widget.show_ancestors_of_matches())
+
+        self.window.show_ancestors_action.setChecked(True)
+        self.assertTrue(self.window.tape_widget.show_ancestors_of_matches())
+
+        self.window.new_handler()
+        self.assertTrue(self.window.tape_widget.show_ancestors_of_matches())
+
+    def test_open_note_file_should_load_notes_saved_by_save_note_file_as(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.json')
+
+            self.window.tape_widget.add_note(Note(body = "Y", tags = ["Z"], created_at = datetime(2013, 1, 1)))
+            self.window.tape_widget.add_note(Note(body = "W", tags = [],    created_at = datetime(2013, 1, 2)))
+            self.window.save_note_file_as(file_name)
+
+            self.window.open_note_file(file_name)
+
+            self.assertEqual([note.body for note in self.window.tape_widget.notes()], ["Y", "W"])
+
+    def test_open_note_file_should_show_warning_if_file_is_not_valid_json(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.json')
+            with open(file_name, 'w') as json_file:
+                json_file.write('[{"body": "Y"')
+
+            old_tape_widget = self.window.tape_widget
+            with patch.object(QMessageBox, 'warning') as warning_mock:
+                self.window.open_note_file(file_name)
+
+            self.assertEqual(warning_mock.call_count, 1)
+            self.assertIs(self.window.tape_widget, old_tape_widget)
+
+    def test_open_note_file_should_show_warning_if_journal_does_not_match_the_file(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.json')
+
+            self.window.tape_widget.add_note(Note(body = "Y", tags = ["Z"], created_at = datetime.utcnow()))
+            self.window.save_note_file_as(file_name)
+            self.window.journal.close()
+            self.window.journal = None
+
+            with open(file_name, 'r') as json_file:
+                key = content_key(json_file.read())
+
+            with open(journal_path(file_name), 'w') as journal_file:
+                journal_file.write(simplejson.dumps({'key': key}) + '\n')
+                journal_file.write(simplejson.dumps({'operation': 'remove', 'ids': [10]}) + '\n')
+
+            old_tape_widget = self.window.tape_widget
+            with patch.object(QMessageBox, 'warning') as warning_mock:
+                self.window.open_note_file(file_name)
+
+            self.assertEqual(warning_mock.call_count, 1)
+            self.assertIs(self.window.tape_widget, old_tape_widget)
+
+    def test_open_note_file_should_load_binary_tape_saved_by_save_note_file_as(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.tape')
+
+            self.window.tape_widget.add_note(Note(body = "Y", tags = ["Z"], created_at = datetime(2013, 1, 1)))
+            self.window.tape_widget.add_note(Note(body = "W", tags = [],    created_at = datetime(2013, 1, 2)))
+            self.window.save_note_file_as(file_name)
+
+            self.assertEqual(self.window.file_name, file_name)
+            self.assertEqual(self.window.journal, None)
+            self.assertEqual(self.window.autosaver.file_name(), None)
+
+            self.window.new_handler()
+            self.window.open_note_file(file_name)
+
+            self.assertEqual([(note.body, note.tags) for note in self.window.tape_widget.notes()], [("Y", ["Z"]), ("W", [])])
+            self.assertEqual(self.window.file_name, file_name)
+            self.window.index_saver.wait_for_done()
+            self.assertIsNotNone(load_index(file_name))
+
+    def test_open_note_file_should_not_decode_bodies_of_notes_off_screen_in_binary_tape(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.tape')
+
+            timestamp = Note.serialize_timestamp(datetime(2013, 1, 1))
+            raw_notes = [
+                {'id': note_id, 'body': "Note {}".format(note_id), 'tags': ["T"], 'created_at': timestamp, 'modified_at': timestamp,
+                 'parent_id': None, 'prev_sibling_id': note_id - 1 if note_id > 1 else None}
+                for note_id in range(1, 2001)
+            ]
+            with open(file_name, 'wb') as note_file:
+                note_file.write(encode_notes(raw_notes))
+
+            # NOTE: Bodies are decoded in the background by the indexer too. Only the GUI thread is of interest here.
+            decoded_ids = set()
+            def encoded_body(note):
+                if threading.current_thread() is threading.main_thread():
+                    decoded_ids.add(note.id)
+
+                return note._note_file.heap_bytes(note._body_offset, note._body_length)
+
+            # The window in its default configuration, without an index sidecar
+            self.window.show()
+            with patch.object(MappedNote, 'encoded_body', autospec = True, side_effect = encoded_body):
+                self.window.open_note_file(file_name)
+                QCoreApplication.processEvents()
+
+                self.assertLess(len(decoded_ids), 100)
+
+                QThreadPool.globalInstance().waitForDone()
+                QCoreApplication.processEvents()
+
+            notes = list(self.window.tape_widget.notes())
+            self.assertEqual(len(notes), 2000)
+            self.assertTrue(all(isinstance(note, MappedNote) for note in notes))
+            self.assertFalse(self.window.tape_widget.proxy_model().is_indexing())
+            self.assertEqual(len(self.window.tape_widget.proxy_model().note_index()), 2000)
+            self.assertLess(len(decoded_ids), 100)
+            self.assertFalse(any(note.is_materialized() for note in notes))
+            self.assertLess(len(self.window.tape_widget.proxy_model().search_text_cache()), 100)
+            self.window.hide()
+
+    def test_open_note_file_should_show_warning_if_binary_tape_is_damaged(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.tape')
+            with open(file_name, 'w') as note_file:
+                note_file.write('[]')
+
+            old_tape_widget = self.window.tape_widget
+            with patch.object(QMessageBox, 'warning') as warning_mock:
+                self.window.open_note_file(file_name)
+
+            self.assertEqual(warning_mock.call_count, 1)
+            self.assertIs(self.window.tape_widget, old_tape_widget)
+
+    def test_save_note_file_as_should_write_only_changed_notes_to_sqlite_store(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.sqlite')
+
+            self.window.tape_widget.add_note(Note(body = "Y", tags = ["Z"], created_at = datetime(2013, 1, 1)))
+            self.window.tape_widget.add_note(Note(body = "W", tags = [],    created_at = datetime(2013, 1, 2)))
+            self.window.save_note_file_as(file_name)
+            self.assertEqual(self.window.file_name, file_name)
+
+            self.window.tape_widget.add_note(Note(body = "V", tags = [], created_at = datetime(2013, 1, 3)))
+            with patch.object(SqliteNoteStore, 'save', wraps = self.window.note_store.save) as save_mock:
+                self.window.save_handler()
+
+            self.assertEqual(save_mock.call_count, 1)
+            self.assertEqual(len(self.window.note_store), 3)
+
+            self.window.new_handler()
+            self.assertEqual(self.window.note_store, None)
+
+            self.window.open_note_file(file_name)
+            self.assertEqual([note.body for note in self.window.tape_widget.notes()], ["Y", "W", "V"])
+            self.window.note_store.close()
+
+    def test_save_handler_should_rewrite_json_file_in_background_when_journal_needs_compaction(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.json')
+
+            self.window.tape_widget.add_note(Note(body = "Y", tags = ["Z"], created_at = datetime(2013, 1, 1)))
+            self.window.save_note_file_as(file_name)
+            self.assertEqual(self.window.autosaver.file_name(), file_name)
+
+            self.window.tape_widget.add_note(Note(body = "W", tags = [], created_at = datetime(2013, 1, 2)))
+            with patch.object(NoteJournal, 'needs_compaction', return_value = True):
+                self.window.save_handler()
+
+            self.assertTrue(self.window.autosaver.is_saving())
+            self.window.autosaver.wait_for_done()
+
+            with open(file_name) as json_file:
+                self.assertEqual([note_dict['body'] for note_dict in simplejson.loads(json_file.read())], ["Y", "W"])
+            self.assertEqual(self.window.journal.entry_count(), 0)
+
+            # NOTE: The index is saved some time after the autosave
+            self.assertTrue(self.window.index_saver.is_scheduled())
+            self.window.index_saver.save_now()
+            self.window.index_saver.wait_for_done()
+            with open(file_name) as json_file:
+                self.assertEqual(load_index(file_name).key, content_key(json_file.read()))
+
+            self.window.new_handler()
+            self.assertEqual(self.window.autosaver.file_name(), None)
+
+    def test_save_handler_should_only_append_to_journal_of_json_file(self):
+        with self.temporary_directory() as directory:
+            file_name = os.path.join(directory, 'notes.json')
+
+            self.window.tape_widget.add_note(Note(body = "Y", tags = ["Z"], created_at = datetime(2013, 1, 1)))
+            self.window.save_note_file_as(file_name)
+            with open(file_name) as json_file:
+                content = json_file.read()
+
+            self.window.tape_widget.add_note(Note(body = "W", tags = [], created_at = datetime(2013, 1, 2)))
+            self.window.save_handler()
+
+            with open(file_name) as json_file:
+                self.assertEqual(json_file.read(), content)
+
+            self.window.new_handler()
+            self.window.open_note_file(file_name)
+            self.assertEqual([note.body for note in self.window.tape_widget.notes()], ["Y", "W"])
+
+            self.window.new_handler()
@@ -2,7 +2,7 @@ import unittest
 
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
 
-from ..model_helpers import level, tree_path, subtree_items, all_items, remove_items
+from ..model_helpers import level, tree_path, subtree_items, subtree_indexes, all_items, remove_items
 
 class ModelHelpersTest(unittest.TestCase):
     def create_item_and_append(self, parent_item):
@@ -127,6 +127,21 @@ class ModelHelpersTest(unittest.TestCase):
 
         self.assertEqual(result, expected_order)
 
+    def test_subtree_indexes_should_iterate_over_indexes_of_rows_in_range_and_their_descendants_inorder(self):
+        expected_order = [
+            self.item_1_0_1,
+            self.item_1_0_2,
+            self.item_1_0_2_0,
+            self.item_1_0_2_0_0,
+            self.item_1_0_3
+        ]
+
+        result = []
+        for index in subtree_indexes(self.model, self.item_1_0.index(), 1, 3):
+            result.append(self.model.itemFromIndex(index))
+
+        self.assertEqual(result, expected_order)
+
     def test_all_items_should_iterate_over_all_model_items_inorder(self):
         expected_order = [
             self.item_0,
@@ -1,10 +1,13 @@
 import unittest
 import sys
+import os
+import tempfile
 from datetime import datetime
+from unittest.mock import patch
 
-from PyQt5.QtWidgets import QWidget, QStyleOptionViewItem
-from PyQt5.QtGui     import QStandardItemModel, QStandardItem, QPixmap, QPainter
-from PyQt5.QtCore    import Qt, QRect
+from PyQt5.QtWidgets import QApplication, QWidget, QStyleOptionViewItem
+from PyQt5.QtGui     import QStandardItemModel, QStandardItem, QPixmap, QPainter, QFontMetrics, QImage, QMouseEvent
+from PyQt5.QtCore    import Qt, QRect, QSize, QPointF, QEvent, QCoreApplication, QThread
 
 from .dummy_application   import application
 from ..note               import Note
@@ -12,6 +15,9 @@ from ..note_edit          import NoteEdit
 from ..note_widget        import NoteWidget
 from ..note_delegate      import NoteDelegate
 from ..note_model_helpers import item_to_note, set_item_note
+from ..render_profiler    import RenderProfiler
+from ..body_preview_cache import BodyPreviewCache
+from ..binary_note_file   import BinaryNoteFile, MappedNote, encode_notes
 
 class NoteDelegateTest(unittest.TestCase):
     def setUp(self):
@@ -87,3 +93,375 @@ class NoteDelegateTest(unittest.TestCase):
         # NOTE: Preferred height is be the same in an empty and non-empty widget.
         # Preferred width may change depending on the content.
         self.assertEqual(size_hint.height(), note_widget.sizeHint().height())
+
+    def paint_note(self):
+        self.option.rect = QRect(0, 0, 200, 100)
+        pixmap  = QPixmap(self.option.rect.size())
+        painter = QPainter(pixmap)
+        self.note_delegate.paint(painter, self.option, self.item.index())
+        painter.end()
+
+    def test_paint_should_reuse_rendered_pixmaps(self):
+        self.note.id = 1
+        pixmap_cache = self.note_delegate.pixmap_cache()
+
+        self.paint_note()
+        self.paint_note()
+
+        self.assertEqual(len(pixmap_cache), 1)
+        self.assertEqual((pixmap_cache.hits(), pixmap_cache.misses()), (1, 1))
+
+    def test_setModelData_should_discard_pixmaps_of_the_old_version(self):
+        self.note.id = 1
+        self.paint_note()
+        assert len(self.note_delegate.pixmap_cache()) == 1
+
+        editor = self.note_delegate.createEditor(self.parent, self.option, self.item.index())
+        editor.load_note(Note(body = "Y", tags = [], created_at = datetime.utcnow(), id = 1))
+        self.note_delegate.setModelData(editor, self.model, self.item.index())
+
+        self.assertEqual(len(self.note_delegate.pixmap_cache()), 0)
+
+    def test_sizeHint_should_measure_each_version_of_a_note_only_once(self):
+        self.note.id = 1
+
+        with patch.object(NoteWidget, 'load_note', autospec = True, side_effect = NoteWidget.load_note) as load_note_mock:
+            first_hint = self.note_delegate.sizeHint(self.option, self.item.index())
+
+            self.option.rect = QRect(0, 0, 123, 45)
+            second_hint = self.note_delegate.sizeHint(self.option, self.item.index())
+
+            self.assertEqual(load_note_mock.call_count, 1)
+            self.assertEqual(second_hint.height(), first_hint.height())
+            self.assertEqual(second_hint.width(),  123)
+
+            set_item_note(self.item, Note(body = "B\nB", tags = [], created_at = datetime(2013, 1, 1), modified_at = datetime(2013, 1, 2), id = 1))
+            self.note_delegate.sizeHint(self.option, self.item.index())
+
+            self.assertEqual(load_note_mock.call_count, 2)
+
+    def test_setModelData_should_emit_sizeHintChanged_only_if_height_changed(self):
+        self.note.id = 1
+        changed_indexes = []
+        self.note_delegate.sizeHintChanged.connect(changed_indexes.append)
+
+        editor = self.note_delegate.createEditor(self.parent, self.option, self.item.index())
+        editor.load_note(Note(body = "Y", tags = ["C", "D"], created_at = datetime.utcnow(), id = 1))
+        self.note_delegate.setModelData(editor, self.model, self.item.index())
+
+        self.assertEqual(changed_indexes, [])
+
+        editor.load_note(Note(body = "Y\nY\nY", tags = ["C", "D"], created_at = datetime.utcnow(), id = 1))
+        self.note_delegate.setModelData(editor, self.model, self.item.index())
+
+        self.assertEqual(changed_indexes, [self.item.index()])
+
+    def test_sizeHint_should_return_estimated_height_in_estimate_mode(self):
+        self.note.id   = 1
+        self.note.body = "B\n" + "x" * (NoteDelegate.ESTIMATED_LINE_LENGTH + 1)
+        self.note_delegate.set_estimate_heights(True)
+
+        with patch.object(NoteWidget, 'load_note', autospec = True, side_effect = NoteWidget.load_note) as load_note_mock:
+            size_hint = self.note_delegate.sizeHint(self.option, self.item.index())
+
+            self.assertEqual(load_note_mock.call_count, 0)
+
+        one_line_note = Note(body = "B", tags = ["C"], created_at = datetime.utcnow())
+        self.assertEqual(size_hint.height(), self.note_delegate.estimated_height(self.note))
+        self.assertEqual(
+            size_hint.height() - self.note_delegate.estimated_height(one_line_note),
+            2 * QFontMetrics(NoteWidget.body_font()).lineSpacing()
+        )
+        self.assertFalse(self.note_delegate.is_measured(self.note))
+
+    def test_estimated_height_should_not_decode_bodies_of_notes_from_binary_tape(self):
+        timestamp = Note.serialize_timestamp(datetime(2013, 1, 1))
+        raw_notes = [
+            {'id': 1, 'body': "x" * (2 * NoteDelegate.ESTIMATED_LINE_LENGTH + 1), 'tags': [], 'created_at': timestamp, 'modified_at': timestamp,
+             'parent_id': None, 'prev_sibling_id': None},
+            {'id': 2, 'body': "x" * (40 * NoteDelegate.ESTIMATED_LINE_LENGTH), 'tags': [], 'created_at': timestamp, 'modified_at': timestamp,
+             'parent_id': None, 'prev_sibling_id': 1}
+        ]
+        line_spacing = QFontMetrics(NoteWidget.body_font()).lineSpacing()
+        one_line_note = Note(body = "B", tags = [], created_at = datetime.utcnow())
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'notes.tape')
+            with open(file_name, 'wb') as note_file:
+                note_file.write(encode_notes(raw_notes))
+
+            notes = [note for (note, parent_id, prev_sibling_id) in BinaryNoteFile(file_name).note_links()]
+            self.note_delegate.set_preview_long_notes(True)
+
+            with patch.object(MappedNote, 'encoded_body') as encoded_body_mock:
+                self.assertEqual(self.note_delegate.estimated_height(notes[0]) - self.note_delegate.estimated_height(one_line_note), 2 * line_spacing)
+                self.assertEqual(
+                    self.note_delegate.estimated_height(notes[1]) - self.note_delegate.estimated_height(one_line_note),
+                    BodyPreviewCache.MAX_LINES * line_spacing
+                )
+
+                self.assertEqual(encoded_body_mock.call_count, 0)
+
+    def test_sizeHint_should_measure_notes_without_ids_even_in_estimate_mode(self):
+        self.note_delegate.set_estimate_heights(True)
+
+        note_widget = NoteWidget()
+        note_widget.load_note(self.note)
+
+        self.assertEqual(self.note_delegate.sizeHint(self.option, self.item.index()).height(), note_widget.sizeHint().height())
+
+    def test_measure_should_replace_estimate_and_emit_sizeHintChanged_in_batch(self):
+        self.note.id   = 1
+        self.note.body = "\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t\t"
+        self.note_delegate.set_estimate_heights(True)
+        changed_indexes = []
+        self.note_delegate.sizeHintChanged.connect(changed_indexes.append)
+
+        estimated_hint = self.note_delegate.sizeHint(self.option, self.item.index())
+        self.note_delegate.measure([self.item.index()])
+
+        self.assertTrue(self.note_delegate.is_measured(self.note))
+        self.assertEqual(changed_indexes, [])
+
+        QCoreApplication.processEvents()
+
+        note_widget = NoteWidget()
+        note_widget.load_note(self.note)
+        assert note_widget.sizeHint().height() != estimated_hint.height()
+
+        self.assertEqual(changed_indexes, [self.item.index()])
+        self.assertEqual(self.note_delegate.sizeHint(self.option, self.item.index()).height(), note_widget.sizeHint().height())
+
+    def test_prerender_should_fill_pixmap_cache_in_the_background(self):
+        self.note.id = 1
+
+        self.note_delegate.prerender([(self.item.index(), 200)])
+        self.note_delegate.background_renderer().wait_for_done()
+        QCoreApplication.processEvents()
+
+        pixmap_cache = self.note_delegate.pixmap_cache()
+        size         = QSize(200, self.note_delegate.sizeHint(self.option, self.item.index()).height())
+        self.assertEqual(len(pixmap_cache), 1)
+        self.assertTrue(pixmap_cache.contains(self.note, size, 'full'))
+
+        expected_image = self.note_delegate._render_note(self.note, size).toImage().convertToFormat(QImage.Format_RGB32)
+        self.assertEqual(pixmap_cache.get(self.note, size, 'full').toImage().convertToFormat(QImage.Format_RGB32), expected_image)
+
+    def test_prerender_should_skip_notes_already_in_cache(self):
+        self.note.id = 1
+        size = QSize(200, self.note_delegate.sizeHint(self.option, self.item.index()).height())
+        self.note_delegate.pixmap_cache().put(self.note, size, QPixmap(size), 'full')
+
+        rendered_notes = []
+        self.note_delegate.background_renderer().rendered.connect(lambda note, size, variant, image: rendered_notes.append(note))
+
+        self.note_delegate.prerender([(self.item.index(), 200)])
+        self.note_delegate.background_renderer().wait_for_done()
+        QCoreApplication.processEvents()
+
+        self.assertEqual(rendered_notes, [])
+
+    def test_prerender_should_use_style_only_in_gui_thread(self):
+        self.note.id = 1
+        gui_thread   = QThread.currentThread()
+        threads      = []
+
+        original_style = QApplication.style
+        def style():
+            threads.append(QThread.currentThread())
+            return original_style()
+
+        with patch.object(QApplication, 'style', side_effect = style):
+            self.note_delegate.prerender([(self.item.index(), 200)])
+            self.note_delegate.background_renderer().wait_for_done()
+            QCoreApplication.processEvents()
+
+        self.assertEqual(len(self.note_delegate.pixmap_cache()), 1)
+        self.assertNotEqual(threads, [])
+        self.assertTrue(all(thread is gui_thread for thread in threads))
+
+    def test_prerender_should_drop_images_rendered_before_compact_mode_was_toggled(self):
+        self.note.id = 1
+
+        self.note_delegate.prerender([(self.item.index(), 200)])
+        self.note_delegate.set_compact(True)
+        self.note_delegate.background_renderer().wait_for_done()
+        QCoreApplication.processEvents()
+
+        self.assertEqual(len(self.note_delegate.pixmap_cache()), 0)
+
+    def test_prerender_should_drop_images_of_notes_measured_again(self):
+        self.note.id = 1
+        size = QSize(200, self.note_delegate.row_height(self.note))
+
+        self.note_delegate._heights[1] = (self.note.modified_at, size.height() + 10, True)
+        self.note_delegate._rendered_handler(self.note, size, 'full', QImage(size, QImage.Format_ARGB32_Premultiplied))
+
+        self.assertEqual(len(self.note_delegate.pixmap_cache()), 0)
+
+    def test_sizeHint_should_measure_only_preview_of_collapsed_notes(self):
+        self.note.id   = 1
+        self.note.body = '\n'.join("line {}".format(i) for i in range(1000))
+        self.note_delegate.set_preview_long_notes(True)
+
+        collapsed_hint = self.note_delegate.sizeHint(self.option, self.item.index())
+        self.assertTrue(self.note_delegate.is_collapsed(self.note))
+
+        self.note_delegate.set_note_expanded(1, True)
+        expanded_hint = self.note_delegate.sizeHint(self.option, self.item.index())
+
+        self.assertFalse(self.note_delegate.is_collapsed(self.note))
+        self.assertLess(collapsed_hint.height() * 10, expanded_hint.height())
+
+    def test_clicking_expand_line_should_expand_collapsed_note(self):
+        self.note.id   = 1
+        self.note.body = '\n'.join("line {}".format(i) for i in range(1000))
+        self.note_delegate.set_preview_long_notes(True)
+        changed_indexes = []
+        self.note_delegate.sizeHintChanged.connect(changed_indexes.append)
+
+        self.option.rect = QRect(0, 0, 400, self.note_delegate.sizeHint(self.option, self.item.index()).height())
+        (body_rect, tag_rect, timestamp_rect) = self.note_delegate._renderer.layout(self.note_delegate.displayed_note(self.note), self.option.rect)
+
+        def click(position):
+            event = QMouseEvent(QEvent.MouseButtonRelease, QPointF(position), Qt.LeftButton, Qt.LeftButton, Qt.NoModifier)
+            return self.note_delegate.editorEvent(event, self.model, self.option, self.item.index())
+
+        click(body_rect.topLeft())
+        self.assertTrue(self.note_delegate.is_collapsed(self.note))
+
+        self.assertTrue(click(body_rect.bottomLeft()))
+        self.assertFalse(self.note_delegate.is_collapsed(self.note))
+        self.assertEqual(changed_indexes, [self.item.index()])
+
+    def test_clicking_collapse_line_should_collapse_expanded_note(self):
+        self.note.id   = 1
+        self.note.body = '\n'.join("line {}".format(i) for i in range(1000))
+        self.note_delegate.set_preview_long_notes(True)
+        self.note_delegate.set_note_expanded(1, True)
+        changed_indexes = []
+        self.note_delegate.sizeHintChanged.connect(changed_indexes.append)
+
+        displayed_note = self.note_delegate.displayed_note(self.note)
+        self.assertTrue(self.note_delegate.is_expanded(self.note))
+        self.assertEqual(displayed_note.body, self.note.body + '\n' + BodyPreviewCache.COLLAPSE_LINE)
+
+        self.option.rect = QRect(0, 0, 400, self.note_delegate.sizeHint(self.option, self.item.index()).height())
+        (body_rect, tag_rect, timestamp_rect) = self.note_delegate._renderer.layout(displayed_note, self.option.rect)
+
+        event = QMouseEvent(QEvent.MouseButtonRelease, QPointF(body_rect.bottomLeft()), Qt.LeftButton, Qt.LeftButton, Qt.NoModifier)
+        self.assertTrue(self.note_delegate.editorEvent(event, self.model, self.option, self.item.index()))
+
+        self.assertTrue(self.note_delegate.is_collapsed(self.note))
+        self.assertFalse(self.note_delegate.is_expanded(self.note))
+        self.assertEqual(changed_indexes, [self.item.index()])
+
+    def test_expanding_note_should_discard_its_preview_being_rendered(self):
+        self.note.id   = 1
+        self.note.body = '\n'.join("line {}".format(i) for i in range(1000))
+        self.note_delegate.set_preview_long_notes(True)
+
+        self.note_delegate.prerender([(self.item.index(), 200)])
+        self.note_delegate.set_note_expanded(1, True)
+        self.note_delegate.background_renderer().wait_for_done()
+        QCoreApplication.processEvents()
+
+        self.assertEqual(len(self.note_delegate.pixmap_cache()), 0)
+
+    def test_paint_should_not_reuse_pixmaps_of_preview_for_expanded_note(self):
+        self.note.id   = 1
+        self.note.body = '\n'.join("line {}".format(i) for i in range(1000))
+        self.note_delegate.set_preview_long_notes(True)
+        size = QSize(200, 50)
+
+        self.note_delegate.pixmap_cache().put(self.note, size, QPixmap(size), self.note_delegate.display_variant(1))
+        self.note_delegate._expanded_ids.add(1)
+
+        self.assertFalse(self.note_delegate.pixmap_cache().contains(self.note, size, self.note_delegate.display_variant(1)))
+
+    def test_profiler_should_receive_timings_and_cache_hits_of_paint_and_sizeHint(self):
+        self.note.id = 1
+        profiler = RenderProfiler()
+        self.note_delegate.set_profiler(profiler)
+
+        self.note_delegate.sizeHint(self.option, self.item.index())
+        self.note_delegate.sizeHint(self.option, self.item.index())
+        self.paint_note()
+        self.paint_note()
+        profiler.finish_frame()
+
+        frame = profiler.last_frame()
+        self.assertEqual((frame.size_hint_count, frame.height_hits, frame.height_misses), (2, 1, 1))
+        self.assertEqual((frame.paint_count,     frame.pixmap_hits, frame.pixmap_misses), (2, 1, 1))
+        self.assertGreater(frame.paint_time, 0)
+        self.assertEqual([note_id for (seconds, note_id, summary) in profiler.slowest_notes()], [1])
+
+    def test_sizeHint_should_return_the_same_height_for_all_notes_in_compact_mode(self):
+        self.note_delegate.set_compact(True)
+        long_note = Note(body = "line 1\nline 2\nline 3", tags = ["C"], created_at = datetime(2013, 1, 1), modified_at = datetime(2013, 1, 2), id = 2)
+        long_item = QStandardItem()
+        set_item_note(long_item, long_note)
+        self.model.invisibleRootItem().appendRow(long_item)
+
+        with patch.object(NoteWidget, 'load_note') as load_note_mock:
+            self.assertEqual(self.note_delegate.sizeHint(self.option, long_item.index()).height(), self.note_delegate.compact_height())
+            self.assertEqual(self.note_delegate.sizeHint(self.option, self.item.index()).height(), self.note_delegate.compact_height())
+            self.assertEqual(load_note_mock.call_count, 0)
+
+        self.assertEqual(self.note_delegate.compact_height(), self.note_delegate._renderer.height(self.note, 400))
+
+    def test_displayed_note_should_contain_only_first_line_of_body_in_compact_mode(self):
+        note = Note(body = "line 1\nline 2", tags = ["C"], created_at = datetime(2013, 1, 1), id = 2)
+        self.note_delegate.set_compact(True)
+
+        self.assertEqual(self.note_delegate.displayed_note(note).body, "line 1")
+        self.assertEqual(self.note_delegate.displayed_note(note).tags, ["C"])
+        self.assertIs(self.note_delegate.displayed_note(self.note), self.note)
+
+        self.note_delegate.set_compact(False)
+        self.assertIs(self.note_delegate.displayed_note(note), note)
+
+    def test_measure_should_do_nothing_in_compact_mode(self):
+        self.note.id = 1
+        self.note_delegate.set_estimate_heights(True)
+        self.note_delegate.set_compact(True)
+
+        self.note_delegate.measure([self.item.index()])
+
+        self.assertFalse(self.note_delegate.is_measured(self.note))
+
+    def test_createEditor_should_reuse_editors_released_by_destroyEditor(self):
+        editor = self.note_delegate.createEditor(self.parent, self.option, self.item.index())
+        editor.destroyed.connect(self.parent.update)
+        self.note_delegate.destroyEditor(editor, self.item.index())
+
+        self.assertEqual(self.note_delegate.pooled_editor_count(), 1)
+        self.assertIsNot(editor.parent(), self.parent)
+        self.assertFalse(editor.isWindow())
+        self.assertFalse(editor.isVisible())
+        self.assertEqual(editor.receivers(editor.destroyed), 0)
+
+        other_parent = QWidget()
+        reused_editor = self.note_delegate.createEditor(other_parent, self.option, self.item.index())
+
+        self.assertIs(reused_editor, editor)
+        self.assertIs(reused_editor.parent(), other_parent)
+        self.assertEqual(self.note_delegate.pooled_editor_count(), 0)
+
+    def test_destroyEditor_should_not_keep_more_than_max_pooled_editors(self):
+        editors = [self.note_delegate.createEditor(self.parent, self.option, self.item.index()) for i in range(NoteDelegate.MAX_POOLED_EDITORS + 2)]
+
+        for editor in editors:
+            self.note_delegate.destroyEditor(editor, self.item.index())
+
+        self.assertEqual(self.note_delegate.pooled_editor_count(), NoteDelegate.MAX_POOLED_EDITORS)
+
+    def test_reused_editor_should_show_data_of_the_new_note(self):
+        editor = self.note_delegate.createEditor(self.parent, self.option, self.item.index())
+        editor.load_note(Note(body = "old", tags = ["old"], created_at = datetime(2013, 1, 1), id = 5))
+        self.note_delegate.destroyEditor(editor, self.item.index())
+
+        editor = self.note_delegate.createEditor(self.parent, self.option, self.item.index())
+        self.note_delegate.setEditorData(editor, self.item.index())
+
+        self.assertEqual(editor.dump_note().to_dict(), self.note.to_dict())
@@ -0,0 +1,57 @@
+import unittest
+import io
+
+import simplejson
+
+from ..note_file_reader import NoteFileReader
+from ..index_store      import content_key
+
+class NoteFileReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.raw_notes = [
+            {"body": "first", "tags": ["a", "b"], "id": 1, "parent_id": None, "prev_sibling_id": None},
+            {"body": "zażółć ] [ \" } {", "tags": [], "id": 2, "parent_id": 1, "prev_sibling_id": None},
+            {"body": "x" * 100, "tags": ["c"], "id": 30, "parent_id": None, "prev_sibling_id": 1}
+        ]
+
+    def read_all(self, content, chunk_size):
+        reader = NoteFileReader(io.StringIO(content), chunk_size = chunk_size)
+        return (list(reader.raw_notes()), reader)
+
+    def test_raw_notes_should_decode_the_same_data_as_loads_regardless_of_chunk_size(self):
+        for content in [simplejson.dumps(self.raw_notes), simplejson.dumps(self.raw_notes, indent = 4), " \n[ ]\n", "[]", "[1, 23456, true, null]"]:
+            for chunk_size in [1, 2, 3, 7, 64, 100000]:
+                (raw_notes, reader) = self.read_all(content, chunk_size)
+
+                self.assertEqual(raw_notes, simplejson.loads(content), (content, chunk_size))
+
+    def test_content_key_should_match_key_of_whole_content(self):
+        content = simplejson.dumps(self.raw_notes, indent = 4)
+
+        (raw_notes, reader) = self.read_all(content, 5)
+
+        self.assertEqual(reader.content_key(), content_key(content))
+        self.assertEqual(reader.bytes_read(),  len(content.encode('utf-8')))
+
+    def test_raw_notes_should_yield_notes_before_reading_whole_file(self):
+        content   = simplejson.dumps(self.raw_notes)
+        json_file = io.StringIO(content)
+        reader    = NoteFileReader(json_file, chunk_size = 10)
+
+        raw_notes = reader.raw_notes()
+        self.assertEqual(next(raw_notes), self.raw_notes[0])
+        self.assertLess(json_file.tell(), len(content))
+
+    def test_progress_callback_should_be_called_after_each_chunk(self):
+        content  = simplejson.dumps(self.raw_notes)
+        progress = []
+        reader   = NoteFileReader(io.StringIO(content), progress.append, chunk_size = 100)
+
+        list(reader.raw_notes())
+
+        self.assertEqual(progress, list(range(100, len(content.encode('utf-8')), 100)) + [len(content.encode('utf-8'))])
+
+    def test_raw_notes_should_raise_on_invalid_content(self):
+        for content in ['', '{}', '[1, 2', '[1 2]', '[1,]', '[{"a": }]', '[] []', '[{"a": 1}']:
+            with self.assertRaises(simplejson.JSONDecodeError, msg = content):
+                self.read_all(content, 3)
@@ -0,0 +1,68 @@
+import unittest
+import os
+import stat
+import tempfile
+
+from ..note_file_writer import write_atomically, UMASK
+
+class WriteAtomicallyTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_name           = os.path.join(self.temporary_directory.name, 'notes.json')
+
+    def tearDown(self):
+        self.temporary_directory.cleanup()
+
+    def read(self, file_name):
+        with open(file_name) as note_file:
+            return note_file.read()
+
+    def mode(self, file_name):
+        return stat.S_IMODE(os.stat(file_name).st_mode)
+
+    def test_should_replace_content_of_the_file(self):
+        write_atomically(self.file_name, "old")
+        write_atomically(self.file_name, "new")
+
+        self.assertEqual(self.read(self.file_name), "new")
+        self.assertEqual(os.listdir(self.temporary_directory.name), ['notes.json'])
+
+    def test_should_write_bytes(self):
+        write_atomically(self.file_name, b'\x00\x01')
+
+        with open(self.file_name, 'rb') as note_file:
+            self.assertEqual(note_file.read(), b'\x00\x01')
+
+    def test_new_file_should_get_default_permissions(self):
+        write_atomically(self.file_name, "new")
+
+        self.assertEqual(self.mode(self.file_name), 0o666 & ~UMASK)
+
+    def test_should_preserve_permissions_of_replaced_file(self):
+        with open(self.file_name, 'w') as note_file:
+            note_file.write("old")
+        os.chmod(self.file_name, 0o640)
+
+        write_atomically(self.file_name, "new")
+
+        self.assertEqual(self.mode(self.file_name), 0o640)
+
+    def test_should_replace_target_of_symbolic_link(self):
+        link_name = os.path.join(self.temporary_directory.name, 'link.json')
+        with open(self.file_name, 'w') as note_file:
+            note_file.write("old")
+        os.symlink(self.file_name, link_name)
+
+        write_atomically(link_name, "new")
+
+        self.assertTrue(os.path.islink(link_name))
+        self.assertEqual(self.read(self.file_name), "new")
+
+    def test_should_remove_temporary_file_and_keep_original_if_writing_fails(self):
+        write_atomically(self.file_name, "old")
+
+        with self.assertRaises(TypeError):
+            write_atomically(self.file_name, 123)
+
+        self.assertEqual(self.read(self.file_name), "old")
+        self.assertEqual(os.listdir(self.temporary_directory.name), ['notes.json'])
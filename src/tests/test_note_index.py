@@ -0,0 +1,211 @@
+import unittest
+from datetime import datetime
+
+from ..note       import Note
+from ..note_index import NoteIndex
+
+class NoteIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.note_index = NoteIndex()
+
+        self.notes = [
+            Note(
+                body       = "Project plan",
+                tags       = ["work"],
+                created_at = datetime.utcnow(),
+                id         = 1
+            ),
+            Note(
+                body       = "Shopping list: milk, bread",
+                tags       = ["home", "Work stuff"],
+                created_at = datetime.utcnow(),
+                id         = 2
+            ),
+            Note(
+                body       = "projection",
+                tags       = [],
+                created_at = datetime.utcnow(),
+                id         = 3
+            )
+        ]
+
+        for note in self.notes:
+            self.note_index.add_note(note)
+
+    def test_split_words_should_return_casefolded_words(self):
+        self.assertEqual(NoteIndex.split_words("Abc, def-GHI abc"), {'abc', 'def', 'ghi'})
+
+    def test_add_note_should_index_words_from_body_and_tags(self):
+        self.assertEqual(self.note_index.word_ids('project'), {1})
+        self.assertEqual(self.note_index.word_ids('MILK'),    {2})
+        self.assertEqual(self.note_index.word_ids('work'),    {1, 2})
+
+    def test_add_note_should_index_tags(self):
+        self.assertEqual(self.note_index.tag_ids('work'),       {1})
+        self.assertEqual(self.note_index.tag_ids('Work stuff'), {2})
+        self.assertEqual(set(self.note_index.tags()),           {'work', 'home', 'Work stuff'})
+
+    def test_add_note_should_ignore_notes_without_ids(self):
+        note = Note(body = "orphan", created_at = datetime.utcnow())
+
+        self.assertFalse(self.note_index.add_note(note))
+        self.assertFalse(self.note_index.contains(note))
+        self.assertEqual(self.note_index.word_ids('orphan'), set())
+
+    def test_remove_note_should_remove_note_from_all_postings(self):
+        self.note_index.remove_note(1)
+
+        self.assertEqual(len(self.note_index), 2)
+        self.assertEqual(self.note_index.word_ids('project'), set())
+        self.assertEqual(self.note_index.word_ids('work'),    {2})
+        self.assertEqual(self.note_index.tag_ids('work'),     set())
+        self.assertTrue('work' not in self.note_index.tags())
+
+    def test_update_note_should_replace_terms_of_the_old_version(self):
+        new_note = Note(body = "Holiday plan", tags = ["home"], created_at = datetime.utcnow(), id = 1)
+
+        self.note_index.update_note(new_note)
+
+        self.assertTrue(self.note_index.contains(new_note))
+        self.assertFalse(self.note_index.contains(self.notes[0]))
+        self.assertEqual(self.note_index.word_ids('project'), set())
+        self.assertEqual(self.note_index.word_ids('holiday'), {1})
+        self.assertEqual(self.note_index.tag_ids('home'),     {1, 2})
+
+    def test_revision_should_change_whenever_notes_are_added_or_removed(self):
+        revisions = [self.note_index.revision()]
+
+        self.note_index.remove_note(3)
+        revisions.append(self.note_index.revision())
+        self.note_index.add_note(self.notes[2])
+        revisions.append(self.note_index.revision())
+        self.note_index.clear()
+        revisions.append(self.note_index.revision())
+
+        self.assertEqual(len(set(revisions)), 4)
+
+        self.note_index.remove_note(3)
+        self.assertEqual(self.note_index.revision(), revisions[-1])
+
+    def test_next_id_should_return_id_greater_than_all_ids_ever_indexed(self):
+        self.note_index.remove_note(3)
+
+        self.assertEqual(self.note_index.next_id(), 4)
+
+    def test_candidate_ids_should_include_all_notes_containing_the_string(self):
+        self.assertEqual(self.note_index.candidate_ids('proj'),       {1, 3})
+        self.assertEqual(self.note_index.candidate_ids('ject'),       {1, 3})
+        self.assertEqual(self.note_index.candidate_ids('ORK'),        {1, 2})
+        self.assertEqual(self.note_index.candidate_ids('milk, bre'),  {2})
+        self.assertEqual(self.note_index.candidate_ids('t: milk, b'), {2})
+
+    def test_candidate_ids_should_use_words_for_queries_too_short_for_trigrams(self):
+        self.assertEqual(self.note_index.candidate_ids('PL'), {1})
+        self.assertEqual(self.note_index.candidate_ids(' p'), {1, 3})
+        self.assertEqual(self.note_index.candidate_ids('k '), {1, 2})
+        self.assertEqual(self.note_index.candidate_ids('j '), set())
+        self.assertEqual(self.note_index.candidate_ids('n'),  {1, 2, 3})
+
+    def test_candidate_ids_should_return_all_notes_if_short_query_contains_no_words(self):
+        self.assertEqual(self.note_index.candidate_ids(''),   {1, 2, 3})
+        self.assertEqual(self.note_index.candidate_ids(', '), {1, 2, 3})
+
+    def test_split_trigrams_should_return_casefolded_trigrams(self):
+        self.assertEqual(NoteIndex.split_trigrams("AbcD"), {'abc', 'bcd'})
+        self.assertEqual(NoteIndex.split_trigrams("ab"),   set())
+
+    def test_add_note_should_index_trigrams_of_body_and_each_tag_separately(self):
+        self.assertEqual(self.note_index.trigram_ids('OJE'), {1, 3})
+        self.assertEqual(self.note_index.trigram_ids('k s'), {2})
+        self.assertEqual(self.note_index.trigram_ids('kst'), set())
+        self.assertEqual(self.note_index.trigram_ids('mes'), set())
+
+    def test_remove_note_should_remove_note_trigrams(self):
+        self.note_index.remove_note(3)
+
+        self.assertEqual(self.note_index.trigram_ids('oje'), {1})
+        self.assertEqual(self.note_index.trigram_ids('ion'), set())
+
+    def test_candidate_ids_should_use_trigrams_for_mid_word_fragments(self):
+        self.assertEqual(self.note_index.candidate_ids('ROJECT'), {1, 3})
+        self.assertEqual(self.note_index.candidate_ids('ectio'),  {3})
+        self.assertEqual(self.note_index.candidate_ids('xyz'),    set())
+
+    def test_candidate_ids_should_not_match_trigrams_spanning_tags(self):
+        self.assertEqual(self.note_index.candidate_ids('homework'), set())
+
+    def test_casefolded_tag_ids_should_find_tags_regardless_of_case(self):
+        self.assertEqual(self.note_index.casefolded_tag_ids('work'),       {1})
+        self.assertEqual(self.note_index.casefolded_tag_ids('work stuff'), {2})
+        self.assertEqual(self.note_index.casefolded_tag_ids('stuff'),      set())
+
+    def test_date_range_ids_should_find_notes_with_timestamps_in_range(self):
+        note_index = NoteIndex()
+        for (i, day) in enumerate([5, 1, 3, 3]):
+            note_index.add_note(Note(created_at = datetime(2013, 1, day), modified_at = datetime(2013, 2, day), id = i))
+
+        self.assertEqual(note_index.date_range_ids('created_at',  datetime(2013, 1, 2), datetime(2013, 1, 5)), {2, 3})
+        self.assertEqual(note_index.date_range_ids('created_at',  datetime(2013, 1, 3), None),                 {0, 2, 3})
+        self.assertEqual(note_index.date_range_ids('modified_at', None,                 datetime(2013, 2, 3)), {1})
+        self.assertEqual(note_index.date_range_count('created_at', None, None), 4)
+
+        note_index.remove_note(2)
+
+        self.assertEqual(note_index.date_range_ids('created_at', datetime(2013, 1, 2), datetime(2013, 1, 5)), {3})
+
+    def test_candidate_count_estimate_should_be_an_upper_bound_on_the_number_of_candidates(self):
+        for query in ['p', 'proj', 'ject', 'ion', 'xyz', 'milk, bre']:
+            self.assertGreaterEqual(self.note_index.candidate_count_estimate(query), len(self.note_index.candidate_ids(query)))
+
+    def test_words_with_prefix_should_return_matching_words_in_alphabetical_order(self):
+        self.assertEqual(self.note_index.words_with_prefix('pro'),    ['project', 'projection'])
+        self.assertEqual(self.note_index.words_with_prefix('pro', 1), ['project'])
+        self.assertEqual(self.note_index.words_with_prefix('xyz'),    [])
+
+    def test_words_with_prefix_should_reflect_added_and_removed_words(self):
+        self.assertEqual(self.note_index.words_with_prefix('pro'), ['project', 'projection'])
+
+        self.note_index.remove_note(3)
+        self.note_index.add_note(Note(body = "progress", created_at = datetime.utcnow(), id = 4))
+
+        self.assertEqual(self.note_index.words_with_prefix('pro'), ['progress', 'project'])
+        self.assertTrue(self.note_index.has_word('progress'))
+        self.assertFalse(self.note_index.has_word('projection'))
+
+    def test_load_postings_should_produce_the_same_index_as_adding_notes(self):
+        note_index = NoteIndex()
+        postings   = [{term: set(ids) for (term, ids) in term_ids.items()} for term_ids in self.note_index.postings()]
+        note_index.load_postings(self.notes, *postings)
+
+        self.assertEqual(len(note_index),                                       len(self.notes))
+        self.assertEqual(note_index.word_ids('work'),                           {1, 2})
+        self.assertEqual(note_index.candidate_ids('ject'),                      {1, 3})
+        self.assertEqual(note_index.date_range_count('created_at', None, None), 3)
+        self.assertEqual(note_index.next_id(),                                  4)
+
+        note_index.remove_note(1)
+
+        self.assertEqual(note_index.word_ids('work'), {2})
+
+    def test_reserve_id_should_prevent_next_id_from_returning_the_id(self):
+        self.note_index.reserve_id(10)
+
+        self.assertEqual(self.note_index.next_id(), 11)
+
+    def test_casefolded_tag_ids_should_be_updated_when_notes_are_removed(self):
+        self.note_index.add_note(Note(body = "", tags = ["WORK"], created_at = datetime.utcnow(), id = 4))
+        assert self.note_index.casefolded_tag_ids('work') == {1, 4}
+
+        self.note_index.remove_note(1)
+
+        self.assertEqual(self.note_index.casefolded_tag_ids('work'),   {4})
+        self.assertEqual(self.note_index.casefolded_tag_count('work'), 1)
+
+    def test_tag_counts_should_count_tags_regardless_of_case(self):
+        self.note_index.add_note(Note(body = "", tags = ["WORK", "home"], created_at = datetime.utcnow(), id = 4))
+
+        self.assertEqual(self.note_index.tag_counts(), {'WORK': 2, 'home': 2, 'Work stuff': 1})
+
+        self.note_index.remove_note(4)
+
+        self.assertEqual(self.note_index.tag_counts(), {'work': 1, 'home': 1, 'Work stuff': 1})
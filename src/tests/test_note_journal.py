@@ -0,0 +1,165 @@
+import unittest
+import os
+import tempfile
+from datetime      import datetime
+from unittest.mock import patch
+
+import simplejson
+
+from PyQt5.QtCore import QCoreApplication
+from PyQt5.QtGui  import QStandardItem
+
+from .dummy_application   import application
+from ..note               import Note
+from ..note_model_helpers import load_notes, dump_notes, set_item_note, item_to_note
+from ..model_helpers      import remove_items
+from ..note_journal       import NoteJournal, InvalidJournal, journal_path, read_journal, replay_journal
+
+class NoteJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_name           = os.path.join(self.temporary_directory.name, 'notes.json')
+
+        self.raw_notes = [
+            {'id': 1, 'body': "A", 'tags': ["x"], 'parent_id': None, 'prev_sibling_id': None},
+            {'id': 2, 'body': "B", 'tags': [],    'parent_id': None, 'prev_sibling_id': 1},
+            {'id': 3, 'body': "C", 'tags': ["z"], 'parent_id': 1,    'prev_sibling_id': None}
+        ]
+        for note_dict in self.raw_notes:
+            note_dict['created_at']  = Note.serialize_timestamp(datetime(2013, 1, note_dict['id']))
+            note_dict['modified_at'] = note_dict['created_at']
+
+        with open(self.file_name, 'w') as json_file:
+            json_file.write(simplejson.dumps(self.raw_notes))
+
+        self.model   = load_notes(self.raw_notes)
+        self.journal = NoteJournal(self.file_name, 'key')
+        self.journal.set_model(self.model)
+
+    def tearDown(self):
+        self.journal.close()
+        self.temporary_directory.cleanup()
+
+    def new_item(self, note_id, body):
+        item = QStandardItem()
+        set_item_note(item, Note(body = body, tags = [], created_at = datetime(2013, 2, note_id), id = note_id))
+        return item
+
+    def sorted_dump(self, model):
+        return sorted(dump_notes(model), key = lambda note_dict: note_dict['id'])
+
+    def make_changes(self):
+        # Add
+        self.model.item(0).appendRow(self.new_item(4, "D"))
+        self.model.insertRow(0, self.new_item(5, "E"))
+
+        # Add with children
+        parent_item = self.new_item(6, "F")
+        parent_item.appendRow(self.new_item(7, "G"))
+        self.model.appendRow(parent_item)
+
+        # Edit
+        set_item_note(self.model.item(2), Note(body = "B2", tags = ["new"], created_at = datetime(2013, 1, 2), modified_at = datetime(2013, 3, 1), id = 2))
+
+        # Move note 3 to the top level
+        moved_row = self.model.item(1).takeRow(0)
+        self.model.appendRow(moved_row)
+
+        # Remove note 1 along with note 4
+        remove_items(self.model, [self.model.item(1).index()])
+
+    def test_replay_journal_should_reproduce_changes_made_to_the_model(self):
+        self.make_changes()
+        self.journal.flush()
+
+        replayed_model = load_notes(self.raw_notes)
+        count          = replay_journal(replayed_model, self.file_name, 'key')
+
+        self.assertGreater(count, 0)
+        self.assertEqual(self.sorted_dump(replayed_model), self.sorted_dump(self.model))
+
+    def test_replay_journal_should_ignore_journal_of_a_different_version_of_the_file(self):
+        self.make_changes()
+        self.journal.flush()
+
+        replayed_model = load_notes(self.raw_notes)
+
+        self.assertEqual(replay_journal(replayed_model, self.file_name, 'other key'), 0)
+        self.assertEqual(self.sorted_dump(replayed_model), sorted(self.raw_notes, key = lambda note_dict: note_dict['id']))
+
+    def test_replay_journal_should_raise_invalid_journal_for_changes_of_unknown_notes(self):
+        self.journal.flush()
+        with open(journal_path(self.file_name), 'a') as journal_file:
+            journal_file.write(simplejson.dumps({'operation': 'remove', 'ids': [10]}) + '\n')
+
+        with self.assertRaises(InvalidJournal):
+            replay_journal(load_notes(self.raw_notes), self.file_name, 'key')
+
+    def test_replay_journal_should_raise_invalid_journal_for_unknown_operations(self):
+        self.journal.flush()
+        with open(journal_path(self.file_name), 'a') as journal_file:
+            journal_file.write(simplejson.dumps({'operation': 'rename', 'ids': [1]}) + '\n')
+
+        with self.assertRaises(InvalidJournal):
+            replay_journal(load_notes(self.raw_notes), self.file_name, 'key')
+
+    def test_read_journal_should_ignore_line_cut_off_at_the_end(self):
+        self.model.appendRow(self.new_item(4, "D"))
+        self.journal.flush()
+
+        with open(journal_path(self.file_name), 'a') as journal_file:
+            journal_file.write('{"operation": "add", "no')
+
+        self.assertEqual(len(read_journal(self.file_name, 'key')), 1)
+
+    def test_new_journal_should_keep_entries_of_the_same_version_and_drop_damaged_line(self):
+        self.model.appendRow(self.new_item(4, "D"))
+        self.journal.flush()
+        with open(journal_path(self.file_name), 'a') as journal_file:
+            journal_file.write('{"operation": "add", "no')
+
+        self.journal.close()
+        self.journal = NoteJournal(self.file_name, 'key')
+        self.journal.set_model(self.model)
+        self.model.appendRow(self.new_item(5, "E"))
+        self.journal.flush()
+
+        self.assertEqual([entry['note']['id'] for entry in read_journal(self.file_name, 'key')], [4, 5])
+
+    def test_changes_should_be_written_in_batches(self):
+        with patch.object(os, 'fsync', wraps = os.fsync) as fsync_mock:
+            self.model.appendRow(self.new_item(4, "D"))
+            self.model.appendRow(self.new_item(5, "E"))
+
+            self.assertEqual(read_journal(self.file_name, 'key'), [])
+
+            self.journal._flush_timer.setInterval(0)
+            self.model.appendRow(self.new_item(6, "F"))
+            QCoreApplication.processEvents()
+
+            self.assertEqual(fsync_mock.call_count, 1)
+
+        self.assertEqual(len(read_journal(self.file_name, 'key')), 3)
+
+    def test_needs_compaction_should_be_true_when_journal_is_bigger_than_the_file(self):
+        with patch.object(NoteJournal, 'MIN_COMPACTION_SIZE', 0):
+            self.assertFalse(self.journal.needs_compaction())
+
+            for note_id in range(4, 20):
+                self.model.appendRow(self.new_item(note_id, "X"))
+
+            self.assertTrue(self.journal.needs_compaction())
+
+    def test_restart_should_carry_over_changes_after_position(self):
+        self.model.appendRow(self.new_item(4, "D"))
+        self.model.appendRow(self.new_item(5, "E"))
+        self.assertEqual(self.journal.entry_count(), 2)
+
+        self.journal.restart('new key', 1)
+        self.model.appendRow(self.new_item(6, "F"))
+        self.journal.flush()
+
+        self.assertEqual(self.journal.key(), 'new key')
+        self.assertEqual(self.journal.entry_count(), 2)
+        self.assertEqual(read_journal(self.file_name, 'key'), [])
+        self.assertEqual([entry['note']['id'] for entry in read_journal(self.file_name, 'new key')], [5, 6])
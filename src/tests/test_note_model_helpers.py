@@ -236,6 +236,16 @@ class NoteModelHelpersTest(unittest.TestCase):
         note_id = lambda note_dict: note_dict['id']
         self.assertEqual(sorted(serialized_notes_after, key = note_id), sorted(serialized_notes_before, key = note_id))
 
+    def test_load_notes_should_accept_a_generator(self):
+        self.prepare_tree()
+        assign_note_ids(self.model)
+        serialized_notes_before = dump_notes(self.model)
+
+        new_model = load_notes(note_dict for note_dict in serialized_notes_before)
+
+        note_id = lambda note_dict: note_dict['id']
+        self.assertEqual(sorted(dump_notes(new_model), key = note_id), sorted(serialized_notes_before, key = note_id))
+
     def test_load_notes_should_raise_error_if_tree_contains_sibling_cycle(self):
         serialized_notes = [
             self.sample_note_dict(1, None, None),
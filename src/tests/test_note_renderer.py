@@ -0,0 +1,92 @@
+import unittest
+from datetime import datetime
+
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui     import QPixmap, QPainter, QRegion
+from PyQt5.QtCore    import QSize, QRect, QPoint
+
+from .dummy_application import application
+from ..note             import Note
+from ..note_widget      import NoteWidget
+from ..note_renderer    import NoteRenderer
+
+class NoteRendererTest(unittest.TestCase):
+    def setUp(self):
+        self.renderer = NoteRenderer()
+
+        self.notes = [
+            Note(body = "B",                                      tags = ["C", "D"],        created_at = datetime(2013, 1, 1)),
+            Note(body = "",                                       tags = [],                created_at = datetime(2013, 1, 1)),
+            Note(body = "line one\nline two\n\tindented",          tags = ["some tag"],      created_at = datetime(2013, 1, 1), modified_at = datetime(2013, 2, 3)),
+            Note(body = " ".join(["word", "longerword"] * 30),    tags = ["a", "b", "c"],   created_at = datetime(2013, 1, 1))
+        ]
+
+    def render_widget(self, note, size):
+        widget = NoteWidget()
+        widget.load_note(note)
+        widget.resize(size)
+
+        # NOTE: Without the event loop the layouts need to be told explicitly to update geometry of the labels
+        widget.layout().activate()
+        widget._tag_layout.activate()
+        assert widget.size() == size
+
+        pixmap = QPixmap(size)
+        widget.render(pixmap, QPoint(), QRegion(), QWidget.DrawChildren | QWidget.DrawWindowBackground)
+        return pixmap.toImage()
+
+    def render_note(self, note, size):
+        pixmap  = QPixmap(size)
+        painter = QPainter(pixmap)
+        self.renderer.paint(painter, note, QRect(QPoint(0, 0), size))
+        painter.end()
+
+        return pixmap.toImage()
+
+    def test_height_should_match_height_of_widget_laid_out_at_the_same_width(self):
+        for note in self.notes:
+            for width in [400, 600]:
+                widget = NoteWidget()
+                widget.load_note(note)
+
+                self.assertEqual(self.renderer.height(note, width), widget.heightForWidth(width) if widget.hasHeightForWidth() else widget.sizeHint().height())
+
+    def test_paint_should_produce_the_same_image_as_note_widget(self):
+        for note in self.notes:
+            for width in [400, 600]:
+                natural_height = self.renderer.height(note, width)
+
+                for height in [natural_height, natural_height + 41]:
+                    size = QSize(width, height)
+                    self.assertEqual(self.render_note(note, size), self.render_widget(note, size), (note.body, width, height))
+
+    def test_paint_should_cut_off_body_the_same_way_as_note_widget(self):
+        # NOTE: The widget refuses to shrink below the height of one line of the body
+        for width in [400, 600]:
+            size = QSize(width, self.renderer.height(self.notes[3], width) - 23)
+            self.assertEqual(self.render_note(self.notes[3], size), self.render_widget(self.notes[3], size))
+
+    def test_paint_should_not_paint_outside_of_the_rectangle(self):
+        size = QSize(300, self.renderer.height(self.notes[3], 300))
+
+        pixmap = QPixmap(size.width() + 20, size.height() + 20)
+        pixmap.fill()
+        painter = QPainter(pixmap)
+        self.renderer.paint(painter, self.notes[3], QRect(QPoint(10, 10), QSize(size.width(), size.height() // 2)))
+        painter.end()
+
+        image = pixmap.toImage()
+        self.assertEqual(image.pixel(5, 5),                         image.pixel(0, 0))
+        self.assertEqual(image.pixel(15, 10 + size.height() // 2 + 1), image.pixel(0, 0))
+        self.assertNotEqual(image.pixel(10, 10),                    image.pixel(0, 0))
+
+    def test_distribute_space_should_give_extra_space_evenly_to_widgets_that_can_use_it(self):
+        self.assertEqual(NoteRenderer.distribute_space(100, [20, 30]),  [50, 50])
+        self.assertEqual(NoteRenderer.distribute_space(97,  [17, 32]),  [49, 48])
+        self.assertEqual(NoteRenderer.distribute_space(220, [113, 32]), [113, 107])
+        self.assertEqual(NoteRenderer.distribute_space(49,  [17, 32]),  [17, 32])
+
+    def test_distribute_space_should_shrink_the_biggest_widgets_first(self):
+        self.assertEqual(NoteRenderer.distribute_space(120, [113, 32]), [88, 32])
+        self.assertEqual(NoteRenderer.distribute_space(30,  [17, 32]),  [15, 15])
+        self.assertEqual(NoteRenderer.distribute_space(0,   [17, 32]),  [0, 0])
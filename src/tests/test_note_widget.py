@@ -1,8 +1,10 @@
 import unittest
 import sys
-from datetime import datetime
+from unittest.mock import patch
+from datetime      import datetime, timedelta
 
 from .dummy_application import application
+from ..                 import utils
 from ..utils            import localtime_to_utc
 from ..note             import Note
 from ..note_widget      import NoteWidget
@@ -42,3 +44,28 @@ class TestNoteWidget(unittest.TestCase):
         timestamp = datetime(2000, 12, 31)
 
         self.assertEqual(NoteWidget.format_timestamp(localtime_to_utc(timestamp)), "2000-12-31 00:00")
+
+    def test_timestamp_text_should_format_each_version_of_a_note_only_once(self):
+        note = Note(body = "B", created_at = datetime(2001, 2, 3, 4, 5), modified_at = datetime(2001, 2, 4, 4, 5))
+        text = NoteWidget.timestamp_text(note)
+
+        with patch.object(NoteWidget, '_format_local_timestamp', wraps = NoteWidget._format_local_timestamp) as format_mock:
+            self.assertEqual(NoteWidget.timestamp_text(note), text)
+            self.assertEqual(format_mock.call_count, 0)
+
+            NoteWidget.timestamp_text(Note(body = "B", created_at = note.created_at, modified_at = datetime(2001, 2, 5, 4, 5)))
+            self.assertEqual(format_mock.call_count, 2)
+
+    def test_timestamp_text_should_follow_changes_of_local_time_zone_offset(self):
+        note = Note(body = "B", created_at = datetime(2001, 2, 3, 4, 5))
+
+        try:
+            with patch.object(utils, 'compute_localtime_utc_delta', return_value = timedelta(hours = 1)):
+                utils.refresh_localtime_utc_delta()
+                self.assertEqual(NoteWidget.timestamp_text(note), "2001-02-03 05:05")
+
+            with patch.object(utils, 'compute_localtime_utc_delta', return_value = timedelta(hours = 2)):
+                utils.refresh_localtime_utc_delta()
+                self.assertEqual(NoteWidget.timestamp_text(note), "2001-02-03 06:05")
+        finally:
+            utils.refresh_localtime_utc_delta()
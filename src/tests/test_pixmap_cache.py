@@ -0,0 +1,102 @@
+import unittest
+from datetime import datetime
+
+from PyQt5.QtGui  import QPixmap
+from PyQt5.QtCore import QSize
+
+from .dummy_application import application
+from ..note             import Note
+from ..pixmap_cache     import PixmapCache
+
+class PixmapCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.size   = QSize(10, 10)
+        self.pixmap = QPixmap(self.size)
+        self.cost   = PixmapCache.pixmap_cost(self.pixmap)
+
+        self.pixmap_cache = PixmapCache(self.cost * 2)
+
+        self.notes = [
+            Note(body = "A", created_at = datetime(2013, 1, 1), id = 1),
+            Note(body = "B", created_at = datetime(2013, 1, 1), id = 2),
+            Note(body = "C", created_at = datetime(2013, 1, 1), id = 3)
+        ]
+
+    def test_get_should_return_pixmap_stored_for_the_same_note_version_and_size(self):
+        self.pixmap_cache.put(self.notes[0], self.size, self.pixmap)
+
+        self.assertIs(self.pixmap_cache.get(self.notes[0], self.size), self.pixmap)
+        self.assertEqual(self.pixmap_cache.get(self.notes[0], QSize(10, 11)), None)
+        self.assertEqual(self.pixmap_cache.get(self.notes[1], self.size),     None)
+
+        modified_note = Note(body = "A2", created_at = datetime(2013, 1, 1), modified_at = datetime(2013, 1, 2), id = 1)
+        self.assertEqual(self.pixmap_cache.get(modified_note, self.size), None)
+
+        self.assertEqual((self.pixmap_cache.hits(), self.pixmap_cache.misses()), (1, 3))
+
+    def test_get_should_return_pixmap_stored_for_the_same_variant(self):
+        self.pixmap_cache.put(self.notes[0], self.size, self.pixmap, 'preview')
+
+        self.assertIs(self.pixmap_cache.get(self.notes[0], self.size, 'preview'), self.pixmap)
+        self.assertEqual(self.pixmap_cache.get(self.notes[0], self.size, 'full'), None)
+        self.assertEqual(self.pixmap_cache.get(self.notes[0], self.size),         None)
+
+    def test_put_should_evict_least_recently_used_pixmaps_when_budget_is_exceeded(self):
+        self.pixmap_cache.put(self.notes[0], self.size, QPixmap(self.size))
+        self.pixmap_cache.put(self.notes[1], self.size, QPixmap(self.size))
+        self.pixmap_cache.get(self.notes[0], self.size)
+
+        self.pixmap_cache.put(self.notes[2], self.size, QPixmap(self.size))
+
+        self.assertEqual(len(self.pixmap_cache), 2)
+        self.assertEqual(self.pixmap_cache.total_cost(), self.cost * 2)
+        self.assertNotEqual(self.pixmap_cache.get(self.notes[0], self.size), None)
+        self.assertEqual(self.pixmap_cache.get(self.notes[1], self.size),    None)
+        self.assertNotEqual(self.pixmap_cache.get(self.notes[2], self.size), None)
+
+    def test_put_should_ignore_notes_without_ids_and_pixmaps_over_budget(self):
+        self.pixmap_cache.put(Note(body = "", created_at = datetime.utcnow()), self.size, self.pixmap)
+        self.pixmap_cache.put(self.notes[0], QSize(100, 100), QPixmap(QSize(100, 100)))
+
+        self.assertEqual(len(self.pixmap_cache), 0)
+
+    def test_invalidate_should_remove_all_pixmaps_of_the_note(self):
+        self.pixmap_cache.put(self.notes[0], self.size,    self.pixmap)
+        self.pixmap_cache.put(self.notes[0], QSize(10, 5), QPixmap(QSize(10, 5)))
+        self.pixmap_cache.put(self.notes[1], QSize(10, 5), QPixmap(QSize(10, 5)))
+
+        self.pixmap_cache.invalidate(self.notes[0].id)
+
+        self.assertEqual(len(self.pixmap_cache), 1)
+        self.assertEqual(self.pixmap_cache.total_cost(), self.cost // 2)
+
+    def test_set_view_width_should_clear_the_cache_only_if_width_changes(self):
+        self.pixmap_cache.set_view_width(100)
+        self.pixmap_cache.put(self.notes[0], self.size, self.pixmap)
+
+        self.pixmap_cache.set_view_width(100)
+        self.assertEqual(len(self.pixmap_cache), 1)
+
+        self.pixmap_cache.set_view_width(200)
+        self.assertEqual(len(self.pixmap_cache), 0)
+
+    def test_set_budget_should_evict_pixmaps_over_the_new_budget(self):
+        self.pixmap_cache.put(self.notes[0], self.size, QPixmap(self.size))
+        self.pixmap_cache.put(self.notes[1], self.size, QPixmap(self.size))
+
+        self.pixmap_cache.set_budget(self.cost)
+
+        self.assertEqual(len(self.pixmap_cache), 1)
+        self.assertNotEqual(self.pixmap_cache.get(self.notes[1], self.size), None)
+
+    def test_contains_should_not_affect_statistics_or_eviction_order(self):
+        self.pixmap_cache.put(self.notes[0], self.size, QPixmap(self.size))
+        self.pixmap_cache.put(self.notes[1], self.size, QPixmap(self.size))
+
+        self.assertTrue(self.pixmap_cache.contains(self.notes[0], self.size))
+        self.assertFalse(self.pixmap_cache.contains(self.notes[2], self.size))
+
+        self.pixmap_cache.put(self.notes[2], self.size, QPixmap(self.size))
+
+        self.assertFalse(self.pixmap_cache.contains(self.notes[0], self.size))
+        self.assertEqual((self.pixmap_cache.hits(), self.pixmap_cache.misses()), (0, 0))
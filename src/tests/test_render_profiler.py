@@ -0,0 +1,79 @@
+import unittest
+import os
+from datetime      import datetime
+from unittest.mock import patch
+
+from PyQt5.QtCore import QCoreApplication
+
+from .dummy_application       import application
+from ..note                   import Note
+from ..render_profiler        import RenderProfiler
+from ..render_profiler_widget import RenderProfilerWidget
+
+class RenderProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.profiler = RenderProfiler()
+
+    def test_calls_before_returning_to_event_loop_should_be_counted_as_one_frame(self):
+        frames = []
+        self.profiler.frame_finished.connect(lambda: frames.append(self.profiler.last_frame()))
+
+        self.profiler.record_paint(0.002, True)
+        self.profiler.record_paint(0.003, False)
+        self.profiler.record_size_hint(0.001, False)
+        QCoreApplication.processEvents()
+        self.profiler.record_size_hint(0.004, True)
+        QCoreApplication.processEvents()
+
+        self.assertEqual(len(frames), 2)
+        self.assertEqual((frames[0].paint_count, frames[0].size_hint_count), (2, 1))
+        self.assertAlmostEqual(frames[0].paint_time, 0.005)
+        self.assertEqual(frames[0].pixmap_hit_rate(), 0.5)
+        self.assertEqual(frames[1].height_hit_rate(), 1.0)
+        self.assertEqual(frames[1].pixmap_hit_rate(), None)
+
+        self.assertEqual(self.profiler.frame_count(), 2)
+        self.assertEqual(self.profiler.totals().size_hint_count, 2)
+        self.assertEqual(self.profiler.totals().height_hit_rate(), 0.5)
+
+    def test_slowest_notes_should_list_longest_render_time_of_each_note(self):
+        self.profiler.record_render(Note(body = "a", tags = [], created_at = datetime(2013, 1, 1), id = 1), 0.001)
+        self.profiler.record_render(Note(body = "b", tags = [], created_at = datetime(2013, 1, 1), id = 2), 0.002)
+        self.profiler.record_render(Note(body = "a", tags = [], created_at = datetime(2013, 1, 1), id = 1), 0.005)
+        self.profiler.record_render(Note(body = "a", tags = [], created_at = datetime(2013, 1, 1), id = 1), 0.003)
+
+        self.assertEqual(self.profiler.slowest_notes(), [(0.005, 1, "a"), (0.002, 2, "b")])
+        self.assertEqual(self.profiler.slowest_notes(1), [(0.005, 1, "a")])
+
+    def test_reset_should_discard_all_statistics(self):
+        self.profiler.record_paint(0.002, True)
+        self.profiler.finish_frame()
+        self.profiler.record_render(Note(body = "a", tags = [], created_at = datetime(2013, 1, 1), id = 1), 0.001)
+
+        self.profiler.reset()
+
+        self.assertEqual(self.profiler.frame_count(), 0)
+        self.assertEqual(self.profiler.totals().paint_count, 0)
+        self.assertEqual(self.profiler.slowest_notes(), [])
+
+    def test_note_summary_should_shorten_first_line(self):
+        note = Note(body = "x" * 100 + "\nsecond line", tags = [], created_at = datetime(2013, 1, 1))
+
+        self.assertEqual(RenderProfiler.note_summary(note), "x" * RenderProfiler.SUMMARY_LENGTH + "...")
+
+    def test_enabled_by_environment_should_check_environment_variable(self):
+        with patch.dict(os.environ, {RenderProfiler.ENVIRONMENT_VARIABLE: '1'}):
+            self.assertTrue(RenderProfiler.enabled_by_environment())
+
+        with patch.dict(os.environ, {RenderProfiler.ENVIRONMENT_VARIABLE: '0'}):
+            self.assertFalse(RenderProfiler.enabled_by_environment())
+
+    def test_widget_should_show_report_of_its_profiler(self):
+        widget = RenderProfilerWidget()
+        widget.set_profiler(self.profiler)
+        self.profiler.record_render(Note(body = "slow note", tags = [], created_at = datetime(2013, 1, 1), id = 7), 0.5)
+
+        widget.refresh()
+
+        self.assertEqual(widget.report(), self.profiler.report())
+        self.assertIn("#7: slow note", widget.report())
@@ -0,0 +1,146 @@
+import unittest
+from datetime import datetime, timedelta
+
+from ..note              import Note
+from ..note_index        import NoteIndex
+from ..search_text_cache import SearchTextCache
+from ..search_query      import SearchQuery, TextClause, TagClause, DateClause
+from ..utils             import localtime_to_utc
+
+class SearchQueryTest(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2013, 8, 10, 12, 0, 0)
+
+        self.notes = [
+            Note(
+                body        = "Meeting notes",
+                tags        = ["work"],
+                created_at  = datetime(2012, 12, 31),
+                modified_at = datetime(2013, 8, 9),
+                id          = 1
+            ),
+            Note(
+                body        = "Shopping list",
+                tags        = ["Home"],
+                created_at  = datetime(2013, 2, 1),
+                modified_at = datetime(2013, 2, 1),
+                id          = 2
+            ),
+            Note(
+                body        = "Meeting with the landlord",
+                tags        = ["home", "important"],
+                created_at  = datetime(2013, 5, 5),
+                modified_at = datetime(2013, 6, 1),
+                id          = 3
+            )
+        ]
+
+        self.note_index = NoteIndex()
+        for note in self.notes:
+            self.note_index.add_note(note)
+
+    def find(self, text):
+        return SearchQuery.parse(text, self.now).find_matching_ids(self.note_index, SearchTextCache.search_text)
+
+    def test_parse_should_treat_text_without_special_syntax_as_fixed_string(self):
+        query = SearchQuery.parse("  meeting\twith ")
+
+        self.assertTrue(query.is_plain_text())
+        self.assertEqual(len(query.clauses), 1)
+        self.assertIsInstance(query.clauses[0], TextClause)
+        self.assertEqual(query.clauses[0].text, "  meeting\twith ")
+
+    def test_parse_should_recognize_tags_dates_and_phrases(self):
+        query = SearchQuery.parse('tag:work created:>2013-01-01 modified:<7d "exact phrase" other words', self.now)
+
+        self.assertFalse(query.is_plain_text())
+        self.assertEqual([type(clause) for clause in query.clauses], [TagClause, DateClause, DateClause, TextClause, TextClause, TextClause])
+        self.assertEqual(query.clauses[0].tag,  'work')
+        self.assertEqual(query.clauses[3].text, 'exact phrase')
+        self.assertEqual(query.clauses[4].text, 'other')
+        self.assertEqual(query.clauses[5].text, 'words')
+
+    def test_parse_should_accept_quoted_tags(self):
+        query = SearchQuery.parse('tag:"two words"')
+
+        self.assertEqual(query.clauses[0].tag, 'two words')
+
+    def test_parse_should_unescape_quotes_and_backslashes_in_quoted_values_and_phrases(self):
+        query = SearchQuery.parse(r'tag:"say \"hi\"" "back\\slash \"quote\" C:\path"')
+
+        self.assertEqual(query.clauses[0].tag,  'say "hi"')
+        self.assertEqual(query.clauses[1].text, 'back\\slash "quote" C:\\path')
+
+    def test_parse_should_ignore_incomplete_clauses(self):
+        self.assertEqual(len(SearchQuery.parse('tag:').clauses),            0)
+        self.assertEqual(len(SearchQuery.parse('created:>2013-0').clauses), 0)
+        self.assertEqual(len(SearchQuery.parse('""').clauses),              0)
+
+    def test_parse_should_treat_invalid_clauses_as_text(self):
+        query = SearchQuery.parse('created:yesterday tag:x')
+
+        self.assertEqual(query.clauses[1].text, 'created:yesterday')
+
+    def test_parse_should_interpret_absolute_dates_as_periods_in_local_time(self):
+        clause = SearchQuery.parse('created:2013-02').clauses[0]
+
+        self.assertEqual(clause.attribute,   'created_at')
+        self.assertEqual(clause.lower_bound, localtime_to_utc(datetime(2013, 2, 1)))
+        self.assertEqual(clause.upper_bound, localtime_to_utc(datetime(2013, 3, 1)))
+
+        clause = SearchQuery.parse('modified:>2013-12-31').clauses[0]
+
+        self.assertEqual(clause.attribute,   'modified_at')
+        self.assertEqual(clause.lower_bound, localtime_to_utc(datetime(2014, 1, 1)))
+        self.assertEqual(clause.upper_bound, None)
+
+    def test_parse_should_interpret_relative_dates_as_age(self):
+        newer = SearchQuery.parse('modified:<7d', self.now).clauses[0]
+        older = SearchQuery.parse('modified:>2w', self.now).clauses[0]
+
+        self.assertEqual((newer.lower_bound, newer.upper_bound), (self.now - timedelta(days = 7), None))
+        self.assertEqual((older.lower_bound, older.upper_bound), (None, self.now - timedelta(weeks = 2)))
+
+    def test_parse_should_interpret_relative_dates_without_inequality_as_single_unit_of_age(self):
+        for text in ['modified:=7d', 'modified:7d']:
+            clause = SearchQuery.parse(text, self.now).clauses[0]
+
+            self.assertEqual((clause.lower_bound, clause.upper_bound), (self.now - timedelta(days = 8), self.now - timedelta(days = 7)))
+
+    def test_find_matching_ids_should_match_all_clauses(self):
+        self.assertEqual(self.find('meeting'),                       {1, 3})
+        self.assertEqual(self.find('tag:HOME'),                      {2, 3})
+        self.assertEqual(self.find('tag:home meeting'),              {3})
+        self.assertEqual(self.find('"with the" tag:home'),           {3})
+        self.assertEqual(self.find('created:2013'),                  {2, 3})
+        self.assertEqual(self.find('created:>=2013-02-02'),          {3})
+        self.assertEqual(self.find('modified:<7d'),                  {1})
+        self.assertEqual(self.find('modified:>7d tag:home meeting'), {3})
+        self.assertEqual(self.find('tag:work tag:home'),             set())
+        self.assertEqual(self.find('tag:home landlord meeting'),     {3})
+        self.assertEqual(self.find('modified:1d'),                   {1})
+        self.assertEqual(self.find('modified:=2d'),                  set())
+
+    def test_find_matching_ids_should_return_all_notes_for_empty_structured_query(self):
+        self.assertEqual(self.find('tag:'), {1, 2, 3})
+
+    def test_is_empty_should_detect_queries_that_match_everything(self):
+        self.assertTrue(SearchQuery.parse('').is_empty())
+        self.assertTrue(SearchQuery.parse('tag:').is_empty())
+        self.assertFalse(SearchQuery.parse(' ').is_empty())
+        self.assertFalse(SearchQuery.parse('tag:home').is_empty())
+
+    def test_plan_should_put_most_selective_clauses_first(self):
+        query = SearchQuery.parse('meeting created:2013 tag:important', self.now)
+
+        plan = query.plan(self.note_index)
+
+        self.assertIsInstance(plan[0], TagClause)
+        self.assertIsInstance(plan[1], DateClause)
+        self.assertIsInstance(plan[2], TextClause)
+
+    def test_is_refinement_of_should_detect_extended_fixed_strings(self):
+        self.assertTrue(SearchQuery.parse('Meet').is_refinement_of(SearchQuery.parse('meet')))
+        self.assertTrue(SearchQuery.parse('meeting').is_refinement_of(SearchQuery.parse('eet')))
+        self.assertFalse(SearchQuery.parse('mee').is_refinement_of(SearchQuery.parse('meet')))
+        self.assertFalse(SearchQuery.parse('tag:home meet').is_refinement_of(SearchQuery.parse('meet')))
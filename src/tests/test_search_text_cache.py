@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime
+
+from ..note              import Note
+from ..search_text_cache import SearchTextCache
+
+class SearchTextCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.search_text_cache = SearchTextCache()
+
+        self.note = Note(
+            body       = "Body TEXT",
+            tags       = ["Tag A", "b"],
+            created_at = datetime.utcnow(),
+            id         = 1
+        )
+
+    def test_search_text_should_join_casefolded_tags_and_body(self):
+        self.assertEqual(SearchTextCache.search_text(self.note), "tag a\0b\0body text")
+
+    def test_text_matches_should_not_match_across_note_components(self):
+        search_text = SearchTextCache.search_text(self.note)
+
+        self.assertTrue(SearchTextCache.text_matches('body t', search_text))
+        self.assertTrue(SearchTextCache.text_matches('tag a',  search_text))
+        self.assertFalse(SearchTextCache.text_matches('b body', search_text))
+
+    def test_get_should_compute_text_only_once_per_note_version(self):
+        self.assertEqual(self.search_text_cache.get(self.note), "tag a\0b\0body text")
+        self.assertEqual(self.search_text_cache.get(self.note), "tag a\0b\0body text")
+
+        self.assertEqual(self.search_text_cache.hits(),     1)
+        self.assertEqual(self.search_text_cache.misses(),   1)
+        self.assertEqual(self.search_text_cache.hit_rate(), 0.5)
+
+    def test_get_should_detect_new_version_of_a_note(self):
+        self.search_text_cache.get(self.note)
+
+        new_note = Note(body = "New", created_at = datetime.utcnow(), id = 1)
+
+        self.assertEqual(self.search_text_cache.get(new_note), "new")
+        self.assertEqual(self.search_text_cache.misses(), 2)
+
+    def test_get_should_not_cache_notes_without_ids(self):
+        note = Note(body = "X", created_at = datetime.utcnow())
+
+        self.search_text_cache.get(note)
+        self.search_text_cache.get(note)
+
+        self.assertEqual(len(self.search_text_cache), 0)
+        self.assertEqual(self.search_text_cache.misses(), 2)
+
+    def test_invalidate_should_remove_cached_text(self):
+        self.search_text_cache.get(self.note)
+
+        self.search_text_cache.invalidate(self.note.id)
+        self.search_text_cache.get(self.note)
+
+        self.assertEqual(self.search_text_cache.misses(), 2)
+
+    def test_hit_rate_should_be_zero_if_cache_was_not_used(self):
+        self.assertEqual(self.search_text_cache.hit_rate(), 0.0)
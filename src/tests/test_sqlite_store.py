@@ -0,0 +1,148 @@
+import unittest
+import os
+import tempfile
+import sqlite3
+from datetime import datetime
+
+from unittest.mock import patch
+
+from PyQt5.QtGui import QStandardItem
+
+from .dummy_application   import application
+from ..note               import Note
+from ..note_model_helpers import load_notes, dump_notes, set_item_note
+from ..sqlite_store       import SqliteNoteStore, UnsupportedFormatVersion, is_store_file
+
+class SqliteNoteStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.temporary_directory = tempfile.TemporaryDirectory()
+        self.file_name           = os.path.join(self.temporary_directory.name, 'notes.sqlite')
+
+        self.raw_notes = [
+            {'id': 1, 'body': "A",       'tags': ["x", "y"], 'parent_id': None, 'prev_sibling_id': None},
+            {'id': 2, 'body': "B\nline", 'tags': [],         'parent_id': None, 'prev_sibling_id': 1},
+            {'id': 3, 'body': "C",       'tags': ["z"],      'parent_id': 1,    'prev_sibling_id': None},
+            {'id': 4, 'body': "D",       'tags': ["y", "x"], 'parent_id': 1,    'prev_sibling_id': 3}
+        ]
+        for note_dict in self.raw_notes:
+            note_dict['created_at']  = Note.serialize_timestamp(datetime(2013, 1, note_dict['id']))
+            note_dict['modified_at'] = Note.serialize_timestamp(datetime(2013, 2, note_dict['id'], 1, 2, 3, 456789))
+
+        self.model = load_notes(self.raw_notes)
+        self.store = SqliteNoteStore(self.file_name)
+
+    def tearDown(self):
+        self.store.close()
+        self.temporary_directory.cleanup()
+
+    def reopen(self):
+        self.store.close()
+        self.store = SqliteNoteStore(self.file_name)
+        return self.store.load()
+
+    def sorted_dump(self, model):
+        return sorted(dump_notes(model), key = lambda note_dict: note_dict['id'])
+
+    def saved_notes(self):
+        """ Reads the notes from the database without disturbing the store under test """
+
+        store = SqliteNoteStore(self.file_name)
+        try:
+            return {note_dict['id']: note_dict for note_dict in dump_notes(store.load())}
+        finally:
+            store.close()
+
+    def test_load_should_return_notes_written_by_save(self):
+        self.assertEqual(self.store.save(self.model), 4)
+
+        self.assertEqual(self.sorted_dump(self.reopen()), self.sorted_dump(self.model))
+        self.assertEqual(len(self.store), 4)
+
+    def test_save_should_write_only_notes_that_changed(self):
+        self.store.save(self.model)
+
+        item = self.model.item(0).child(1)
+        set_item_note(item, Note(body = "edited", tags = ["new"], created_at = datetime(2013, 1, 4), modified_at = datetime(2013, 3, 1), id = 4))
+
+        self.assertEqual(self.store.save(self.model), 1)
+        self.assertEqual(self.store.save(self.model), 0)
+        self.assertEqual(self.saved_notes()[4]['body'], "edited")
+        self.assertEqual(self.saved_notes()[4]['tags'], ["new"])
+
+    def test_save_should_write_moved_notes_and_delete_removed_ones(self):
+        self.store.save(self.model)
+
+        # Move note 4 to the top level and remove note 3
+        moved_items = self.model.item(0).takeRow(1)
+        self.model.appendRow(moved_items)
+        self.model.item(0).removeRow(0)
+
+        self.assertEqual(self.store.save(self.model), 1)
+        self.assertNotIn(3, self.saved_notes())
+        self.assertEqual(self.sorted_dump(self.reopen()), self.sorted_dump(self.model))
+
+    def test_save_after_load_should_not_write_anything(self):
+        self.store.save(self.model)
+        model = self.reopen()
+
+        self.assertEqual(self.store.save(model), 0)
+
+    def test_save_should_assign_ids_to_new_notes(self):
+        self.store.save(self.model)
+
+        item = QStandardItem()
+        set_item_note(item, Note(body = "new", tags = [], created_at = datetime(2013, 5, 5)))
+        self.model.appendRow(item)
+
+        self.assertEqual(self.store.save(self.model), 1)
+        self.assertEqual(self.saved_notes()[5]['body'], "new")
+
+    def test_create_should_replace_existing_database(self):
+        old_note = dict(self.raw_notes[0], id = 10, body = "old")
+        self.store.save(load_notes([old_note]))
+        self.store.close()
+
+        # A journal left behind by a crash would be rolled back into the new database
+        with open(self.file_name + '-journal', 'wb') as journal_file:
+            journal_file.write(b"garbage")
+
+        self.store = SqliteNoteStore.create(self.file_name, self.model)
+
+        self.assertEqual(sorted(self.saved_notes().values(), key = lambda note_dict: note_dict['id']), self.sorted_dump(self.model))
+        self.assertEqual(os.listdir(self.temporary_directory.name), ['notes.sqlite'])
+
+        # The store knows what has been written so the next save writes only what changed
+        self.assertEqual(self.store.save(self.model), 0)
+
+    def test_create_should_leave_existing_database_intact_if_writing_fails(self):
+        self.store.save(self.model)
+        self.store.close()
+
+        with patch.object(SqliteNoteStore, 'save', side_effect = sqlite3.OperationalError("disk I/O error")):
+            with self.assertRaises(sqlite3.OperationalError):
+                SqliteNoteStore.create(self.file_name, load_notes([]))
+
+        self.store = SqliteNoteStore(self.file_name)
+        self.assertEqual(self.sorted_dump(self.store.load()), self.sorted_dump(self.model))
+        self.assertEqual(os.listdir(self.temporary_directory.name), ['notes.sqlite'])
+
+    def test_constructor_should_reject_files_that_are_not_stores(self):
+        self.store.close()
+
+        with open(self.file_name, 'w') as store_file:
+            store_file.write("[]" * 100)
+        with self.assertRaises(sqlite3.DatabaseError):
+            SqliteNoteStore(self.file_name)
+
+        os.remove(self.file_name)
+        connection = sqlite3.connect(self.file_name)
+        connection.execute("PRAGMA user_version = 1000")
+        connection.close()
+        with self.assertRaises(UnsupportedFormatVersion):
+            SqliteNoteStore(self.file_name)
+
+        self.store = SqliteNoteStore(os.path.join(self.temporary_directory.name, 'other.sqlite'))
+
+    def test_is_store_file_should_check_suffix(self):
+        self.assertTrue(is_store_file('notes.sqlite'))
+        self.assertFalse(is_store_file('notes.json'))
@@ -0,0 +1,95 @@
+import unittest
+from datetime import datetime
+
+from PyQt5.QtCore import Qt, QCoreApplication
+
+from .dummy_application   import application
+from ..tag_facet_widget   import TagFacetWidget
+from ..tape_widget        import TapeWidget
+from ..note               import Note
+from ..note_model_helpers import set_item_note
+from ..search_query       import SearchQuery
+
+class TagFacetWidgetTest(unittest.TestCase):
+    def setUp(self):
+        self.tape_widget      = TapeWidget()
+        self.tag_facet_widget = TagFacetWidget()
+        self.tag_facet_widget.set_tape_widget(self.tape_widget)
+
+        self.notes = [
+            Note(body = "Project plan",  tags = ["work", "plans"], created_at = datetime.utcnow()),
+            Note(body = "Shopping list", tags = ["home"],          created_at = datetime.utcnow()),
+            Note(body = "Meeting",       tags = ["work"],          created_at = datetime.utcnow())
+        ]
+
+        for note in self.notes:
+            self.tape_widget.add_note(note)
+
+        QCoreApplication.processEvents()
+
+    def test_tag_counts_should_list_most_common_tags_first(self):
+        self.assertEqual(self.tag_facet_widget.tag_counts(), [('work', 2), ('home', 1), ('plans', 1)])
+
+    def test_tag_counts_should_be_updated_when_notes_are_edited_and_removed(self):
+        edited_note = Note(body = "Shopping list", tags = ["work", "new tag"], created_at = datetime.utcnow(), id = self.notes[1].id)
+        set_item_note(self.tape_widget.model().item(1), edited_note)
+        self.tape_widget.remove_notes([self.tape_widget.model().item(0).index()])
+        QCoreApplication.processEvents()
+
+        self.assertEqual(self.tag_facet_widget.tag_counts(), [('work', 2), ('new tag', 1)])
+
+    def test_tag_counts_should_not_scan_notes(self):
+        self.tape_widget.add_note(Note(body = "", tags = ["home"], created_at = datetime.utcnow()))
+
+        notes_calls = []
+        self.tape_widget.notes = lambda: notes_calls.append(True) or []
+        QCoreApplication.processEvents()
+
+        self.assertEqual(notes_calls, [])
+        self.assertEqual(self.tag_facet_widget.tag_counts()[:2], [('home', 2), ('work', 2)])
+
+    def test_tag_filter_should_quote_tags_containing_whitespace(self):
+        self.assertEqual(TagFacetWidget.tag_filter('work'),     'tag:work')
+        self.assertEqual(TagFacetWidget.tag_filter('new\ttag'), 'tag:"new\ttag"')
+
+    def test_tag_filter_should_produce_query_matching_tags_with_quotes_and_spaces(self):
+        for tag in ['say "hi"', '"quoted"', 'back\\ slash', 'odd"quote', 'end\\']:
+            clauses = SearchQuery.parse(TagFacetWidget.tag_filter(tag)).clauses
+
+            self.assertEqual(len(clauses), 1)
+            self.assertEqual(clauses[0].tag, tag)
+
+    def test_refresh_should_keep_selected_tag_and_scroll_position(self):
+        for i in range(50):
+            self.tape_widget.add_note(Note(body = "", tags = ["tag {:02}".format(i)], created_at = datetime.utcnow()))
+        QCoreApplication.processEvents()
+
+        tag_list = self.tag_facet_widget._tag_list
+        self.tag_facet_widget.resize(200, 100)
+        self.tag_facet_widget.show()
+        QCoreApplication.processEvents()
+
+        tag_list.setCurrentRow(20)
+        tag_list.verticalScrollBar().setValue(10)
+        assert tag_list.verticalScrollBar().value() == 10
+        selected_tag = tag_list.currentItem().data(Qt.UserRole)
+
+        # A new note makes the selected tag the most common one
+        self.tape_widget.add_note(Note(body = "", tags = [selected_tag, selected_tag + " more"], created_at = datetime.utcnow()))
+        self.tape_widget.add_note(Note(body = "", tags = [selected_tag], created_at = datetime.utcnow()))
+        QCoreApplication.processEvents()
+
+        self.assertEqual(tag_list.currentItem().data(Qt.UserRole), selected_tag)
+        self.assertEqual(tag_list.currentRow(), 0)
+        self.assertEqual(tag_list.verticalScrollBar().value(), 10)
+
+    def test_select_tag_should_filter_the_tape(self):
+        self.tag_facet_widget.select_tag('home')
+
+        self.assertEqual(self.tape_widget.get_filter(), 'tag:home')
+        self.assertEqual(self.tape_widget.proxy_model().rowCount(), 1)
+
+    def test_set_tape_widget_should_list_tags_of_the_new_tape(self):
+        self.tag_facet_widget.set_tape_widget(TapeWidget())
+
+        self.assertEqual(self.tag_facet_widget.tag_counts(), [])
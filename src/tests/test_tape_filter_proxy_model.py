@@ -1,13 +1,17 @@
 import unittest
 import sys
-from datetime import datetime
+from datetime      import datetime
+from unittest.mock import patch
 
 from PyQt5.QtGui  import QStandardItemModel, QStandardItem
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QModelIndex, QCoreApplication, QThreadPool
 
+from .dummy_application        import application
 from ..note                    import Note
 from ..tape_filter_proxy_model import TapeFilterProxyModel
-from ..note_model_helpers      import set_item_note
+from ..note_model_helpers      import set_item_note, assign_note_ids
+from ..note_index              import NoteIndex
+from ..index_store             import StoredIndex, timestamp_key
 
 class TapeFilterProxyModelTest(unittest.TestCase):
     def setUp(self):
@@ -120,3 +124,442 @@ class TapeFilterProxyModelTest(unittest.TestCase):
 
         mask = [False, True, False, False]
         self.assertEqual(self.select_note_dicts(self.tape_filter_proxy_model), self.select_note_dicts(self.source_model, mask))
+
+    def index_source_model(self):
+        assign_note_ids(self.source_model)
+        self.tape_filter_proxy_model.setSourceModel(self.source_model)
+
+        assert all(self.tape_filter_proxy_model.note_index().contains(note) for note in self.notes)
+
+    def test_setSourceModel_should_index_all_notes_that_have_ids(self):
+        self.index_source_model()
+
+        self.assertEqual(len(self.tape_filter_proxy_model.note_index()), len(self.notes))
+        self.assertEqual(self.tape_filter_proxy_model.note_index().tag_ids('VVV'), {self.notes[3].id})
+
+    def test_filtered_model_should_contain_only_matching_indexed_notes(self):
+        self.index_source_model()
+
+        self.tape_filter_proxy_model.setFilterFixedString('ppp r')
+
+        mask = [False, True, False, False]
+        self.assertEqual(self.select_note_dicts(self.tape_filter_proxy_model), self.select_note_dicts(self.source_model, mask))
+
+    def test_index_should_be_updated_when_notes_are_inserted(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.setFilterFixedString('new')
+        assert self.tape_filter_proxy_model.rowCount() == 0
+
+        new_note = Note(body = "A new note", tags = [], created_at = datetime.utcnow(), id = 100)
+        item     = QStandardItem()
+        set_item_note(item, new_note)
+        self.source_model.appendRow(item)
+
+        self.assertTrue(self.tape_filter_proxy_model.note_index().contains(new_note))
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 1)
+        self.assertEqual(self.tape_filter_proxy_model.data(self.tape_filter_proxy_model.index(0, 0)), new_note)
+
+    def test_index_should_be_updated_when_notes_are_removed(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.setFilterFixedString('b')
+        assert self.tape_filter_proxy_model.rowCount() == 2
+
+        self.source_model.takeRow(1)
+
+        self.assertFalse(self.tape_filter_proxy_model.note_index().contains(self.notes[1]))
+        self.assertEqual(len(self.tape_filter_proxy_model.note_index()), len(self.notes) - 1)
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 1)
+
+    def test_index_should_be_updated_when_notes_are_modified(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.setFilterFixedString('edited')
+        assert self.tape_filter_proxy_model.rowCount() == 0
+
+        new_note = Note(body = "Edited", tags = [], created_at = datetime.utcnow(), id = self.notes[2].id)
+        set_item_note(self.source_model.item(2), new_note)
+
+        self.assertTrue(self.tape_filter_proxy_model.note_index().contains(new_note))
+        self.assertEqual(self.tape_filter_proxy_model.note_index().tag_ids('3'), set())
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 1)
+        self.assertEqual(self.tape_filter_proxy_model.data(self.tape_filter_proxy_model.index(0, 0)), new_note)
+
+    def test_refined_filter_should_only_check_notes_matching_the_previous_filter(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.setFilterFixedString('ppp')
+        assert self.tape_filter_proxy_model.rowCount() == 2
+
+        search_text_cache = self.tape_filter_proxy_model.search_text_cache()
+        with patch.object(search_text_cache, 'get', wraps = search_text_cache.get) as get_mock:
+            self.tape_filter_proxy_model.setFilterFixedString('PPP R')
+
+        self.assertEqual(get_mock.call_count, 2)
+
+        mask = [False, True, False, False]
+        self.assertEqual(self.select_note_dicts(self.tape_filter_proxy_model), self.select_note_dicts(self.source_model, mask))
+
+    def test_filter_should_check_all_candidates_if_new_string_is_not_a_refinement(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.setFilterFixedString('PPP R')
+        assert self.tape_filter_proxy_model.rowCount() == 1
+
+        self.tape_filter_proxy_model.setFilterFixedString('PPP')
+
+        mask = [False, True, True, False]
+        self.assertEqual(self.select_note_dicts(self.tape_filter_proxy_model), self.select_note_dicts(self.source_model, mask))
+
+    def test_refined_filter_should_take_into_account_notes_modified_after_previous_filter(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.setFilterFixedString('x')
+        assert self.tape_filter_proxy_model.rowCount() == 1
+
+        new_note = Note(body = "xyz", tags = [], created_at = datetime.utcnow(), id = self.notes[3].id)
+        set_item_note(self.source_model.item(3), new_note)
+
+        self.tape_filter_proxy_model.setFilterFixedString('xy')
+
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 1)
+        self.assertEqual(self.tape_filter_proxy_model.data(self.tape_filter_proxy_model.index(0, 0)), new_note)
+
+    def test_filter_should_check_all_candidates_if_incremental_filtering_is_disabled(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.set_incremental_filtering(False)
+        self.tape_filter_proxy_model.setFilterFixedString('PPP R')
+        assert self.tape_filter_proxy_model.rowCount() == 1
+
+        note_index = self.tape_filter_proxy_model.note_index()
+        with patch.object(note_index, 'candidate_ids', wraps = note_index.candidate_ids) as candidate_ids_mock:
+            self.tape_filter_proxy_model.setFilterFixedString('PPP RR')
+
+        self.assertEqual(candidate_ids_mock.call_count, 1)
+
+    def test_apply_filter_result_should_use_ids_found_by_the_caller(self):
+        self.index_source_model()
+
+        (query, candidate_ids, note_index, search_text_cache, index_revision) = self.tape_filter_proxy_model.filter_snapshot('b')
+        assert query.candidate_ids(note_index) == {self.notes[1].id, self.notes[3].id}
+
+        applied = self.tape_filter_proxy_model.apply_filter_result('b', {self.notes[3].id}, index_revision, search_text_cache)
+
+        self.assertTrue(applied)
+        self.assertEqual(self.tape_filter_proxy_model.filterRegExp().pattern(), 'b')
+
+        mask = [False, False, False, True]
+        self.assertEqual(self.select_note_dicts(self.tape_filter_proxy_model), self.select_note_dicts(self.source_model, mask))
+
+    def test_apply_filter_result_should_reject_results_computed_before_the_index_changed(self):
+        self.index_source_model()
+
+        (query, candidate_ids, note_index, search_text_cache, index_revision) = self.tape_filter_proxy_model.filter_snapshot('b')
+        self.source_model.takeRow(0)
+
+        applied = self.tape_filter_proxy_model.apply_filter_result('b', {self.notes[3].id}, index_revision)
+
+        self.assertFalse(applied)
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), len(self.notes) - 1)
+
+    def test_filter_snapshot_should_not_compute_search_texts(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.search_text_cache().clear()
+
+        (query, candidate_ids, note_index, search_text_cache, index_revision) = self.tape_filter_proxy_model.filter_snapshot('b')
+
+        self.assertEqual(len(search_text_cache), 0)
+        self.assertEqual(len(self.tape_filter_proxy_model.search_text_cache()), 0)
+
+    def test_filter_snapshot_should_pass_on_ids_matching_current_query_if_new_one_refines_it(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.setFilterFixedString('pp')
+
+        (query, candidate_ids, note_index, search_text_cache, index_revision) = self.tape_filter_proxy_model.filter_snapshot('ppp')
+
+        self.assertEqual(candidate_ids, {self.notes[1].id, self.notes[2].id})
+
+    def test_apply_filter_result_should_keep_search_texts_computed_in_the_snapshot(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.search_text_cache().clear()
+
+        (query, candidate_ids, note_index, search_text_cache, index_revision) = self.tape_filter_proxy_model.filter_snapshot('b')
+        search_text_cache.get(self.notes[3])
+        self.tape_filter_proxy_model.apply_filter_result('b', {self.notes[3].id}, index_revision, search_text_cache)
+
+        self.assertEqual(len(self.tape_filter_proxy_model.search_text_cache()), 1)
+
+    def test_apply_filter_result_should_not_filter_rows_again_if_nothing_has_changed(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.setFilterFixedString('b')
+        (query, candidate_ids, note_index, search_text_cache, index_revision) = self.tape_filter_proxy_model.filter_snapshot('b')
+
+        with patch.object(TapeFilterProxyModel, 'filterAcceptsRow', autospec = True, side_effect = TapeFilterProxyModel.filterAcceptsRow) as filter_accepts_row_mock:
+            applied = self.tape_filter_proxy_model.apply_filter_result('b', {self.notes[1].id, self.notes[3].id}, index_revision)
+
+        self.assertTrue(applied)
+        self.assertEqual(filter_accepts_row_mock.call_count, 0)
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 2)
+
+    def test_search_text_cache_should_be_reused_between_queries(self):
+        self.index_source_model()
+        search_text_cache = self.tape_filter_proxy_model.search_text_cache()
+
+        self.tape_filter_proxy_model.setFilterFixedString('PPP')
+        search_text_cache.reset_statistics()
+        self.tape_filter_proxy_model.setFilterFixedString('RRR')
+
+        self.assertEqual(search_text_cache.misses(), 0)
+        self.assertEqual(search_text_cache.hit_rate(), 1.0)
+
+    def test_search_text_cache_should_be_invalidated_when_note_is_modified(self):
+        self.index_source_model()
+        search_text_cache = self.tape_filter_proxy_model.search_text_cache()
+
+        self.tape_filter_proxy_model.setFilterFixedString('PPP')
+        assert self.tape_filter_proxy_model.rowCount() == 2
+
+        new_note = Note(body = "Edited", tags = [], created_at = datetime.utcnow(), id = self.notes[2].id)
+        set_item_note(self.source_model.item(2), new_note)
+        search_text_cache.reset_statistics()
+
+        self.assertEqual(search_text_cache.get(new_note), 'edited')
+        self.assertEqual(search_text_cache.hits(), 1)
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 1)
+
+    def test_filtered_model_should_support_structured_queries(self):
+        self.index_source_model()
+
+        self.tape_filter_proxy_model.setFilterFixedString('tag:c "b"')
+
+        mask = [False, True, False, False]
+        self.assertEqual(self.select_note_dicts(self.tape_filter_proxy_model), self.select_note_dicts(self.source_model, mask))
+
+    def test_structured_query_should_be_applied_to_notes_inserted_later(self):
+        self.index_source_model()
+        self.tape_filter_proxy_model.setFilterFixedString('tag:new created:>2000')
+
+        new_note = Note(body = "", tags = ["NEW"], created_at = datetime.utcnow(), id = 100)
+        item     = QStandardItem()
+        set_item_note(item, new_note)
+        self.source_model.appendRow(item)
+
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 1)
+        self.assertEqual(self.tape_filter_proxy_model.data(self.tape_filter_proxy_model.index(0, 0)), new_note)
+
+    def prepare_nested_tape(self):
+        # 0
+        #   2
+        #     3
+        # 1
+        nested_model = QStandardItemModel()
+        items        = []
+        for note in self.notes:
+            item = QStandardItem()
+            set_item_note(item, note)
+            items.append(item)
+
+        nested_model.appendRow(items[0])
+        nested_model.appendRow(items[1])
+        items[0].appendRow(items[2])
+        items[2].appendRow(items[3])
+
+        assign_note_ids(nested_model)
+        self.tape_filter_proxy_model.setSourceModel(nested_model)
+        self.tape_filter_proxy_model.set_ancestor_preserving_filter(True)
+
+        return (nested_model, items)
+
+    def visible_notes(self):
+        model = self.tape_filter_proxy_model
+        notes = []
+
+        def collect(parent):
+            for row in range(model.rowCount(parent)):
+                index = model.index(row, 0, parent)
+                notes.append(model.data(index))
+                collect(index)
+
+        collect(QModelIndex())
+        return notes
+
+    def test_ancestor_preserving_filter_should_show_ancestors_of_matching_notes(self):
+        self.prepare_nested_tape()
+
+        self.tape_filter_proxy_model.setFilterFixedString('vvv')
+
+        self.assertEqual(self.visible_notes(), [self.notes[0], self.notes[2], self.notes[3]])
+
+    def test_ancestor_preserving_filter_should_hide_descendants_that_do_not_match(self):
+        self.prepare_nested_tape()
+
+        self.tape_filter_proxy_model.setFilterFixedString('h+x')
+
+        self.assertEqual(self.visible_notes(), [self.notes[0]])
+
+    def test_filter_should_hide_matching_descendants_of_rejected_notes_if_ancestor_preserving_filter_is_disabled(self):
+        self.prepare_nested_tape()
+        self.tape_filter_proxy_model.set_ancestor_preserving_filter(False)
+
+        self.tape_filter_proxy_model.setFilterFixedString('vvv')
+
+        self.assertEqual(self.visible_notes(), [])
+
+    def test_ancestor_preserving_filter_should_check_each_note_at_most_once(self):
+        self.prepare_nested_tape()
+
+        with patch.object(self.tape_filter_proxy_model, '_note_accepted', wraps = self.tape_filter_proxy_model._note_accepted) as note_accepted_mock:
+            self.tape_filter_proxy_model.setFilterFixedString('b')
+            self.visible_notes()
+            self.visible_notes()
+
+        # NOTE: Ancestors of matching notes are visible anyway so there's no need to check them
+        self.assertEqual(note_accepted_mock.call_count, 2)
+        self.assertEqual(self.visible_notes(), [self.notes[0], self.notes[2], self.notes[3], self.notes[1]])
+
+    def test_ancestor_preserving_filter_should_show_ancestors_of_matching_notes_inserted_later(self):
+        (nested_model, items) = self.prepare_nested_tape()
+        self.tape_filter_proxy_model.setFilterFixedString('new')
+        assert self.visible_notes() == []
+
+        new_note = Note(body = "A new note", tags = [], created_at = datetime.utcnow(), id = 100)
+        new_item = QStandardItem()
+        set_item_note(new_item, new_note)
+        items[3].appendRow(new_item)
+        QCoreApplication.processEvents()
+
+        self.assertEqual(self.visible_notes(), [self.notes[0], self.notes[2], self.notes[3], new_note])
+
+    def test_ancestor_preserving_filter_should_hide_ancestors_when_matching_notes_are_removed(self):
+        (nested_model, items) = self.prepare_nested_tape()
+        self.tape_filter_proxy_model.setFilterFixedString('vvv')
+        assert len(self.visible_notes()) == 3
+
+        items[2].takeRow(0)
+        QCoreApplication.processEvents()
+
+        self.assertEqual(self.visible_notes(), [])
+
+    def test_empty_filter_should_accept_notes_without_checking_them(self):
+        self.prepare_nested_tape()
+
+        with patch.object(TapeFilterProxyModel, 'note_matches') as note_matches_mock:
+            with patch.object(self.tape_filter_proxy_model, '_note_accepted') as note_accepted_mock:
+                self.tape_filter_proxy_model.setFilterFixedString('')
+                self.tape_filter_proxy_model.setFilterFixedString('')
+                visible_notes = self.visible_notes()
+
+        self.assertEqual(note_matches_mock.call_count,  0)
+        self.assertEqual(note_accepted_mock.call_count, 0)
+        self.assertEqual(len(visible_notes), len(self.notes))
+        self.assertEqual(self.tape_filter_proxy_model._visible_ids, None)
+
+    def test_ancestor_preserving_filter_should_update_only_ancestors_of_edited_note(self):
+        (nested_model, items) = self.prepare_nested_tape()
+        self.tape_filter_proxy_model.setFilterFixedString('new')
+        assert self.visible_notes() == []
+
+        edited_note = Note(body = "A new body", tags = [], created_at = self.notes[3].created_at, id = self.notes[3].id)
+        with patch.object(self.tape_filter_proxy_model, '_find_visible_notes') as find_visible_notes_mock:
+            set_item_note(items[3], edited_note)
+            QCoreApplication.processEvents()
+
+            self.assertEqual(self.visible_notes(), [self.notes[0], self.notes[2], edited_note])
+
+        self.assertEqual(find_visible_notes_mock.call_count, 0)
+
+    def stored_index_for(self, notes):
+        note_index = NoteIndex()
+        for note in notes:
+            note_index.add_note(note)
+
+        (word_ids, trigram_ids, tag_ids) = note_index.postings()
+        return StoredIndex(
+            'key',
+            {note.id: timestamp_key(note.modified_at) for note in notes},
+            dict(word_ids),
+            dict(trigram_ids),
+            dict(tag_ids)
+        )
+
+    def wait_for_background_indexing(self):
+        QThreadPool.globalInstance().waitForDone()
+        QCoreApplication.processEvents()
+
+    def test_setSourceModel_should_take_postings_of_up_to_date_notes_from_stored_index(self):
+        assign_note_ids(self.source_model)
+        self.tape_filter_proxy_model.set_stored_index(self.stored_index_for(self.notes))
+
+        with patch.object(NoteIndex, 'note_terms', wraps = NoteIndex.note_terms) as note_terms_mock:
+            self.tape_filter_proxy_model.setSourceModel(self.source_model)
+
+        self.assertEqual(note_terms_mock.call_count, 0)
+        self.assertFalse(self.tape_filter_proxy_model.is_indexing())
+        self.assertTrue(all(self.tape_filter_proxy_model.note_index().contains(note) for note in self.notes))
+        self.assertEqual(self.tape_filter_proxy_model.note_index().tag_ids('VVV'), {self.notes[3].id})
+
+    def test_setSourceModel_should_index_outdated_notes_in_background(self):
+        assign_note_ids(self.source_model)
+        stored_notes = [
+            self.notes[0],
+            Note(body = "Old version", tags = ["old"], created_at = datetime(2013, 1, 1), id = self.notes[1].id)
+        ]
+        self.tape_filter_proxy_model.set_stored_index(self.stored_index_for(stored_notes))
+
+        finished_signals = []
+        self.tape_filter_proxy_model.background_indexing_finished.connect(lambda: finished_signals.append(True))
+
+        self.tape_filter_proxy_model.setSourceModel(self.source_model)
+        self.tape_filter_proxy_model.setFilterFixedString('ppp')
+
+        # NOTE: Notes that are still being indexed must be matched one by one
+        self.assertEqual(self.tape_filter_proxy_model.note_index().candidate_ids('old'), set())
+        self.assertEqual(self.tape_filter_proxy_model.note_index().next_id(), max(note.id for note in self.notes) + 1)
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 2)
+
+        self.wait_for_background_indexing()
+
+        self.assertFalse(self.tape_filter_proxy_model.is_indexing())
+        self.assertEqual(finished_signals, [True])
+        self.assertTrue(all(self.tape_filter_proxy_model.note_index().contains(note) for note in self.notes))
+        self.assertEqual(self.tape_filter_proxy_model.note_index().tag_ids('old'), set())
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 2)
+
+    def test_setSourceModel_should_index_large_models_in_background(self):
+        assign_note_ids(self.source_model)
+        self.tape_filter_proxy_model.SYNCHRONOUS_INDEXING_LIMIT = len(self.notes) - 1
+
+        with patch.object(NoteIndex, 'note_terms', wraps = NoteIndex.note_terms) as note_terms_mock:
+            self.tape_filter_proxy_model.setSourceModel(self.source_model)
+            self.tape_filter_proxy_model.setFilterFixedString('ppp')
+
+            self.assertEqual(note_terms_mock.call_count, 0)
+
+        # NOTE: Notes that are still being indexed must be matched one by one
+        self.assertTrue(self.tape_filter_proxy_model.is_indexing())
+        self.assertEqual(len(self.tape_filter_proxy_model.note_index()), 0)
+        self.assertEqual(self.tape_filter_proxy_model.note_index().next_id(), max(note.id for note in self.notes) + 1)
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 2)
+
+        self.wait_for_background_indexing()
+
+        self.assertFalse(self.tape_filter_proxy_model.is_indexing())
+        self.assertTrue(all(self.tape_filter_proxy_model.note_index().contains(note) for note in self.notes))
+        self.assertEqual(self.tape_filter_proxy_model.rowCount(), 2)
+
+    def test_setSourceModel_should_index_small_models_right_away(self):
+        assign_note_ids(self.source_model)
+        self.tape_filter_proxy_model.SYNCHRONOUS_INDEXING_LIMIT = len(self.notes)
+
+        self.tape_filter_proxy_model.setSourceModel(self.source_model)
+
+        self.assertFalse(self.tape_filter_proxy_model.is_indexing())
+        self.assertTrue(all(self.tape_filter_proxy_model.note_index().contains(note) for note in self.notes))
+
+    def test_background_indexing_should_not_index_notes_removed_in_the_meantime(self):
+        assign_note_ids(self.source_model)
+        self.tape_filter_proxy_model.set_stored_index(self.stored_index_for(self.notes[:3]))
+        self.tape_filter_proxy_model.setSourceModel(self.source_model)
+        assert self.tape_filter_proxy_model.is_indexing()
+
+        self.source_model.takeRow(3)
+        self.wait_for_background_indexing()
+
+        self.assertFalse(self.tape_filter_proxy_model.is_indexing())
+        self.assertFalse(self.tape_filter_proxy_model.note_index().contains(self.notes[3]))
+        self.assertEqual(len(self.tape_filter_proxy_model.note_index()), 3)
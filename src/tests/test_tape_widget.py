@@ -2,7 +2,7 @@ import unittest
 import sys
 from datetime import datetime, timedelta
 
-from PyQt5.QtCore    import Qt, QRegExp, QAbstractItemModel, QItemSelection, QItemSelectionModel, QAbstractProxyModel
+from PyQt5.QtCore    import Qt, QRegExp, QAbstractItemModel, QItemSelection, QItemSelectionModel, QAbstractProxyModel, QCoreApplication
 from PyQt5.QtGui     import QStandardItemModel, QStandardItem
 
 from .dummy_application        import application
@@ -114,6 +114,14 @@ class TapeWidgetTest(unittest.TestCase):
         self.assertTrue(note.created_at > datetime.utcnow() - timedelta(0, 10))
         self.assertEqual(note.created_at, note.modified_at)
 
+    def test_add_note_should_assign_id_to_note_without_one(self):
+        self.tape_widget.add_note(self.notes[0])
+        self.tape_widget.add_note(self.notes[1])
+
+        self.assertNotEqual(self.notes[0].id, None)
+        self.assertNotEqual(self.notes[1].id, None)
+        self.assertNotEqual(self.notes[0].id, self.notes[1].id)
+
     def test_add_note_should_add_existing_note(self):
         assert len(list(self.tape_widget.notes())) == 0
 
@@ -213,6 +221,54 @@ class TapeWidgetTest(unittest.TestCase):
         self.assertEqual(self.tape_widget.selected_proxy_indexes()[0].row(), 0)
         self.assertEqual(self.tape_widget.selected_proxy_indexes()[0].parent(), parent_proxy_index)
 
+    def test_set_filter_should_hide_matching_notes_with_parents_that_do_not_match_by_default(self):
+        self.tape_widget.add_note(self.notes[0])
+        self.tape_widget.add_note(self.notes[3], self.tape_widget.model().item(0).index())
+
+        self.tape_widget.set_filter("VVV")
+
+        self.assertFalse(self.tape_widget.show_ancestors_of_matches())
+        self.assertEqual(self.tape_widget.proxy_model().rowCount(), 0)
+
+    def test_set_filter_should_keep_ancestors_of_matching_notes_visible_if_enabled(self):
+        self.tape_widget.add_note(self.notes[0])
+        self.tape_widget.add_note(self.notes[3], self.tape_widget.model().item(0).index())
+
+        self.tape_widget.set_filter("VVV")
+        self.tape_widget.set_show_ancestors_of_matches(True)
+
+        proxy_model = self.tape_widget.proxy_model()
+        self.assertEqual(proxy_model.rowCount(), 1)
+        self.assertEqual(proxy_model.data(proxy_model.index(0, 0)), self.notes[0])
+        self.assertEqual(proxy_model.data(proxy_model.index(0, 0, proxy_model.index(0, 0))), self.notes[3])
+
+    def test_focus_note_should_select_the_note_with_specified_id(self):
+        self.prepare_tape()
+
+        self.tape_widget.set_filter("PPP")
+        assert self.tape_widget.proxy_model().rowCount() == 2
+
+        self.assertTrue(self.tape_widget.focus_note(self.notes[2].id))
+
+        self.assertEqual(self.tape_widget.get_filter(), "PPP")
+        self.assertEqual(self.tape_widget.selected_indexes(), [self.tape_widget.model().item(2).index()])
+
+    def test_focus_note_should_clear_the_filter_if_the_note_does_not_match_it(self):
+        self.prepare_tape()
+
+        self.tape_widget.set_filter("PPP")
+
+        self.assertTrue(self.tape_widget.focus_note(self.notes[0].id))
+
+        self.assertEqual(self.tape_widget.get_filter(), '')
+        self.assertEqual(self.tape_widget.selected_indexes(), [self.tape_widget.model().item(0).index()])
+
+    def test_focus_note_should_return_false_if_there_is_no_such_note(self):
+        self.prepare_tape()
+
+        self.assertFalse(self.tape_widget.focus_note(12345))
+        self.assertEqual(self.tape_widget.selected_indexes(), [])
+
     def test_remove_notes_should_remove_multiple_notes_from_the_tape(self):
         self.prepare_tape(range(4))
 
@@ -406,6 +462,54 @@ class TapeWidgetTest(unittest.TestCase):
         self.assertTrue(self.notes[1].id not in note_ids)
         self.assertTrue(self.notes[2].id not in note_ids)
 
+    def test_focus_note_should_select_nested_note_and_clear_the_filter(self):
+        self.tape_widget.add_note(self.notes[0])
+        self.tape_widget.add_note(self.notes[3], self.tape_widget.model().item(0).index())
+        self.tape_widget.set_filter("H+X")
+
+        self.assertTrue(self.tape_widget.focus_note(self.notes[3].id))
+
+        self.assertEqual(self.tape_widget.get_filter(), '')
+        self.assertEqual(self.tape_widget.selected_indexes(), [self.tape_widget.model().item(0).child(0).index()])
+
+    def test_focus_note_should_follow_notes_that_are_moved_replaced_or_removed(self):
+        self.prepare_tape()
+        model = self.tape_widget.model()
+
+        # Move the first note under the last one
+        moved_items = model.takeRow(0)
+        model.item(2).appendRow(moved_items)
+
+        self.assertTrue(self.tape_widget.focus_note(self.notes[0].id))
+        self.assertEqual(self.tape_widget.selected_indexes(), [model.item(2).child(0).index()])
+
+        edited_note = Note(body = "edited", tags = [], created_at = datetime.utcnow(), id = self.notes[1].id)
+        set_item_note(model.item(0), edited_note)
+
+        self.assertTrue(self.tape_widget.focus_note(edited_note.id))
+        self.assertEqual(self.tape_widget.selected_indexes(), [model.item(0).index()])
+
+        self.tape_widget.remove_notes([model.item(1).index()])
+
+        self.assertFalse(self.tape_widget.focus_note(self.notes[2].id))
+        self.assertFalse(self.tape_widget.focus_note(12345))
+
+    def test_focus_note_should_find_notes_from_model_set_later(self):
+        self.prepare_tape([0])
+
+        new_model = QStandardItemModel()
+        item      = QStandardItem()
+        set_item_note(item, self.notes[1])
+        new_model.appendRow(item)
+        self.tape_widget.set_model(new_model)
+
+        self.assertTrue(self.tape_widget.focus_note(self.notes[1].id))
+        self.assertEqual(self.tape_widget.selected_indexes(), [new_model.item(0).index()])
+
+        self.tape_widget.clear()
+
+        self.assertFalse(self.tape_widget.focus_note(self.notes[1].id))
+
     def test_new_sibling_handler_should_add_top_level_note_if_nothing_selected(self):
         assert len(self.notes) >= 2
         self.prepare_tape()
@@ -518,3 +622,77 @@ class TapeWidgetTest(unittest.TestCase):
         self.assertEqual(len(list(self.tape_widget.notes())), len(self.notes))
         self.assertEqual(len(self.tape_widget.selected_proxy_indexes()), 2)
         self.assertEqual(self.tape_widget.get_filter(), '')
+
+    def test_measure_visible_notes_should_measure_only_notes_near_the_viewport(self):
+        for i in range(100):
+            self.tape_widget.add_note(Note(body = "N{}".format(i), tags = [], created_at = datetime.utcnow()))
+
+        self.tape_widget.resize(400, 300)
+        self.tape_widget.show()
+        QCoreApplication.processEvents()
+
+        self.tape_widget.measure_visible_notes()
+
+        note_delegate = self.tape_widget._view.itemDelegate()
+        measured      = [note_delegate.is_measured(note) for note in self.tape_widget.notes()]
+
+        self.assertTrue(measured[0])
+        self.assertFalse(measured[-1])
+
+    def test_set_compact_should_give_all_rows_the_same_height(self):
+        self.tape_widget.add_note(Note(body = "one line",               tags = [], created_at = datetime.utcnow()))
+        self.tape_widget.add_note(Note(body = "two\nlines",             tags = [], created_at = datetime.utcnow()))
+        self.tape_widget.add_note(Note(body = "three\nlines\nof text",  tags = [], created_at = datetime.utcnow()))
+
+        self.tape_widget.resize(400, 300)
+        self.tape_widget.show()
+        self.tape_widget.set_compact(True)
+        QCoreApplication.processEvents()
+
+        proxy_model   = self.tape_widget.proxy_model()
+        note_delegate = self.tape_widget._view.itemDelegate()
+        heights       = [self.tape_widget._view.visualRect(proxy_model.index(row, 0)).height() for row in range(3)]
+
+        self.assertTrue(self.tape_widget.compact())
+        self.assertTrue(self.tape_widget._view.uniformRowHeights())
+        self.assertEqual(heights, [note_delegate.compact_height()] * 3)
+
+        self.tape_widget.set_compact(False)
+        QCoreApplication.processEvents()
+
+        self.assertFalse(self.tape_widget._view.uniformRowHeights())
+        self.assertGreater(self.tape_widget._view.visualRect(proxy_model.index(2, 0)).height(), note_delegate.compact_height())
+
+    def test_view_should_reuse_editor_when_editing_another_note(self):
+        self.tape_widget.add_note(Note(body = "A", tags = [], created_at = datetime.utcnow()))
+        self.tape_widget.add_note(Note(body = "B", tags = [], created_at = datetime.utcnow()))
+        proxy_model = self.tape_widget.proxy_model()
+        view        = self.tape_widget._view
+
+        view.openPersistentEditor(proxy_model.index(0, 0))
+        first_editor = view.indexWidget(proxy_model.index(0, 0))
+        view.closePersistentEditor(proxy_model.index(0, 0))
+
+        view.openPersistentEditor(proxy_model.index(1, 0))
+        second_editor = view.indexWidget(proxy_model.index(1, 0))
+
+        self.assertIs(second_editor, first_editor)
+        self.assertEqual(second_editor.dump_note().body, "B")
+
+    def test_view_should_not_accumulate_connections_to_reused_editor(self):
+        self.tape_widget.add_note(Note(body = "A", tags = [], created_at = datetime.utcnow()))
+        proxy_model = self.tape_widget.proxy_model()
+        view        = self.tape_widget._view
+
+        view.openPersistentEditor(proxy_model.index(0, 0))
+        editor            = view.indexWidget(proxy_model.index(0, 0))
+        initial_receivers = editor.receivers(editor.destroyed)
+
+        for i in range(3):
+            view.closePersistentEditor(proxy_model.index(0, 0))
+            self.assertFalse(editor.isWindow())
+
+            view.openPersistentEditor(proxy_model.index(0, 0))
+            self.assertIs(view.indexWidget(proxy_model.index(0, 0)), editor)
+
+        self.assertEqual(editor.receivers(editor.destroyed), initial_receivers)
@@ -0,0 +1,43 @@
+import unittest
+from unittest.mock import patch
+from datetime      import datetime, timedelta
+
+from .. import utils
+
+class UtilsTest(unittest.TestCase):
+    def setUp(self):
+        utils.refresh_localtime_utc_delta()
+
+    def tearDown(self):
+        utils.refresh_localtime_utc_delta()
+
+    def test_localtime_utc_delta_should_not_recompute_the_offset_before_refresh_interval_passes(self):
+        with patch.object(utils, 'compute_localtime_utc_delta', return_value = timedelta(hours = 2)) as compute_mock:
+            with patch.object(utils.time, 'monotonic', return_value = 1000.0):
+                self.assertEqual(utils.localtime_utc_delta(), timedelta(hours = 2))
+                self.assertEqual(utils.localtime_utc_delta(), timedelta(hours = 2))
+
+            self.assertEqual(compute_mock.call_count, 1)
+
+            compute_mock.return_value = timedelta(hours = 1)
+            with patch.object(utils.time, 'monotonic', return_value = 1000.0 + utils.LOCALTIME_UTC_DELTA_REFRESH_INTERVAL - 1):
+                self.assertEqual(utils.localtime_utc_delta(), timedelta(hours = 2))
+
+            with patch.object(utils.time, 'monotonic', return_value = 1000.0 + utils.LOCALTIME_UTC_DELTA_REFRESH_INTERVAL):
+                self.assertEqual(utils.localtime_utc_delta(), timedelta(hours = 1))
+
+            self.assertEqual(compute_mock.call_count, 2)
+
+    def test_refresh_localtime_utc_delta_should_force_recomputation(self):
+        with patch.object(utils, 'compute_localtime_utc_delta', return_value = timedelta(hours = 2)) as compute_mock:
+            utils.localtime_utc_delta()
+            utils.refresh_localtime_utc_delta()
+            compute_mock.return_value = timedelta(hours = -5)
+
+            self.assertEqual(utils.localtime_utc_delta(), timedelta(hours = -5))
+            self.assertEqual(compute_mock.call_count, 2)
+
+    def test_utc_to_localtime_and_localtime_to_utc_should_be_inverse(self):
+        timestamp = datetime(2013, 7, 31, 12, 24, 15)
+
+        self.assertEqual(utils.localtime_to_utc(utils.utc_to_localtime(timestamp)), timestamp)
@@ -1,10 +1,37 @@
+import time
 from datetime import datetime, timedelta
 
-def localtime_utc_delta():
+# How long (in seconds) localtime_utc_delta() keeps returning the same value before checking the clock again.
+# The offset changes only when DST starts or ends or the time zone is changed so it's safe to reuse it for a while.
+LOCALTIME_UTC_DELTA_REFRESH_INTERVAL = 60
+
+_localtime_utc_delta_cache = None
+
+def compute_localtime_utc_delta():
     # NOTE: This will only work if the total execution time of now() and utcnow() is shorter than 60 seconds
     minutes_between_utc_and_localtime = round((datetime.now() - datetime.utcnow()).total_seconds() / 60.0)
     return timedelta(0, minutes_between_utc_and_localtime * 60)
 
+def localtime_utc_delta():
+    """ Returns the current offset of local time from UTC. The value is cached and recomputed at most
+        once per LOCALTIME_UTC_DELTA_REFRESH_INTERVAL so that it's cheap enough to call while painting. """
+
+    global _localtime_utc_delta_cache
+
+    # NOTE: The monotonic clock is read without a system call on most platforms and is not affected by
+    # changes to the system time.
+    now = time.monotonic()
+    if _localtime_utc_delta_cache == None or now >= _localtime_utc_delta_cache[0]:
+        _localtime_utc_delta_cache = (now + LOCALTIME_UTC_DELTA_REFRESH_INTERVAL, compute_localtime_utc_delta())
+
+    return _localtime_utc_delta_cache[1]
+
+def refresh_localtime_utc_delta():
+    """ Forgets the cached offset so that the next call to localtime_utc_delta() recomputes it """
+
+    global _localtime_utc_delta_cache
+    _localtime_utc_delta_cache = None
+
 def utc_to_localtime(timestamp):
     return timestamp + localtime_utc_delta()
 